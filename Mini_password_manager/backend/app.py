@@ -5,8 +5,14 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 from datetime import datetime, timedelta
 from functools import wraps
-from cryptography.fernet import Fernet
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 import os
+import threading
+
+# The re-encryption engine is shared with the desktop app. backend is a
+# package, so Flask puts the project root on the path to import it
+from utils.reencrypt import Reencryptor
 
 app = Flask(__name__)
 CORS(app)
@@ -18,6 +24,14 @@ app.config['SECRET_KEY'] = os.urandom(24)
 
 db = SQLAlchemy(app)
 
+# Checkpoints of interrupted encryption key rotations, one per user
+ROTATION_DIR = os.path.join(app.instance_path, 'key-rotations')
+# Rotations run off the request threads, one at a time: each one already
+# keeps every CPU busy with its process pool
+rotation_executor = ThreadPoolExecutor(max_workers=1)
+rotations = {}  # user id -> future of the running or last rotation
+rotations_lock = threading.Lock()
+
 # Database Models
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -50,6 +64,57 @@ def token_required(f):
         return f(current_user, *args, **kwargs)
     return decorated
 
+def rotate_encryption_key(user):
+    """Re-encrypt all of user's passwords under a new encryption_key
+    
+    The work runs on a process pool and is checkpointed, calling this again
+    after a crash resumes with the same new key. Tokens and key are swapped
+    in one transaction at the end.
+    """
+    os.makedirs(ROTATION_DIR, exist_ok=True)
+    checkpoint = os.path.join(ROTATION_DIR, f"user-{user.id}.checkpoint")
+    # The checkpoint only holds the new key encrypted under the current
+    # one, a checkpoint left behind by a finished swap no longer opens
+    current = Fernet(user.encryption_key.encode())
+    meta = Reencryptor.pending_meta(checkpoint)
+    try:
+        new_key = current.decrypt(meta['wrapped_key'].encode()).decode()
+    except (TypeError, KeyError, AttributeError, InvalidToken):
+        new_key = Fernet.generate_key().decode()
+        meta = {'wrapped_key': current.encrypt(new_key.encode()).decode()}
+    
+    snapshot = {p.id: p.encrypted_password
+                for p in Password.query.filter_by(user_id=user.id).all()}
+    db.session.commit()  # don't sit in a transaction while the pool runs
+    
+    engine = Reencryptor([user.encryption_key.encode()], new_key.encode(),
+                         checkpoint_file=checkpoint, meta=meta)
+    tokens = engine.run(snapshot.items())
+    
+    user = User.query.filter_by(id=user.id).populate_existing().with_for_update().one()
+    rows = Password.query.filter_by(user_id=user.id) \
+        .populate_existing().with_for_update().all()
+    fernet = MultiFernet([Fernet(new_key.encode()),
+                          Fernet(user.encryption_key.encode())])
+    for p in rows:
+        if snapshot.get(p.id) == p.encrypted_password:
+            p.encrypted_password = tokens[p.id]
+        else:
+            # Added or edited while the pool ran, few enough to do here
+            p.encrypted_password = fernet.rotate(p.encrypted_password.encode()).decode()
+    user.encryption_key = new_key
+    db.session.commit()
+    engine.discard_checkpoint()
+    return engine.stats()
+
+def run_rotation(user_id):
+    # Rotation thread, with an app context of its own
+    with app.app_context():
+        try:
+            return rotate_encryption_key(User.query.get(user_id))
+        finally:
+            db.session.remove()
+
 # Routes
 @app.route('/api/register', methods=['POST'])
 def register():
@@ -143,6 +208,38 @@ def manage_password(current_user, id):
     db.session.commit()
     return jsonify({'message': 'Password updated'})
 
+@app.route('/api/rotate-key', methods=['GET', 'POST'])
+@token_required
+def rotate_key(current_user):
+    """POST starts a rotation in the background, GET reports on it"""
+    with rotations_lock:
+        future = rotations.get(current_user.id)
+        if request.method == 'POST':
+            if future is not None and not future.done():
+                return jsonify({'message': 'Key rotation already running'}), 409
+            rotations[current_user.id] = rotation_executor.submit(
+                run_rotation, current_user.id)
+            return jsonify({'message': 'Key rotation started'}), 202
+    
+    if future is None:
+        return jsonify({'message': 'No key rotation started'}), 404
+    if not future.done():
+        return jsonify({'state': 'running'})
+    error = future.exception()
+    if error is not None:
+        # Checkpointed, starting it again resumes where it failed
+        return jsonify({'state': 'failed', 'message': str(error)}), 500
+    return jsonify({'state': 'done', **future.result()})
+
+@app.cli.command('rotate-keys')
+def rotate_keys_command():
+    """Rotate every user's encryption key"""
+    for user in User.query.all():
+        stats = rotate_encryption_key(user)
+        print(f"{user.username}: {stats['entries']} passwords, "
+              f"{stats['entries_per_sec']:.0f}/s")
+
+# Run from the project root: python -m backend.app
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
@@ -1,4 +1,4 @@
-from app import app, db, User, Password
+from backend.app import app, db, User, Password
 from werkzeug.security import generate_password_hash
 from cryptography.fernet import Fernet
 import random
@@ -0,0 +1,97 @@
+"""Incremental backup cost against a full JSON dump per backup.
+
+Each round edits a few entries, then backs the vault up twice: the old
+way, dumping every entry to a fresh JSON file, and as a snapshot of the
+deduplicated BackupStore, which only writes the chunks that changed.
+Restore of the last snapshot is checked against the vault. Finally the
+vault is written as a compressed archive with each codec, verified and
+restored from it.
+
+Run from the Mini_password_manager directory:
+
+    python benchmarks/bench_backup.py --size 100000 --rounds 5 --edits 10
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+
+from storage.archive import read_archive, verify_archive, write_archive
+from storage.backup import BackupStore
+
+
+def full_dump(passwords, path):
+    start = time.perf_counter()
+    with open(path, 'w') as f:
+        json.dump({account: dict(data) for account, data in passwords.items()}, f)
+    return time.perf_counter() - start, os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--edits', type=int, default=10,
+                        help="entries changed between two backups")
+    args = parser.parse_args()
+
+    fernet = Fernet(Fernet.generate_key())
+    # Real tokens, random bytes are what limits compression
+    passwords = {f"site-{i}": {'username': f"user{i}",
+                               'password': fernet.encrypt(f"password-{i}".encode()).decode()}
+                 for i in range(args.size)}
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        backups = BackupStore(os.path.join(directory, "backups"))
+        print(f"{'round':>5} {'dump ms':>9} {'dump KB':>9} {'snapshot ms':>12} "
+              f"{'new chunks':>11} {'written KB':>11}")
+        for round_number in range(args.rounds):
+            if round_number:
+                for account in rng.sample(list(passwords), args.edits):
+                    passwords[account] = {'username': "edited",
+                                          'password': fernet.encrypt(b"new").decode()}
+            dump_seconds, dump_size = full_dump(
+                passwords, os.path.join(directory, f"dump-{round_number}.json"))
+            stats = backups.snapshot(passwords)['stats']
+            print(f"{round_number:>5} {dump_seconds * 1000:>9.0f} {dump_size / 1024:>9.0f} "
+                  f"{stats['seconds'] * 1000:>12.0f} "
+                  f"{stats['new_chunks']:>5} of {stats['chunks']:<4} "
+                  f"{stats['bytes_written'] / 1024:>9.0f}")
+
+        last = backups.snapshots()[-1]['id']
+        start = time.perf_counter()
+        restored, _ = backups.restore(last)
+        print(f"restore: {(time.perf_counter() - start) * 1000:.0f} ms, "
+              f"{'matches' if restored == passwords else 'DIFFERS from'} the vault")
+        removed, freed = backups.prune(1)
+        print(f"prune to 1: removed {removed} snapshots, freed {freed / 1024:.0f} KB, "
+              f"{backups.size() / 1024:.0f} KB left")
+
+        print(f"\n{'archive':>7} {'write ms':>9} {'KB':>7} {'of raw KB':>10} "
+              f"{'verify ms':>10} {'restore ms':>11}")
+        for compression in ('zlib', 'lzma'):
+            path = os.path.join(directory, f"archive-{compression}.pwbak")
+            start = time.perf_counter()
+            with open(path, 'wb') as f:
+                stats = write_archive(f, passwords.items(), compression=compression)
+            write_seconds = time.perf_counter() - start
+            verified = verify_archive(path)
+            assert not verified['bad']
+            start = time.perf_counter()
+            assert dict(read_archive(path)) == passwords
+            restore_seconds = time.perf_counter() - start
+            print(f"{compression:>7} {write_seconds * 1000:>9.0f} "
+                  f"{stats['bytes'] / 1024:>7.0f} {stats['raw_bytes'] / 1024:>10.0f} "
+                  f"{verified['seconds'] * 1000:>10.0f} {restore_seconds * 1000:>11.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Startup time and memory of the binary vault against passwords.json.
+
+Each load runs in a fresh interpreter so peak RSS belongs to that load
+alone (VmHWM on Linux, ru_maxrss elsewhere). Run from the
+Mini_password_manager directory:
+
+    python benchmarks/bench_binary.py --size 100000
+"""
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from storage.binary import convert_json_vault
+
+PEAK_RSS = """
+import resource
+def peak_rss():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+"""
+
+LOAD_JSON = PEAK_RSS + """
+import json, sys, time
+start = time.perf_counter()
+with open(sys.argv[1]) as f:
+    passwords = json.load(f)
+elapsed = time.perf_counter() - start
+print(elapsed, peak_rss())
+"""
+
+LOAD_BINARY = PEAK_RSS + """
+import sys, time
+sys.path.insert(0, sys.argv[2])
+from storage.binary import read_vault
+start = time.perf_counter()
+passwords = read_vault(sys.argv[1])
+elapsed = time.perf_counter() - start
+print(elapsed, peak_rss())
+"""
+
+BASELINE = PEAK_RSS + """
+import sys
+sys.path.insert(0, sys.argv[2])
+import storage.binary
+print(0, peak_rss())
+"""
+
+
+def make_vault(size):
+    # A Fernet token for a short password is 89 raw bytes
+    return {
+        f'account-{i}': {
+            'username': f'user{i}@example.com',
+            'password': base64.urlsafe_b64encode(os.urandom(89)).decode(),
+        }
+        for i in range(size)
+    }
+
+
+def run(script, path):
+    out = subprocess.check_output(
+        [sys.executable, '-c', script, path, ROOT], text=True)
+    elapsed, peak_kib = out.split()
+    return float(elapsed), int(peak_kib) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, 'passwords.json')
+        vault_path = os.path.join(tmp, 'passwords.vault')
+        with open(json_path, 'w') as f:
+            json.dump(make_vault(args.size), f)
+        convert_json_vault(json_path, vault_path)
+
+        _, baseline = run(BASELINE, json_path)
+        print(f"{args.size} entries, interpreter baseline {baseline:.1f} MiB")
+        print(f"{'format':<8} {'file MiB':>9} {'load ms':>9} {'peak RSS MiB':>13}")
+        for name, script, path in (('json', LOAD_JSON, json_path),
+                                   ('binary', LOAD_BINARY, vault_path)):
+            elapsed, rss = run(script, path)
+            size = os.path.getsize(path) / (1024 * 1024)
+            print(f"{name:<8} {size:>9.1f} {elapsed * 1000:>9.1f} {rss:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
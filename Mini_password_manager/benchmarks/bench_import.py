@@ -0,0 +1,83 @@
+"""Bulk import throughput against adding rows one at a time.
+
+The baseline does what add_password does per row: encrypt, then put into
+the journal store (one fsync'd record each). The pipeline parses the CSV
+as a stream, encrypts on the process pool and saves once with put_many.
+
+Run from the Mini_password_manager directory:
+
+    python benchmarks/bench_import.py --sizes 1000 20000
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+
+from storage.journal import JournalStore
+from utils.importer import ImportPlan, import_rows, read_file
+
+
+def write_csv(path, size):
+    # Chrome's export layout
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name', 'url', 'username', 'password'])
+        for i in range(size):
+            writer.writerow([f"site-{i}", f"https://site-{i}.example.com",
+                             f"user{i}@example.com", f"password-{i}"])
+
+
+def one_by_one(path, fernet, directory):
+    store = JournalStore(os.path.join(directory, "one_by_one.json"))
+    store.load()
+    start = time.perf_counter()
+    for _, account, username, password in read_file(path):
+        store.put(account, {'username': username,
+                            'password': fernet.encrypt(password.encode()).decode()})
+    elapsed = time.perf_counter() - start
+    store.close()
+    return elapsed
+
+
+def pipeline(path, fernet, directory, workers):
+    store = JournalStore(os.path.join(directory, "pipeline.json"))
+    passwords = store.load()
+    start = time.perf_counter()
+    plan = ImportPlan(passwords)
+    store.put_many(import_rows(read_file(path), fernet, plan, workers=workers))
+    store.flush()
+    elapsed = time.perf_counter() - start
+    assert plan.stats['imported'] == len(passwords)
+    store.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 20000])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--baseline-max', type=int, default=20000,
+                        help="skip the one-by-one baseline above this size")
+    args = parser.parse_args()
+
+    fernet = Fernet(Fernet.generate_key())
+    print(f"{'rows':>8} {'one-by-one rows/s':>18} {'pipeline rows/s':>16}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "export.csv")
+            write_csv(path, size)
+            baseline = "-"
+            if size <= args.baseline_max:
+                baseline = f"{size / one_by_one(path, fernet, directory):.0f}"
+            fast = size / pipeline(path, fernet, directory, args.workers)
+            print(f"{size:>8} {baseline:>18} {fast:>16.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Per-edit latency of the journal store against full JSON rewrites.
+
+Run from the Mini_password_manager directory:
+
+    python benchmarks/bench_journal.py --sizes 1000 10000 50000
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage.journal import JournalStore
+
+
+def make_entry(i):
+    # Same shape and size as a Fernet token, the crypto itself is not timed
+    token = base64.urlsafe_b64encode(os.urandom(100)).decode()
+    return {'username': f'user{i}@example.com', 'password': token}
+
+
+def make_vault(size):
+    return {f'account-{i}': make_entry(i) for i in range(size)}
+
+
+def bench_json(path, passwords, edits):
+    timings = []
+    for i in range(edits):
+        start = time.perf_counter()
+        passwords[f'account-{i}'] = make_entry(i)
+        with open(path, 'w') as f:
+            json.dump(passwords, f)
+            f.flush()
+            os.fsync(f.fileno())
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_journal(path, passwords, edits):
+    with open(path, 'w') as f:
+        json.dump(passwords, f)
+    store = JournalStore(path)
+    store.load()
+
+    timings = []
+    for i in range(edits):
+        start = time.perf_counter()
+        store.put(f'account-{i}', make_entry(i))
+        timings.append(time.perf_counter() - start)
+    store.close()
+    return timings
+
+
+def report(name, size, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:<8} {size:>8} {statistics.median(timings) * 1000:>10.3f} "
+          f"{p95 * 1000:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 50000])
+    parser.add_argument('--edits', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'entries':>8} {'median ms':>10} {'p95 ms':>10}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'passwords.json')
+            report('json', size, bench_json(path, make_vault(size), args.edits))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'passwords.json')
+            report('journal', size,
+                   bench_journal(path, make_vault(size), args.edits))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Bulk re-encryption throughput, single process against the process pool.
+
+Run from the Mini_password_manager directory:
+
+    python benchmarks/bench_reencrypt.py --sizes 10000 100000 --workers 1 4
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+
+from utils.reencrypt import Reencryptor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[1, os.cpu_count() or 1])
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    args = parser.parse_args()
+
+    old_key = Fernet.generate_key()
+    new_key = Fernet.generate_key()
+    fernet = Fernet(old_key)
+
+    print(f"{'entries':>8} {'workers':>8} {'seconds':>8} {'entries/s':>10}")
+    for size in args.sizes:
+        items = [(f"account-{i}", fernet.encrypt(b"password %d" % i).decode())
+                 for i in range(size)]
+        for workers in args.workers:
+            engine = Reencryptor([old_key], new_key, workers=workers,
+                                 chunk_size=args.chunk_size)
+            tokens = engine.run(items)
+            assert len(tokens) == size
+            stats = engine.stats()
+            print(f"{size:>8} {workers:>8} {stats['seconds']:>8.2f} "
+                  f"{stats['entries_per_sec']:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Trigram search index against the linear substring scan.
+
+Also times ranked fuzzy search (top 100) over the same queries.
+
+Run from the Mini_password_manager directory:
+
+    python benchmarks/bench_search.py --sizes 1000 10000 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.search_index import SearchIndex
+
+WORDS = ['github', 'gitlab', 'google', 'mail', 'bank', 'amazon', 'netflix',
+         'steam', 'slack', 'jira', 'aws', 'azure', 'paypal', 'work', 'home']
+
+
+def make_vault(size, rng):
+    passwords = {}
+    for i in range(size):
+        account = f"{rng.choice(WORDS)}-{rng.choice(WORDS)}-{i}"
+        passwords[account] = {'username': f"user{rng.randrange(size)}@example.com",
+                              'password': ''}
+    return passwords
+
+
+def linear_search(passwords, term):
+    # What search_passwords did before the index
+    term = term.lower()
+    return [account for account, data in passwords.items()
+            if term in account.lower() or term in data['username'].lower()]
+
+
+def make_queries(passwords, rng, count):
+    accounts = list(passwords)
+    queries = []
+    for _ in range(count):
+        account = rng.choice(accounts)
+        length = rng.randint(3, 8)
+        start = rng.randrange(max(1, len(account) - length))
+        queries.append(account[start:start + length])
+    # Typing the first characters, and a query that matches nothing
+    queries += ['g', 'gi', 'zzqx']
+    return queries
+
+
+def time_queries(search, queries):
+    timings = []
+    for term in queries:
+        start = time.perf_counter()
+        search(term)
+        timings.append(time.perf_counter() - start)
+    return statistics.mean(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'entries':>8} {'build ms':>9} {'scan ms/q':>10} {'index ms/q':>11} "
+          f"{'rank ms/q':>10}")
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        passwords = make_vault(size, rng)
+        queries = make_queries(passwords, rng, args.queries)
+
+        start = time.perf_counter()
+        index = SearchIndex()
+        index.build(passwords)
+        build = time.perf_counter() - start
+
+        for term in queries:
+            assert index.search(term) == linear_search(passwords, term), term
+        scan = time_queries(lambda term: linear_search(passwords, term), queries)
+        indexed = time_queries(index.search, queries)
+        ranked = time_queries(lambda term: index.rank(term, 100), queries)
+        print(f"{size:>8} {build * 1000:>9.1f} {scan * 1000:>10.3f} "
+              f"{indexed * 1000:>11.3f} {ranked * 1000:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Time from launch to the login screen, and to an open vault.
+
+Each run is a fresh interpreter, so imports are measured cold (apart from
+the OS file cache). It reports how long importing main takes, how long
+until the first frame of the login screen is drawn, and how long opening
+a vault of the given size takes once the master password is known. The
+first frame needs a display and is skipped without one; ttkthemes is
+replaced by plain Tk when it is not installed.
+
+Run from the Mini_password_manager directory:
+
+    python benchmarks/bench_startup.py --runs 5 --size 10000
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import json, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+try:
+    import ttkthemes
+except ImportError:
+    import tkinter, types
+    sys.modules['ttkthemes'] = types.SimpleNamespace(
+        ThemedTk=lambda theme=None: tkinter.Tk())
+import main
+result = {'import': time.perf_counter() - start,
+          'modules': len(sys.modules)}
+try:
+    app = main.PasswordManager(storage_mode=sys.argv[2], watch_interval=None)
+    app.root.update()
+    result['first_frame'] = time.perf_counter() - start
+except Exception as e:  # no display
+    result['skipped'] = str(e).splitlines()[0]
+    app = None
+start = time.perf_counter()
+if app is not None:
+    app.load_data()
+else:
+    from storage.registry import create_store
+    create_store(sys.argv[2]).load()
+result['open_vault'] = time.perf_counter() - start
+print(json.dumps(result))
+'''
+
+
+def make_vault(directory, size):
+    # Legacy JSON file, each backend converts it on first open
+    entries = {f'account-{i}': {
+        'username': f'user{i}@example.com',
+        'password': base64.urlsafe_b64encode(os.urandom(100)).decode()}
+        for i in range(size)}
+    with open(os.path.join(directory, "passwords.json"), 'w') as f:
+        json.dump(entries, f)
+
+
+def run_once(directory, storage):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", CHILD, ROOT, storage],
+                            cwd=directory, capture_output=True, text=True,
+                            check=True).stdout
+    result = json.loads(output.splitlines()[-1])
+    result['process'] = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--size', type=int, default=10000)
+    parser.add_argument('--storage', default='journal',
+                        choices=['journal', 'sqlite', 'binary', 'json'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        make_vault(directory, args.size)
+        run_once(directory, args.storage)  # converts the vault, warms the cache
+        results = [run_once(directory, args.storage) for _ in range(args.runs)]
+
+    if 'skipped' in results[0]:
+        print(f"first frame skipped: {results[0]['skipped']}")
+    print(f"modules loaded before the first frame: {results[0]['modules']}")
+    for name in ('import', 'first_frame', 'open_vault', 'process'):
+        timings = [r[name] for r in results if name in r]
+        if timings:
+            print(f"{name:>12}: median {statistics.median(timings) * 1000:7.1f} ms, "
+                  f"best {min(timings) * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+"""Timings and peak memory of the vault operations at several vault sizes.
+
+Each size runs in a fresh interpreter against a synthetic vault of real
+Fernet tokens, driven through the headless VaultStore: opening the vault,
+a full save, a single edit, building the search index and searching,
+changing the master password, export, backup and re-encrypting every
+entry under a new data key. Rendering the password list in Tk is timed
+separately, and skipped without a display. --sealed runs the same
+operations on vaults whose account names are encrypted too.
+
+Each operation reports the median and best of --repeat runs, then runs
+once more under tracemalloc for its peak Python allocation. Results are
+written as JSON; --compare flags operations that got slower than a
+baseline file and exits with status 1 if any did.
+
+Run from the Mini_password_manager directory:
+
+    python benchmarks/bench_suite.py --sizes 1000 10000 100000 --output results.json
+    python benchmarks/bench_suite.py --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from storage.vault import VaultStore
+
+MASTER_PASSWORD = "benchmark master password"
+QUERIES = ['git', 'mail', 'user4', 'gthub', 'amazn', 'site-99']
+WORDS = ['github', 'gitlab', 'google', 'mail', 'bank', 'amazon', 'netflix',
+         'steam', 'slack', 'jira', 'aws', 'azure', 'paypal', 'work', 'home']
+
+
+def make_vault(directory, size, storage, unlock_target, sealed=False):
+    vault = VaultStore(storage, directory=directory, unlock_target=unlock_target)
+    vault.create(*vault.new_master_key(MASTER_PASSWORD), sealed=sealed)
+    encrypt = vault.cipher.encrypt
+
+    def entry(account, username, password):
+        if vault.sealer is not None:
+            return vault.sealer.seal(account, username, password)
+        return account, {'username': username,
+                         'password': encrypt(password.encode()).decode()}
+
+    vault.put_entries(dict(
+        entry(f"{WORDS[i % len(WORDS)]}-{WORDS[i // len(WORDS) % len(WORDS)]}-{i}",
+              f"user{i}@example.com", f"password-{i}")
+        for i in range(size)))
+    vault.close()
+
+
+def measure(work, repeat, memory, setup=None):
+    """Time work() repeat times, then trace one more run for its peak memory"""
+    timings = []
+    for _ in range(repeat + (1 if memory else 0)):
+        args = (setup(),) if setup else ()
+        tracing = len(timings) == repeat
+        if tracing:
+            tracemalloc.start()
+        start = time.perf_counter()
+        work(*args)
+        elapsed = time.perf_counter() - start
+        if tracing:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return {'seconds': statistics.median(timings), 'best': min(timings),
+                    'peak_kb': round(peak / 1024)}
+        timings.append(elapsed)
+    return {'seconds': statistics.median(timings), 'best': min(timings)}
+
+
+def run_headless(directory, storage, args):
+    results = {}
+    memory = not args.no_memory
+
+    results['open'] = measure(
+        lambda store: store.open(), args.repeat, memory,
+        setup=lambda: VaultStore(storage, directory=directory))
+    vault = VaultStore(storage, directory=directory)
+    vault.login(MASTER_PASSWORD)
+    results['unlock'] = measure(
+        lambda: vault.unlock(MASTER_PASSWORD, None, vault.header), args.repeat, memory)
+    results['save'] = measure(lambda: (vault.save(), vault.flush()),
+                              args.repeat, memory)
+    counter = iter(range(10 ** 9))
+    results['edit'] = measure(
+        lambda: vault.put(f"edited-{next(counter) % 10}", "someone", "secret"),
+        args.repeat, memory)
+
+    results['index_build'] = measure(
+        lambda index: index.build(vault.passwords), args.repeat, memory,
+        setup=vault.new_index)
+    vault.search("")  # build the index once, searches below reuse it
+    results['search'] = measure(
+        lambda: [vault.search(query) for query in QUERIES], args.repeat, memory)
+    results['scan'] = measure(
+        lambda: [vault.scan(query) for query in QUERIES], args.repeat, memory)
+
+    def change_master_password():
+        sample = vault.verification_sample()
+        vault.rewrap(*vault.derive_new_master_key(
+            MASTER_PASSWORD, MASTER_PASSWORD, sample, vault.header))
+
+    results['change_master_password'] = measure(change_master_password,
+                                                args.repeat, memory)
+    export_path = os.path.join(directory, "export.csv")
+    results['export'] = measure(lambda: vault.export(export_path),
+                                args.repeat, memory)
+    os.remove(export_path)
+    results['backup'] = measure(lambda: vault.backup(), args.repeat, memory)
+
+    def rotate():
+        engine, snapshot = vault.rotation()
+        engine.run((account, data['password']) for account, data in snapshot.items())
+        engine.discard_checkpoint()
+
+    results['reencrypt'] = measure(rotate, args.repeat, memory)
+    vault.close()
+    return results
+
+
+def run_tk(directory, storage, args):
+    """Time filling and searching the password list the way the app does it"""
+    import tkinter as tk
+    from tkinter import ttk
+    from gui.tree_sync import TreeReconciler
+    from gui.virtual_list import VirtualTreeview
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        return {'skipped': str(e).splitlines()[0]}
+    root.geometry("800x600")
+    vault = VaultStore(storage, directory=directory)
+    vault.login(MASTER_PASSWORD)
+
+    def row(key):
+        return vault.label(key) + ("********",)
+
+    results = {}
+    for name, build in (
+            ('virtual', lambda tree, bar: VirtualTreeview(tree, bar, row)),
+            ('reconciled', lambda tree, bar: TreeReconciler(
+                tree, row, exists=lambda account: account in vault.passwords))):
+        frame = ttk.Frame(root)
+        frame.pack(fill="both", expand=True)
+        tree = ttk.Treeview(frame, columns=("Account", "Username", "Password"),
+                            show="headings")
+        bar = ttk.Scrollbar(frame, orient="vertical")
+        tree.pack(side="left", fill="both", expand=True)
+        view = build(tree, bar)
+        root.update()
+
+        def refresh():
+            view.set_rows(list(vault.passwords))
+            root.update()
+
+        def search():
+            for query in QUERIES:
+                view.set_rows(vault.search(query), scroll_to_top=True)
+                root.update()
+            view.set_rows(list(vault.passwords))
+
+        results[f'render_{name}'] = measure(refresh, args.repeat, False)
+        results[f'search_{name}'] = measure(search, args.repeat, False)
+        frame.destroy()
+    vault.close()
+    root.destroy()
+    return results
+
+
+def run_size(args):
+    """Child process: one vault size, results as JSON on stdout"""
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        make_vault(directory, args.child, args.storage, args.unlock_target,
+                   args.sealed)
+        result = {'size': args.child, 'storage': args.storage,
+                  'sealed': args.sealed,
+                  'generate_seconds': time.perf_counter() - start,
+                  'headless': run_headless(directory, args.storage, args)}
+        if not args.no_tk:
+            result['tk'] = run_tk(directory, args.storage, args)
+    try:
+        import resource
+        # Kilobytes on Linux, bytes on macOS
+        result['max_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:  # Windows
+        pass
+    print(json.dumps(result))
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(report):
+    """{(size, storage, group, operation): timings} of a report"""
+    rows = {}
+    for run in report['runs']:
+        for group in ('headless', 'tk'):
+            for operation, timings in run.get(group, {}).items():
+                if isinstance(timings, dict):
+                    rows[(run['size'], run['storage'], group, operation)] = timings
+    return rows
+
+
+def compare(report, baseline, threshold):
+    """Print operations slower than baseline by more than threshold, count them"""
+    old = flatten(baseline)
+    regressions = 0
+    print(f"\n{'size':>7} {'operation':<28} {'baseline ms':>12} {'now ms':>10} "
+          f"{'ratio':>6}")
+    for key, timings in flatten(report).items():
+        if key not in old:
+            continue
+        # Best runs are the least noisy way to compare two runs
+        ratio = timings['best'] / max(old[key]['best'], 1e-9)
+        flag = ""
+        if ratio > threshold:
+            regressions += 1
+            flag = "  SLOWER"
+        size, _, group, operation = key
+        print(f"{size:>7} {group + '.' + operation:<28} "
+              f"{old[key]['best'] * 1000:>12.2f} {timings['best'] * 1000:>10.2f} "
+              f"{ratio:>6.2f}{flag}")
+    return regressions
+
+
+def print_report(report):
+    print(f"{'size':>7} {'operation':<28} {'median ms':>10} {'best ms':>10} "
+          f"{'peak KB':>9}")
+    for run in report['runs']:
+        for group in ('headless', 'tk'):
+            for operation, timings in run.get(group, {}).items():
+                if not isinstance(timings, dict):
+                    print(f"{run['size']:>7} {group:<28} skipped: {timings}")
+                    continue
+                print(f"{run['size']:>7} {group + '.' + operation:<28} "
+                      f"{timings['seconds'] * 1000:>10.2f} "
+                      f"{timings['best'] * 1000:>10.2f} "
+                      f"{timings.get('peak_kb', ''):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--storage', default='journal',
+                        choices=['journal', 'sqlite', 'binary', 'json'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--unlock-target', type=float, default=0.1,
+                        help="seconds one key derivation takes in the test vaults")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="skip the extra tracemalloc run of each operation")
+    parser.add_argument('--no-tk', action='store_true')
+    parser.add_argument('--sealed', action='store_true',
+                        help="encrypt account names, search by blind index")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help="JSON results of an earlier run to compare with")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="slowdown ratio counted as a regression")
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_size(args)
+        return 0
+
+    report = {'meta': {'commit': git_commit(),
+                       'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'cpus': os.cpu_count(),
+                       'repeat': args.repeat,
+                       'unlock_target': args.unlock_target,
+                       'sealed': args.sealed},
+              'runs': []}
+    passed = [flag for flag, on in (('--no-memory', args.no_memory),
+                                    ('--no-tk', args.no_tk),
+                                    ('--sealed', args.sealed)) if on]
+    for size in args.sizes:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', str(size),
+             '--storage', args.storage, '--repeat', str(args.repeat),
+             '--unlock-target', str(args.unlock_target)] + passed,
+            capture_output=True, text=True, check=True).stdout
+        report['runs'].append(json.loads(output.splitlines()[-1]))
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
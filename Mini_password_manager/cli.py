@@ -0,0 +1,219 @@
+"""Command line access to the vault, for scripts, cron jobs and pipelines.
+
+    python cli.py get github              # password on stdout
+    python cli.py add github me@example.com < password.txt
+    python cli.py search git
+    python cli.py history github --restore 1
+    python cli.py import bitwarden.csv --policy keep_both
+    python cli.py export vault.csv --filter work
+    python cli.py backup --archive vault.pwbak
+
+The master password is read from the PM_MASTER_PASSWORD environment
+variable, or asked for on the terminal. Nothing but the header and the
+key derivation is loaded before the password is checked, and each
+command only imports what it uses, so a lookup starts in a fraction of
+the time the window takes.
+"""
+import argparse
+import getpass
+import os
+import sys
+
+from storage.header import HeaderError
+from storage.vault import KeysChangedError, VaultStore
+
+MASTER_PASSWORD_ENV = "PM_MASTER_PASSWORD"
+
+
+class CliError(Exception):
+    pass
+
+
+def secret(prompt, env=None):
+    """A secret from the environment variable env, else from the terminal"""
+    if env and os.environ.get(env):
+        return os.environ[env]
+    return getpass.getpass(prompt)
+
+
+def open_vault(args):
+    vault = VaultStore(args.storage, directory=args.dir)
+    if vault.header is None and vault.verification_sample() is None:
+        raise CliError(f"No vault in {os.path.abspath(args.dir)}, "
+                       "create one with the app first")
+    from cryptography.fernet import InvalidToken
+    try:
+        vault.login(secret("Master password: ", MASTER_PASSWORD_ENV))
+    except InvalidToken:
+        raise CliError("Invalid master password")
+    return vault
+
+
+def cmd_get(vault, args):
+    key = vault.key_of(args.account)
+    if key not in vault.passwords:
+        raise CliError(f"No entry for {args.account}")
+    if args.username:
+        print(vault.label(key)[1])
+    else:
+        print(vault.decrypt_password(key, remember=False))
+
+
+def cmd_add(vault, args):
+    if vault.key_of(args.account) in vault.passwords and not args.replace:
+        raise CliError(f"{args.account} already exists, use --replace")
+    if sys.stdin.isatty():
+        password = getpass.getpass(f"Password for {args.account}: ")
+    else:
+        password = sys.stdin.readline().rstrip("\r\n")
+    if not password:
+        raise CliError("Empty password")
+    vault.put(args.account, args.username, password)
+
+
+def cmd_search(vault, args):
+    # One pass over the vault, building the index would cost more
+    found = 0
+    for account, username in vault.scan(args.term):
+        print(f"{account}\t{username}")
+        found += 1
+        if found == args.limit:
+            break
+    return 0 if found else 1
+
+
+def cmd_history(vault, args):
+    versions = vault.versions(args.account)
+    if not versions:
+        raise CliError(f"No earlier versions of {args.account}")
+    if args.restore is not None:
+        if not 1 <= args.restore <= len(versions):
+            raise CliError(f"Pick a version from 1 to {len(versions)}")
+        vault.restore_version(args.account, versions[args.restore - 1][0])
+        print(f"Restored version {args.restore} of {args.account}", file=sys.stderr)
+        return
+    from datetime import datetime
+    for number, (replaced_at, username, password) in enumerate(versions, 1):
+        replaced = datetime.fromtimestamp(replaced_at).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{number}\t{replaced}\t{username}"
+              + (f"\t{password}" if args.passwords else ""))
+
+
+def cmd_import(vault, args):
+    passphrase = None
+    if args.path.lower().endswith('.pwx'):
+        passphrase = secret("Export passphrase: ", args.passphrase_env)
+    plan = vault.import_file(args.path, args.policy, passphrase)
+    stats = plan.stats
+    print(f"Imported {stats['imported']} of {stats['read']} rows "
+          f"(replaced {stats['replaced']}, renamed {stats['renamed']}, "
+          f"skipped {stats['skipped']}, duplicates {stats['duplicates']}, "
+          f"invalid {stats['invalid']})", file=sys.stderr)
+    for error in plan.errors:
+        print(error, file=sys.stderr)
+
+
+def cmd_export(vault, args):
+    passphrase = None
+    if args.format == 'container':
+        passphrase = secret("Export passphrase: ", args.passphrase_env)
+    count = vault.export(args.path, args.format, term=args.filter,
+                         passphrase=passphrase)
+    print(f"{count} passwords exported to {args.path}", file=sys.stderr)
+
+
+def cmd_backup(vault, args):
+    if args.archive:
+        stats = vault.write_archive(args.archive, compression=args.compression)
+        print(f"{stats['entries']} passwords archived to {args.archive} "
+              f"({stats['bytes'] / 1024:.1f} KB)", file=sys.stderr)
+        return
+    manifest = vault.backup()
+    stats = manifest['stats']
+    print(f"Backup {manifest['id']}: {manifest['entries']} passwords, "
+          f"{stats['new_chunks']} of {stats['chunks']} chunks changed, "
+          f"{stats['bytes_written'] / 1024:.1f} KB written", file=sys.stderr)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dir', default=".", help="directory holding the vault")
+    parser.add_argument('--storage', default='journal',
+                        choices=['journal', 'sqlite', 'binary', 'json'])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    get = commands.add_parser('get', help="print the password of an account")
+    get.add_argument('account')
+    get.add_argument('--username', action='store_true',
+                     help="print the username instead")
+    get.set_defaults(run=cmd_get)
+
+    add = commands.add_parser(
+        'add', help="add an entry, the password is read from stdin")
+    add.add_argument('account')
+    add.add_argument('username')
+    add.add_argument('--replace', action='store_true',
+                     help="overwrite an existing entry")
+    add.set_defaults(run=cmd_add)
+
+    search = commands.add_parser(
+        'search', help="list accounts whose account or username contains a term")
+    search.add_argument('term')
+    search.add_argument('--limit', type=int, default=None)
+    search.set_defaults(run=cmd_search)
+
+    history = commands.add_parser(
+        'history', help="list earlier versions of an account, newest first")
+    history.add_argument('account')
+    history.add_argument('--passwords', action='store_true',
+                         help="print the passwords too")
+    history.add_argument('--restore', type=int, metavar='N',
+                         help="bring back version N of the list")
+    history.set_defaults(run=cmd_history)
+
+    import_ = commands.add_parser(
+        'import', help="import a CSV, JSON or .pwx export in one save")
+    import_.add_argument('path')
+    import_.add_argument('--policy', default='skip',
+                         choices=['skip', 'replace', 'keep_both'],
+                         help="what to do with accounts that already exist")
+    import_.add_argument('--passphrase-env', metavar='VAR',
+                         help="environment variable holding the .pwx passphrase")
+    import_.set_defaults(run=cmd_import)
+
+    export = commands.add_parser('export', help="write entries to a file")
+    export.add_argument('path')
+    export.add_argument('--format', default='csv',
+                        choices=['csv', 'jsonl', 'container'])
+    export.add_argument('--filter', help="only accounts or usernames containing this")
+    export.add_argument('--passphrase-env', metavar='VAR',
+                        help="environment variable holding the container passphrase")
+    export.set_defaults(run=cmd_export)
+
+    backup = commands.add_parser(
+        'backup', help="take an incremental backup, or write an archive")
+    backup.add_argument('--archive', metavar='PATH',
+                        help="write the vault to a compressed archive instead")
+    backup.add_argument('--compression', default='zlib', choices=['zlib', 'lzma'])
+    backup.set_defaults(run=cmd_backup)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    vault = None
+    try:
+        vault = open_vault(args)
+        return args.run(vault, args) or 0
+    except (CliError, HeaderError, KeysChangedError, OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if vault is not None:
+            vault.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,8 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
+from datetime import datetime
+from utils.export import EXPORT_FORMATS
+from utils.importer import KEEP_BOTH, REPLACE, SKIP
 from utils.password_generator import PasswordGenerator
 
 class AddPasswordDialog:
@@ -90,4 +93,413 @@ class AddPasswordDialog:
         self.dialog.destroy()
     
     def cancel(self):
-        self.dialog.destroy() 
\ No newline at end of file
+        self.dialog.destroy() 
+
+class ExportDialog:
+    """Asks for the export format, an optional filter and where to save"""
+
+    def __init__(self, parent, term=""):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Export Passwords")
+        self.dialog.geometry("360x330")
+        self.result = None
+        self.formats = {cls.name: key for key, cls in EXPORT_FORMATS.items()}
+        self.setup_dialog(term)
+
+    def setup_dialog(self, term):
+        ttk.Label(self.dialog, text="Format:").pack(pady=5)
+        self.format_var = tk.StringVar(value=EXPORT_FORMATS['csv'].name)
+        format_box = ttk.Combobox(self.dialog, textvariable=self.format_var,
+                                  values=list(self.formats), state="readonly")
+        format_box.pack(pady=5)
+        format_box.bind("<<ComboboxSelected>>", lambda event: self.update_fields())
+
+        ttk.Label(self.dialog, text="Only accounts/usernames containing:").pack(pady=5)
+        self.filter_entry = ttk.Entry(self.dialog)
+        self.filter_entry.insert(0, term)
+        self.filter_entry.pack(pady=5, fill="x", padx=10)
+
+        passphrase_frame = ttk.LabelFrame(self.dialog, text="Container Passphrase")
+        passphrase_frame.pack(padx=10, pady=5, fill="x")
+        self.passphrase_entry = ttk.Entry(passphrase_frame, show="*")
+        self.passphrase_entry.pack(pady=5, fill="x", padx=5)
+        self.confirm_entry = ttk.Entry(passphrase_frame, show="*")
+        self.confirm_entry.pack(pady=5, fill="x", padx=5)
+
+        button_frame = ttk.Frame(self.dialog)
+        button_frame.pack(pady=15)
+        ttk.Button(button_frame, text="Export...",
+                  command=self.save).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="Cancel",
+                  command=self.cancel).pack(side="left", padx=5)
+        self.update_fields()
+
+    def selected_format(self):
+        return self.formats[self.format_var.get()]
+
+    def update_fields(self):
+        # A passphrase only makes sense for the encrypted container
+        state = ["!disabled"] if self.selected_format() == 'container' else ["disabled"]
+        self.passphrase_entry.state(state)
+        self.confirm_entry.state(state)
+
+    def save(self):
+        export_format = self.selected_format()
+        passphrase = self.passphrase_entry.get()
+        if export_format == 'container':
+            if passphrase != self.confirm_entry.get():
+                messagebox.showerror("Error", "Passphrases don't match!")
+                return
+            if len(passphrase) < 8:
+                messagebox.showerror("Error", "Passphrase too short!")
+                return
+
+        extension = EXPORT_FORMATS[export_format].extension
+        path = filedialog.asksaveasfilename(
+            parent=self.dialog, defaultextension=extension,
+            initialfile=f"passwords_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}{extension}",
+            filetypes=[(self.format_var.get(), "*" + extension)])
+        if not path:
+            return
+
+        self.result = {
+            "format": export_format,
+            "path": path,
+            "filter": self.filter_entry.get(),
+            "passphrase": passphrase
+        }
+        self.dialog.destroy()
+
+    def cancel(self):
+        self.dialog.destroy()
+
+
+class ImportDialog:
+    """Asks for the file to import and what to do with existing accounts"""
+
+    POLICIES = {
+        "Skip existing accounts": SKIP,
+        "Replace existing accounts": REPLACE,
+        "Keep both (rename imported)": KEEP_BOTH,
+    }
+
+    def __init__(self, parent):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Import Passwords")
+        self.dialog.geometry("380x300")
+        self.result = None
+        self.setup_dialog()
+
+    def setup_dialog(self):
+        ttk.Label(self.dialog, text="File (CSV, JSON, JSON Lines or .pwx):").pack(pady=5)
+        file_frame = ttk.Frame(self.dialog)
+        file_frame.pack(fill="x", padx=10)
+        self.path_entry = ttk.Entry(file_frame)
+        self.path_entry.pack(side="left", fill="x", expand=True)
+        ttk.Button(file_frame, text="Browse...",
+                  command=self.browse).pack(side="left", padx=5)
+
+        ttk.Label(self.dialog, text="Container passphrase (.pwx only):").pack(pady=5)
+        self.passphrase_entry = ttk.Entry(self.dialog, show="*")
+        self.passphrase_entry.pack(pady=5, fill="x", padx=10)
+
+        ttk.Label(self.dialog, text="When an account already exists:").pack(pady=5)
+        self.policy_var = tk.StringVar(value=next(iter(self.POLICIES)))
+        ttk.Combobox(self.dialog, textvariable=self.policy_var,
+                     values=list(self.POLICIES), state="readonly",
+                     width=30).pack(pady=5)
+
+        button_frame = ttk.Frame(self.dialog)
+        button_frame.pack(pady=15)
+        ttk.Button(button_frame, text="Import",
+                  command=self.save).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="Cancel",
+                  command=self.cancel).pack(side="left", padx=5)
+
+    def browse(self):
+        path = filedialog.askopenfilename(
+            parent=self.dialog,
+            filetypes=[("Password exports", "*.csv *.json *.jsonl *.pwx"),
+                       ("All files", "*")])
+        if path:
+            self.path_entry.delete(0, tk.END)
+            self.path_entry.insert(0, path)
+
+    def save(self):
+        path = self.path_entry.get()
+        if not path:
+            messagebox.showerror("Error", "Please choose a file to import")
+            return
+        if path.lower().endswith(".pwx") and not self.passphrase_entry.get():
+            messagebox.showerror("Error", "This export needs its passphrase")
+            return
+
+        self.result = {
+            "path": path,
+            "passphrase": self.passphrase_entry.get(),
+            "policy": self.POLICIES[self.policy_var.get()]
+        }
+        self.dialog.destroy()
+
+    def cancel(self):
+        self.dialog.destroy()
+
+
+class BackupDialog:
+    """Lists backup snapshots to restore, archive or prune, and picks
+    archive files to verify or restore"""
+
+    def __init__(self, parent, snapshots):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Backups")
+        self.dialog.geometry("560x460")
+        self.snapshots = snapshots
+        self.result = None
+        self.setup_dialog()
+
+    def setup_dialog(self):
+        columns = ("created", "entries", "new", "written", "time")
+        self.tree = ttk.Treeview(self.dialog, columns=columns, show="headings",
+                                 selectmode="browse", height=10)
+        for column, heading, width in (("created", "Created", 160),
+                                       ("entries", "Entries", 70),
+                                       ("new", "New chunks", 90),
+                                       ("written", "Written", 90),
+                                       ("time", "Time", 70)):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width)
+        # Newest first, that is what gets restored most often
+        for manifest in reversed(self.snapshots):
+            stats = manifest['stats']
+            self.tree.insert("", "end", iid=manifest['id'], values=(
+                manifest['created'].replace("T", " "),
+                manifest['entries'],
+                f"{stats['new_chunks']} of {stats['chunks']}",
+                f"{stats['bytes_written'] / 1024:.1f} KB",
+                f"{stats['seconds'] * 1000:.0f} ms"))
+        self.tree.pack(fill="both", expand=True, padx=10, pady=10)
+
+        prune_frame = ttk.Frame(self.dialog)
+        prune_frame.pack(pady=5)
+        ttk.Label(prune_frame, text="Keep the newest").pack(side="left")
+        self.keep_var = tk.IntVar(value=10)
+        ttk.Spinbox(prune_frame, from_=1, to=1000, width=5,
+                    textvariable=self.keep_var).pack(side="left", padx=5)
+        ttk.Button(prune_frame, text="Prune",
+                  command=self.prune).pack(side="left", padx=5)
+
+        archive_frame = ttk.Frame(self.dialog)
+        archive_frame.pack(pady=5)
+        ttk.Label(archive_frame, text="Archive compression:").pack(side="left")
+        self.compression_var = tk.StringVar(value="zlib")
+        ttk.Combobox(archive_frame, textvariable=self.compression_var,
+                     values=("zlib", "lzma"), state="readonly",
+                     width=6).pack(side="left", padx=5)
+        ttk.Button(archive_frame, text="Save as Archive...",
+                  command=self.archive).pack(side="left", padx=5)
+
+        file_frame = ttk.Frame(self.dialog)
+        file_frame.pack(pady=5)
+        ttk.Button(file_frame, text="Verify Archive...",
+                  command=self.verify_archive).pack(side="left", padx=5)
+        ttk.Button(file_frame, text="Restore Archive...",
+                  command=self.restore_archive).pack(side="left", padx=5)
+
+        button_frame = ttk.Frame(self.dialog)
+        button_frame.pack(pady=10)
+        ttk.Button(button_frame, text="Restore",
+                  command=self.restore).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="Close",
+                  command=self.cancel).pack(side="left", padx=5)
+
+    def archive(self):
+        selection = self.tree.selection()
+        if not selection:
+            messagebox.showerror("Error", "Please select a backup to archive")
+            return
+        path = filedialog.asksaveasfilename(
+            parent=self.dialog, defaultextension=".pwbak",
+            initialfile=f"passwords_backup_{selection[0]}.pwbak",
+            filetypes=[("Backup archives", "*.pwbak"), ("All files", "*")])
+        if path:
+            self.result = {"action": "archive", "snapshot": selection[0],
+                           "path": path,
+                           "compression": self.compression_var.get()}
+            self.dialog.destroy()
+
+    def verify_archive(self):
+        self.pick_archive("verify_archive")
+
+    def restore_archive(self):
+        self.pick_archive("restore_archive")
+
+    def pick_archive(self, action):
+        path = filedialog.askopenfilename(
+            parent=self.dialog,
+            filetypes=[("Backup archives", "*.pwbak"), ("All files", "*")])
+        if path:
+            self.result = {"action": action, "path": path}
+            self.dialog.destroy()
+
+    def restore(self):
+        selection = self.tree.selection()
+        if not selection:
+            messagebox.showerror("Error", "Please select a backup to restore")
+            return
+        self.result = {"action": "restore", "snapshot": selection[0]}
+        self.dialog.destroy()
+
+    def prune(self):
+        try:
+            keep = self.keep_var.get()
+        except tk.TclError:
+            keep = 0
+        if keep < 1:
+            messagebox.showerror("Error", "Keep at least one backup")
+            return
+        self.result = {"action": "prune", "keep": keep}
+        self.dialog.destroy()
+
+    def cancel(self):
+        self.dialog.destroy()
+
+
+class PerformanceDialog:
+    """Where time went this session: spans, counters and the decrypt cache
+
+    Works on the live metrics, recording can be switched on and off, the
+    numbers reset or saved as JSON from here.
+    """
+
+    def __init__(self, parent, metrics, cache):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Performance")
+        self.dialog.geometry("640x420")
+        self.metrics = metrics
+        self.cache = cache
+        self.setup_dialog()
+        self.refresh()
+
+    def setup_dialog(self):
+        self.enabled_var = tk.BooleanVar(value=self.metrics.enabled)
+        ttk.Checkbutton(self.dialog, text="Record timings",
+                        variable=self.enabled_var,
+                        command=self.toggle).pack(pady=5)
+
+        columns = ("count", "total", "mean", "p50", "p95", "max")
+        self.tree = ttk.Treeview(self.dialog, columns=columns,
+                                 show="tree headings", height=12)
+        self.tree.heading("#0", text="Span")
+        self.tree.column("#0", width=190)
+        for column in columns:
+            self.tree.heading(column, text=column if column == "count"
+                              else f"{column} ms")
+            self.tree.column(column, width=70, anchor="e")
+        self.tree.pack(fill="both", expand=True, padx=10, pady=5)
+
+        self.summary_label = ttk.Label(self.dialog, text="")
+        self.summary_label.pack(pady=5)
+
+        button_frame = ttk.Frame(self.dialog)
+        button_frame.pack(pady=10)
+        ttk.Button(button_frame, text="Refresh",
+                  command=self.refresh).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="Reset",
+                  command=self.reset).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="Save as JSON...",
+                  command=self.save).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="Close",
+                  command=self.cancel).pack(side="left", padx=5)
+
+    def refresh(self):
+        snapshot = self.metrics.snapshot()
+        self.tree.delete(*self.tree.get_children())
+        for name, span in snapshot['spans'].items():
+            self.tree.insert("", "end", text=name, values=(
+                span['count'],
+                *(f"{span[field] * 1000:.2f}"
+                  for field in ('total', 'mean', 'p50', 'p95', 'max'))))
+        for name, value in sorted(snapshot['counters'].items()):
+            self.tree.insert("", "end", text=name, values=(value,))
+        self.summary_label.config(text=(
+            f"Decrypt cache: {self.cache.hits} hits, {self.cache.misses} misses, "
+            f"{self.cache.evictions} evictions. "
+            f"{snapshot['seconds']:.0f} s since the last reset."))
+
+    def toggle(self):
+        self.metrics.enabled = self.enabled_var.get()
+        self.refresh()
+
+    def reset(self):
+        self.metrics.reset()
+        self.refresh()
+
+    def save(self):
+        path = filedialog.asksaveasfilename(
+            parent=self.dialog, defaultextension=".json",
+            initialfile=f"performance_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            filetypes=[("JSON", "*.json")])
+        if not path:
+            return
+        try:
+            self.metrics.dump(path)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not save: {e}", parent=self.dialog)
+
+    def cancel(self):
+        self.dialog.destroy()
+
+
+class HistoryDialog:
+    """Earlier versions of one entry, newest first, to restore one of"""
+
+    def __init__(self, parent, account, versions):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title(f"History of {account}")
+        self.dialog.geometry("520x340")
+        self.versions = versions
+        self.result = None
+        self.setup_dialog()
+
+    def setup_dialog(self):
+        columns = ("replaced", "username", "password")
+        self.tree = ttk.Treeview(self.dialog, columns=columns, show="headings",
+                                 selectmode="browse", height=10)
+        for column, heading, width in (("replaced", "Replaced", 150),
+                                       ("username", "Username", 170),
+                                       ("password", "Password", 150)):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width)
+        self.tree.pack(fill="both", expand=True, padx=10, pady=10)
+
+        self.show_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.dialog, text="Show passwords", variable=self.show_var,
+                        command=self.fill).pack(pady=5)
+        self.fill()
+
+        button_frame = ttk.Frame(self.dialog)
+        button_frame.pack(pady=10)
+        ttk.Button(button_frame, text="Restore",
+                  command=self.restore).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="Close",
+                  command=self.cancel).pack(side="left", padx=5)
+
+    def fill(self):
+        self.tree.delete(*self.tree.get_children())
+        for i, (replaced_at, username, password) in enumerate(self.versions):
+            self.tree.insert("", "end", iid=str(i), values=(
+                datetime.fromtimestamp(replaced_at).strftime("%Y-%m-%d %H:%M:%S"),
+                username,
+                password if self.show_var.get() else "********"))
+
+    def restore(self):
+        selection = self.tree.selection()
+        if not selection:
+            messagebox.showerror("Error", "Please select a version to restore",
+                                 parent=self.dialog)
+            return
+        self.result = self.versions[int(selection[0])][0]
+        self.dialog.destroy()
+
+    def cancel(self):
+        self.dialog.destroy()
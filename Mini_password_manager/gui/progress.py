@@ -0,0 +1,48 @@
+import tkinter as tk
+from tkinter import ttk
+
+
+class ProgressDialog:
+    """Small window showing a background task's progress with a Cancel button"""
+
+    def __init__(self, parent, title, message="Working..."):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title(title)
+        self.dialog.geometry("320x140")
+        self.dialog.transient(parent)
+        self.dialog.protocol("WM_DELETE_WINDOW", self.cancel)
+        self.task = None
+        self.setup_dialog(message)
+
+    def setup_dialog(self, message):
+        self.message_label = ttk.Label(self.dialog, text=message)
+        self.message_label.pack(pady=10)
+
+        # Indeterminate until the task reports a total
+        self.progress_bar = ttk.Progressbar(self.dialog, mode="indeterminate",
+                                            length=260)
+        self.progress_bar.pack(pady=5)
+        self.progress_bar.start(10)
+
+        self.cancel_button = ttk.Button(self.dialog, text="Cancel",
+                                        command=self.cancel)
+        self.cancel_button.pack(pady=10)
+
+    def update(self, done, total=None, message=None):
+        if total:
+            if str(self.progress_bar['mode']) != "determinate":
+                self.progress_bar.stop()
+                self.progress_bar.configure(mode="determinate", maximum=total)
+            self.progress_bar['value'] = done
+        if message:
+            self.message_label.configure(text=message)
+
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+        self.message_label.configure(text="Cancelling...")
+        self.cancel_button.state(["disabled"])
+
+    def close(self):
+        self.progress_bar.stop()
+        self.dialog.destroy()
@@ -0,0 +1,136 @@
+class TreeReconciler:
+    """Keeps a Treeview in step with a list of row keys using minimal edits.
+
+    Every key gets one Treeview item for its whole lifetime. ``set_rows``
+    inserts items for new keys, deletes items whose key no longer exists and
+    detaches/reattaches items to filter. ``apply_changes`` takes the keys a
+    save or refresh touched and edits only their items. Row values are kept
+    until their key changes, so adding a row or narrowing a search costs
+    Treeview calls proportional to what changed rather than to the number of
+    rows.
+    """
+
+    def __init__(self, tree, row_values, exists):
+        self.tree = tree
+        self.row_values = row_values
+        self.exists = exists
+        self._items = {}  # key -> item id
+        self._keys = {}  # item id -> key
+        self._values = {}  # key -> values last written to the item
+        self._stale = set()  # keys whose values may have changed since
+        self._attached = set()
+        self._positions = {}  # attached key -> rank in the order shown
+        self._end = 0
+
+    @property
+    def selected_key(self):
+        selection = self.tree.selection()
+        return self._keys.get(selection[0]) if selection else None
+
+    def set_rows(self, keys, scroll_to_top=False):
+        """Show exactly keys, in order"""
+        wanted = set(keys)
+
+        leaving = self._attached - wanted
+        removed = [key for key in leaving if not self.exists(key)]
+        if removed:
+            self.tree.delete(*[self._forget(key) for key in removed])
+        hidden = [self._items[key] for key in leaving if key in self._items]
+        if hidden:
+            self.tree.detach(*hidden)
+
+        # Rows that stay attached keep their relative order, only when keys
+        # asks for another one do the rows need re-sorting
+        last, resort = -1, False
+        positions = {}
+        for index, key in enumerate(keys):
+            positions[key] = index
+            item = self._items.get(key)
+            if item is None:
+                self._insert(key, index)
+                continue
+            if key in self._stale:
+                self._update(key)
+            if key in self._attached:
+                position = self._positions[key]
+                resort = resort or position < last
+                last = position
+            else:
+                self.tree.move(item, '', index)
+        self._attached = wanted
+        self._positions = positions
+        self._end = len(keys)
+
+        if resort:
+            for index, key in enumerate(keys):
+                self.tree.move(self._items[key], '', index)
+
+        if scroll_to_top:
+            self.tree.yview_moveto(0)
+
+    def apply_changes(self, changes):
+        """Edit only the rows in changes, {key: entry, or None if deleted}
+
+        New keys go at the end, where the vault keeps them. Hidden rows are
+        only marked stale and computed when shown again.
+        """
+        removed = [key for key, entry in changes.items()
+                   if entry is None and key in self._items]
+        if removed:
+            self.tree.delete(*[self._forget(key) for key in removed])
+
+        for key, entry in changes.items():
+            if entry is None:
+                continue
+            if key not in self._items:
+                self._insert(key, 'end')
+                self._attached.add(key)
+                self._positions[key] = self._end
+                self._end += 1
+            elif key in self._attached:
+                self._update(key)
+            else:
+                self._stale.add(key)
+
+    def invalidate(self):
+        """Compute every row again on the next set_rows, for changes that
+        never went through apply_changes"""
+        detached = [key for key in self._items if key not in self._attached]
+        if detached:
+            self.tree.delete(*[self._forget(key) for key in detached])
+        self._stale.update(self._items)
+
+    def reset(self):
+        """Delete every item, e.g. so no plaintext lingers in the widget"""
+        if self._items:
+            self.tree.delete(*self._items.values())
+        self._items.clear()
+        self._keys.clear()
+        self._values.clear()
+        self._stale.clear()
+        self._attached.clear()
+        self._positions.clear()
+        self._end = 0
+
+    def _insert(self, key, index):
+        values = self.row_values(key)
+        item = self.tree.insert('', index, values=values)
+        self._items[key] = item
+        self._keys[item] = key
+        self._values[key] = values
+
+    def _update(self, key):
+        values = self.row_values(key)
+        if values != self._values[key]:
+            self.tree.item(self._items[key], values=values)
+        self._values[key] = values
+        self._stale.discard(key)
+
+    def _forget(self, key):
+        item = self._items.pop(key)
+        del self._keys[item]
+        del self._values[key]
+        self._stale.discard(key)
+        self._attached.discard(key)
+        self._positions.pop(key, None)
+        return item
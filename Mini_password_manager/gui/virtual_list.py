@@ -0,0 +1,148 @@
+from tkinter import ttk
+
+
+class VirtualTreeview:
+    """Shows a long list of rows through a small, fixed pool of Treeview items.
+
+    Only the rows that fit in the window (plus ``overscan`` extra) exist as
+    Treeview items. Scrolling moves ``offset`` through ``keys`` and rewrites
+    the pooled items in place with ``row_values(key)``, so rendering cost
+    depends on the window height rather than on the number of rows.
+    """
+
+    def __init__(self, tree, scrollbar, row_values, overscan=5):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.row_values = row_values
+        self.overscan = overscan
+        self.keys = []
+        self.offset = 0
+        self.selected_key = None
+        # Where selected_key sits in keys, looked up again only after the
+        # keys changed, so arrow keys stay O(1) on a huge list
+        self._selected_index = None
+        self._index_stale = False
+        self._pool = []
+        self._shown = {}  # item id -> key currently displayed in it
+
+        self.scrollbar.configure(command=self.yview)
+        self.tree.bind('<Configure>', lambda event: self.render())
+        self.tree.bind('<<TreeviewSelect>>', self._on_select)
+        self.tree.bind('<MouseWheel>', self._on_mousewheel)
+        self.tree.bind('<Button-4>', lambda event: self._scroll_by(-3))
+        self.tree.bind('<Button-5>', lambda event: self._scroll_by(3))
+        self.tree.bind('<Up>', lambda event: self._move_selection(-1))
+        self.tree.bind('<Down>', lambda event: self._move_selection(1))
+        self.tree.bind('<Prior>', lambda event: self._scroll_by(-self.visible_rows()))
+        self.tree.bind('<Next>', lambda event: self._scroll_by(self.visible_rows()))
+
+    def set_rows(self, keys, scroll_to_top=False):
+        """Replace the row keys, keeping the scroll position unless asked"""
+        self.keys = keys
+        self._index_stale = True
+        if scroll_to_top:
+            self.offset = 0
+        self.render()
+
+    def reset(self):
+        self.selected_key = None
+        self.set_rows([], scroll_to_top=True)
+
+    def visible_rows(self):
+        row_height = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        # One row's worth of height goes to the column headings
+        return max(1, self.tree.winfo_height() // row_height - 1)
+
+    def render(self):
+        """Fill the item pool with the rows starting at offset"""
+        visible = self.visible_rows()
+        self.offset = max(0, min(self.offset, len(self.keys) - visible))
+        needed = min(visible + self.overscan, len(self.keys) - self.offset)
+
+        while len(self._pool) < needed:
+            self._pool.append(self.tree.insert('', 'end'))
+        while len(self._pool) > needed:
+            item = self._pool.pop()
+            self._shown.pop(item, None)
+            self.tree.delete(item)
+
+        selected = ()
+        for index, item in enumerate(self._pool):
+            key = self.keys[self.offset + index]
+            self._shown[item] = key
+            self.tree.item(item, values=self.row_values(key))
+            if key == self.selected_key:
+                selected = (item,)
+        # The selected row may have scrolled out, selected_key remembers it
+        self.tree.selection_set(selected)
+        # Overscan rows sit below the viewport, keep the pool's top in view
+        self.tree.yview_moveto(0)
+        self._update_scrollbar(visible)
+
+    def key_for_item(self, item):
+        return self._shown.get(item)
+
+    def yview(self, *args):
+        """Scrollbar command, maps scrollbar positions to row offsets"""
+        if args[0] == 'moveto':
+            self.offset = int(float(args[1]) * len(self.keys))
+            self.render()
+        elif args[0] == 'scroll':
+            step = int(args[1])
+            if args[2] == 'pages':
+                step *= self.visible_rows()
+            self._scroll_by(step)
+
+    def _scroll_by(self, rows):
+        self.offset += rows
+        self.render()
+        return "break"
+
+    def _on_mousewheel(self, event):
+        # Windows reports multiples of 120, macOS reports small deltas
+        delta = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        return self._scroll_by(-delta * 3)
+
+    def _selected_position(self):
+        """Index of selected_key in keys, None when it is not there"""
+        if self._index_stale:
+            self._index_stale = False
+            try:
+                self._selected_index = self.keys.index(self.selected_key)
+            except ValueError:
+                self._selected_index = None
+        return self._selected_index
+
+    def _move_selection(self, step):
+        position = self._selected_position()
+        if position is None:
+            return None
+        index = position + step
+        if not 0 <= index < len(self.keys):
+            return "break"
+        self.selected_key = self.keys[index]
+        self._selected_index = index
+        visible = self.visible_rows()
+        if index < self.offset:
+            self.offset = index
+        elif index >= self.offset + visible:
+            self.offset = index - visible + 1
+        self.render()
+        return "break"
+
+    def _on_select(self, event):
+        # Fires after render() too, an empty selection there means the
+        # selected row is scrolled out of view rather than deselected
+        selection = self.tree.selection()
+        if selection and selection[0] in self._shown:
+            self.selected_key = self._shown[selection[0]]
+            self._selected_index = self.offset + self._pool.index(selection[0])
+            self._index_stale = False
+
+    def _update_scrollbar(self, visible):
+        total = len(self.keys)
+        if total <= visible:
+            self.scrollbar.set(0, 1)
+        else:
+            self.scrollbar.set(self.offset / total,
+                               (self.offset + visible) / total)
@@ -1,20 +1,19 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import json
 import os
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-import base64
-import csv
-from datetime import datetime
 from ttkthemes import ThemedTk
-from gui.dialogs import AddPasswordDialog
+from gui.progress import ProgressDialog
 from gui.styles import apply_styles
-import gui.dialogs as dialogs
+from storage.vault import VaultStore
+from utils.metrics import Metrics
+from utils.tasks import TaskRunner
+# Only what the login screen needs is imported up front. cryptography,
+# the storage backends, dialogs and the import, export and backup code
+# load where they are first used.
 
 class PasswordManager:
-    def __init__(self):
+    def __init__(self, storage_mode="journal", save_delay=0.5, virtual_list=True,
+                 watch_interval=1.0, profile_file=None):
         self.root = ThemedTk(theme="arc")  # Modern theme
         self.root.title("Secure Password Manager")
         self.root.geometry("800x600")
@@ -22,45 +21,171 @@ class PasswordManager:
         # Apply styles
         apply_styles()
         
-        # Initialize encryption key
-        self.key = None
-        self.fernet = None
+        # Keys, entries, search and backups, this class only adds the window.
+        # The vault itself is only read once the master password is known
+        self.vault = VaultStore(storage_mode, save_delay=save_delay,
+                                metrics=Metrics(enabled=bool(profile_file)))
+        # Where the session's timings are written on exit, None for nowhere.
+        # Recording starts right away when set, else from the Settings tab
+        self.profile_file = profile_file
+        self.rotation = None  # task of a running data key rotation
         self.is_encrypted = True
-        
-        # Load or create data file
-        self.data_file = "passwords.json"
-        self.load_data()
+        # Virtual mode only materializes the rows in view, the default for
+        # very large vaults; otherwise each entry keeps its own row
+        self.virtual_list = virtual_list
+        self.search_limit = 100
+        self.indexing = None  # task building the search index
+        self.showing_all = False  # every entry is listed, not search results
+        # Slow work runs here so the window keeps responding
+        self.tasks = TaskRunner(self.root)
+        # Seconds between checks for changes saved by other processes
+        # (another window or a script), None to never look
+        self.watch_interval = watch_interval
+        self.watching = False
         
         self.setup_gui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # Disable password and settings tabs until login
         self.notebook.tab(1, state="disabled")
         self.notebook.tab(2, state="disabled")
+        self.schedule_cache_purge()
     
     def load_data(self):
-        if os.path.exists(self.data_file):
+        """Open the vault and start watching it for changes, once per run"""
+        self.vault.open()
+        if self.watch_interval and not self.watching:
+            self.watching = True
+            self.schedule_vault_watch()
+    
+    def run_task(self, title, work, *args, on_done=None, on_error=None,
+                 on_finish=None, resources=("vault",)):
+        """Run work(task, *args) in the background behind a progress dialog"""
+        dialog = ProgressDialog(self.root, title)
+        
+        def finished():
+            dialog.close()
+            if on_finish:
+                on_finish()
+        
+        dialog.task = self.tasks.submit(
+            work, *args, resources=resources, on_done=on_done,
+            on_error=on_error, on_progress=dialog.update, on_finish=finished)
+        return dialog.task
+    
+    def vault_busy(self):
+        """Refuse vault changes while a background task is using the vault"""
+        if self.tasks.busy("vault"):
+            messagebox.showinfo("Please wait",
+                                "Another operation is still running on the vault.")
+            return True
+        return False
+    
+    def keys_changed(self, error):
+        """Another window changed the vault keys under an operation"""
+        if not self.vault.unlocked:
+            self.lock()
+        messagebox.showerror("Error", str(error))
+    
+    def retune_kdf(self, master_password):
+        """Re-calibrate key derivation for this machine with the password
+        just entered, so the user never has to type it again for this"""
+        from storage.vault import KeysChangedError
+        
+        def finish(result):
             try:
-                with open(self.data_file, 'r') as f:
-                    self.passwords = json.load(f)
-            except:
-                self.passwords = {}
-        else:
-            self.passwords = {}
-    
-    def save_data(self):
-        with open(self.data_file, 'w') as f:
-            json.dump(self.passwords, f)
-    
-    def generate_key(self, master_password):
-        salt = b'salt_'  # In production, use a random salt
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-        )
-        key = base64.urlsafe_b64encode(kdf.derive(master_password.encode()))
-        return key
+                self.vault.rewrap(*result)
+            except KeysChangedError as e:
+                self.keys_changed(e)
+        
+        self.run_task("Tuning unlock speed",
+                      lambda task: self.vault.tuned_key(master_password),
+                      on_done=finish,
+                      on_error=lambda e: messagebox.showerror(
+                          "Error", f"Could not tune unlock speed: {e}"))
+    
+    def rotate_data_key(self):
+        """Re-encrypt every entry under a fresh random data key
+        
+        The work is spread over a process pool in the background and edits
+        stay possible meanwhile. Progress is checkpointed, so after a cancel
+        or a crash the next login resumes the rotation where it stopped.
+        """
+        if not self.vault.unlocked:
+            messagebox.showerror("Error", "Please login first")
+            return
+        if self.rotation is not None:
+            return
+        from storage.vault import KeysChangedError
+        try:
+            engine, snapshot = self.vault.rotation()
+        except KeysChangedError as e:
+            self.keys_changed(e)
+            return
+        
+        def work(task):
+            return engine.run(
+                ((account, data['password']) for account, data in snapshot.items()),
+                on_progress=task.report, cancelled=lambda: task.cancelled)
+        
+        def finished():
+            if self.rotation is task:
+                self.rotation = None
+        
+        def finish(tokens):
+            try:
+                self.vault.finish_rotation(engine, snapshot, tokens)
+            except KeysChangedError as e:
+                self.keys_changed(e)
+        
+        task = self.run_task(
+            "Rotating data key", work, on_done=finish,
+            on_finish=finished,
+            on_error=lambda e: messagebox.showerror(
+                "Error", f"Data key rotation stopped: {e}"),
+            resources=("rotation",))
+        self.rotation = task
+    
+    def seal_vault(self):
+        """Encrypt account names and usernames too, searched by blind index"""
+        if not self.vault.unlocked:
+            messagebox.showerror("Error", "Please login first")
+            return
+        if self.vault.sealed:
+            messagebox.showinfo("Encrypt Account Names",
+                                "Account names are already encrypted.")
+            return
+        if self.rotation is not None or self.vault_busy():
+            return
+        if not messagebox.askyesno(
+                "Encrypt Account Names",
+                "Encrypt account names and usernames as well?\n\n"
+                "Search then finds text contained in names, but no longer "
+                "forgives typos. This cannot be undone."):
+            return
+        from storage.vault import KeysChangedError
+        try:
+            sealer, snapshot = self.vault.sealing()
+        except KeysChangedError as e:
+            self.keys_changed(e)
+            return
+        generation = self.vault.header_generation
+        
+        def finished(sealed):
+            try:
+                self.vault.finish_sealing(sealed, generation)
+            except KeysChangedError as e:
+                self.keys_changed(e)
+                return
+            self.refresh_password_list()
+        
+        self.run_task("Encrypting account names",
+                      lambda task: self.vault.seal_entries(
+                          sealer, snapshot, on_progress=task.report,
+                          cancelled=lambda: task.cancelled),
+                      on_done=finished,
+                      on_error=lambda e: messagebox.showerror(
+                          "Error", f"Could not encrypt account names: {e}"))
     
     def setup_gui(self):
         # Create notebook for multiple pages
@@ -78,8 +203,18 @@ class PasswordManager:
         self.notebook.add(self.settings_frame, text="Settings")
         
         self.setup_login_page()
-        self.setup_passwords_page()
-        self.setup_settings_page()
+        # The other pages are filled in the first time they are shown
+        self.pending_pages = {str(self.passwords_frame): self.setup_passwords_page,
+                              str(self.settings_frame): self.setup_settings_page}
+        self.notebook.bind("<<NotebookTabChanged>>", self.build_selected_page)
+    
+    def build_page(self, frame):
+        setup = self.pending_pages.pop(str(frame), None)
+        if setup:
+            setup()
+    
+    def build_selected_page(self, event=None):
+        self.build_page(self.notebook.select())
     
     def setup_login_page(self):
         login_label = ttk.Label(self.login_frame, text="Master Password", font=("Helvetica", 14))
@@ -96,6 +231,9 @@ class PasswordManager:
         create_button.pack(pady=10)
     
     def setup_passwords_page(self):
+        from gui.tree_sync import TreeReconciler
+        from gui.virtual_list import VirtualTreeview
+        
         # Buttons frame
         buttons_frame = ttk.Frame(self.passwords_frame)
         buttons_frame.pack(fill="x", padx=5, pady=5)
@@ -106,14 +244,34 @@ class PasswordManager:
                   command=self.toggle_encryption).pack(side="left", padx=5)
         ttk.Button(buttons_frame, text="Export Passwords", 
                   command=self.export_passwords).pack(side="left", padx=5)
+        ttk.Button(buttons_frame, text="Import Passwords",
+                  command=self.import_passwords).pack(side="left", padx=5)
+        ttk.Button(buttons_frame, text="Lock", 
+                  command=self.lock).pack(side="right", padx=5)
         
         # Treeview for passwords
-        self.tree = ttk.Treeview(self.passwords_frame, columns=("Account", "Username", "Password"),
+        list_frame = ttk.Frame(self.passwords_frame)
+        list_frame.pack(pady=10, padx=10, fill="both", expand=True)
+        
+        self.tree = ttk.Treeview(list_frame, columns=("Account", "Username", "Password"),
                                 show="headings")
         self.tree.heading("Account", text="Account")
         self.tree.heading("Username", text="Username")
         self.tree.heading("Password", text="Password")
-        self.tree.pack(pady=10, padx=10, fill="both", expand=True)
+        scrollbar = ttk.Scrollbar(list_frame, orient="vertical")
+        scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+        
+        if self.virtual_list:
+            self.password_view = VirtualTreeview(self.tree, scrollbar,
+                                                 self.password_row)
+        else:
+            # One item per entry, updated in place as the vault changes
+            self.password_view = TreeReconciler(
+                self.tree, self.password_row,
+                exists=lambda account: account in self.vault.passwords)
+            scrollbar.configure(command=self.tree.yview)
+            self.tree.configure(yscrollcommand=scrollbar.set)
         
         # Search frame
         search_frame = ttk.Frame(self.passwords_frame)
@@ -134,9 +292,21 @@ class PasswordManager:
         ttk.Button(self.settings_frame, text="Change Master Password",
                   command=self.change_master_password).pack(pady=10)
         
+        ttk.Button(self.settings_frame, text="Rotate Data Key",
+                  command=self.rotate_data_key).pack(pady=10)
+        
+        ttk.Button(self.settings_frame, text="Encrypt Account Names",
+                  command=self.seal_vault).pack(pady=10)
+        
         ttk.Button(self.settings_frame, text="Backup Passwords",
                   command=self.backup_passwords).pack(pady=10)
         
+        ttk.Button(self.settings_frame, text="Manage Backups",
+                  command=self.manage_backups).pack(pady=10)
+        
+        ttk.Button(self.settings_frame, text="Performance",
+                  command=self.show_performance).pack(pady=10)
+        
         ttk.Button(self.settings_frame, text="Clear All Data",
                   command=self.clear_data).pack(pady=10)
     
@@ -145,26 +315,43 @@ class PasswordManager:
         if not master_password:
             messagebox.showerror("Error", "Please enter master password")
             return
-            
-        try:
-            self.key = self.generate_key(master_password)
-            self.fernet = Fernet(self.key)
-            # Verify the password by trying to decrypt something
-            for _, data in self.passwords.items():
-                self.fernet.decrypt(data['password'].encode())
-                break
-            # Enable tabs after successful login
-            self.notebook.tab(1, state="normal")
-            self.notebook.tab(2, state="normal")
-            self.refresh_password_list()
-            self.notebook.select(1)  # Switch to passwords tab
-        except:
+        
+        # Key derivation is deliberately slow, keep it off the Tk thread
+        self.run_task("Unlocking", lambda task, *args: self.vault.unlock(*args),
+                      master_password, self.vault.verification_sample(),
+                      self.vault.header,
+                      on_done=lambda result: self.finish_login(
+                          result, master_password),
+                      on_error=self.failed_login)
+    
+    def failed_login(self, error):
+        from cryptography.fernet import InvalidToken
+        if isinstance(error, InvalidToken):
             messagebox.showerror("Error", "Invalid master password!")
+        else:
+            messagebox.showerror("Error", f"Could not unlock: {error}")
+    
+    def finish_login(self, result, master_password):
+        key, params, elapsed = result
+        self.load_data()
+        self.vault.accept_key(key, params)
+        # Enable tabs after successful login
+        self.build_page(self.passwords_frame)
+        self.notebook.tab(1, state="normal")
+        self.notebook.tab(2, state="normal")
+        self.refresh_password_list()
+        self.notebook.select(1)  # Switch to passwords tab
+        self.build_search_index()
+        
+        if 'next_wrapped_key' in self.vault.header:
+            self.rotate_data_key()
+        if self.vault.needs_retune(params, elapsed):
+            self.retune_kdf(master_password)
     
     def create_master_password(self):
         dialog = tk.Toplevel(self.root)
         dialog.title("Create Master Password")
-        dialog.geometry("300x200")
+        dialog.geometry("300x230")
         
         ttk.Label(dialog, text="New Master Password:").pack(pady=5)
         password_entry = ttk.Entry(dialog, show="*")
@@ -174,6 +361,10 @@ class PasswordManager:
         confirm_entry = ttk.Entry(dialog, show="*")
         confirm_entry.pack(pady=5)
         
+        sealed_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(dialog, text="Encrypt account names too",
+                        variable=sealed_var).pack(pady=5)
+        
         def save_master():
             if password_entry.get() != confirm_entry.get():
                 messagebox.showerror("Error", "Passwords don't match!")
@@ -182,112 +373,391 @@ class PasswordManager:
                 messagebox.showerror("Error", "Password too short!")
                 return
                 
-            self.key = self.generate_key(password_entry.get())
-            self.fernet = Fernet(self.key)
-            dialog.destroy()
-            messagebox.showinfo("Success", "Master password created!")
+            def created(result):
+                from storage.vault import VaultExistsError
+                self.load_data()
+                try:
+                    self.vault.create(*result, sealed=sealed_var.get())
+                except VaultExistsError as e:
+                    messagebox.showerror("Error", str(e))
+                    return
+                dialog.destroy()
+                messagebox.showinfo("Success", "Master password created!")
+            
+            password = password_entry.get()
+            # New vaults get a random salt and costs tuned for this machine
+            self.run_task("Creating master password",
+                          lambda task: self.vault.new_master_key(password),
+                          on_done=created)
             
         ttk.Button(dialog, text="Save", command=save_master).pack(pady=20)
     
     def add_password_dialog(self):
+        from gui.dialogs import AddPasswordDialog
         dialog = AddPasswordDialog(self.root)
         self.root.wait_window(dialog.dialog)
         if dialog.result:
             self.add_password(dialog.result)
     
     def add_password(self, data):
-        if self.fernet:
-            encrypted_password = self.fernet.encrypt(
-                data['password'].encode()).decode()
-            self.passwords[data['account']] = {
-                'username': data['username'],
-                'password': encrypted_password
-            }
-            self.save_data()
-            self.refresh_password_list()
+        if self.vault_busy():
+            return
+        if self.vault.unlocked:
+            from storage.vault import KeysChangedError
+            try:
+                changes = self.vault.put(data['account'], data['username'],
+                                         data['password'])
+            except KeysChangedError as e:
+                self.keys_changed(e)
+                return
+            self.refresh_password_list(changes)
         else:
             messagebox.showerror("Error", "Please login first")
     
-    def refresh_password_list(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-            
-        for account, data in self.passwords.items():
-            password = data['password']
-            if not self.is_encrypted and self.fernet:
-                try:
-                    password = self.fernet.decrypt(
-                        password.encode()).decode()
-                except:
-                    password = "**Decryption Failed**"
-            
-            self.tree.insert('', 'end', values=(
-                account,
-                data['username'],
-                password if not self.is_encrypted else "********"
-            ))
+    def refresh_password_list(self, changes=None):
+        """List every entry, pass changes, {key: entry or None}, when only
+        those entries changed so only their rows are touched"""
+        with self.vault.metrics.span("refresh_password_list"):
+            if self.virtual_list:
+                # Only the rows in view exist, a new key list is all it takes
+                self.show_rows(list(self.vault.passwords))
+                return
+            if changes is None:
+                self.password_view.invalidate()
+            else:
+                self.password_view.apply_changes(changes)
+                if self.showing_all:
+                    return
+            self.show_rows(list(self.vault.passwords))
+            self.showing_all = True
+    
+    def show_rows(self, accounts, scroll_to_top=False):
+        """Display the given accounts, in order, in the password list"""
+        self.password_view.set_rows(accounts, scroll_to_top)
+    
+    def password_row(self, key):
+        data = self.vault.passwords[key]
+        account, username = self.vault.label(key, data)
+        return (account, username, self.display_password(key, data))
+    
+    def selected_account(self):
+        return self.password_view.selected_key
+    
+    def display_password(self, account, data):
+        """Text for the Password column, ciphertext is only read when shown"""
+        if self.is_encrypted:
+            return "********"
+        if not self.vault.unlocked:
+            return data['password']
+        try:
+            return self.vault.decrypt_password(account, data)
+        except:
+            return "**Decryption Failed**"
+    
+    def schedule_cache_purge(self):
+        """Drop expired plaintext even when nobody looks it up again"""
+        decrypted = self.vault.decrypted
+        decrypted.purge_expired()
+        self.root.after(int(decrypted.ttl * 1000), self.schedule_cache_purge)
+    
+    def schedule_vault_watch(self):
+        """Take in what other processes saved, entry by entry"""
+        import sqlite3
+        from storage.vault import KeysChangedError
+        try:
+            # Bulk work on the vault reconciles when it commits
+            if not self.tasks.busy("vault"):
+                self.apply_external_changes(self.vault.refresh())
+        except KeysChangedError as e:
+            self.keys_changed(e)
+        except (OSError, ValueError, sqlite3.Error):
+            pass  # e.g. a file mid-replace on some platforms, next tick
+        finally:
+            self.root.after(int(self.watch_interval * 1000),
+                            self.schedule_vault_watch)
+    
+    def apply_external_changes(self, changes):
+        if changes and self.vault.unlocked:
+            self.refresh_password_list(changes)
+    
+    def lock(self):
+        """Forget the key and every decrypted value until the next login"""
+        if self.rotation is not None:
+            # Picked up again after the next login
+            self.rotation.cancel()
+            self.rotation = None
+        self.vault.lock()
+        self.is_encrypted = True
+        self.password_view.reset()
+        self.showing_all = False
+        self.master_password_entry.delete(0, tk.END)
+        self.notebook.select(0)
+        self.notebook.tab(1, state="disabled")
+        self.notebook.tab(2, state="disabled")
     
     def toggle_encryption(self):
         self.is_encrypted = not self.is_encrypted
         self.refresh_password_list()
     
     def export_passwords(self):
-        if not self.fernet:
+        if not self.vault.unlocked:
             messagebox.showerror("Error", "Please login first")
             return
-            
-        filename = f"passwords_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        with open(filename, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['Account', 'Username', 'Password'])
-            
-            for account, data in self.passwords.items():
-                password = self.fernet.decrypt(
-                    data['password'].encode()).decode()
-                writer.writerow([account, data['username'], password])
-                
-        messagebox.showinfo("Success", f"Passwords exported to {filename}")
+        
+        from gui.dialogs import ExportDialog
+        dialog = ExportDialog(self.root, self.search_entry.get())
+        self.root.wait_window(dialog.dialog)
+        if not dialog.result:
+            return
+        
+        path = dialog.result['path']
+        self.run_task("Exporting passwords", self.write_export, dialog.result,
+                      list(self.vault.passwords.items()),
+                      on_done=lambda count: messagebox.showinfo(
+                          "Success", f"{count} passwords exported to {path}"),
+                      on_error=lambda e: messagebox.showerror(
+                          "Error", f"Export failed: {e}"))
+    
+    def write_export(self, task, options, entries):
+        # Worker thread, so no decrypt cache and no Tk calls here
+        return self.vault.export(options['path'], options['format'],
+                                 term=options['filter'],
+                                 passphrase=options['passphrase'],
+                                 entries=entries, on_progress=task.report,
+                                 cancelled=lambda: task.cancelled)
+    
+    def import_passwords(self):
+        if not self.vault.unlocked:
+            messagebox.showerror("Error", "Please login first")
+            return
+        if self.vault_busy():
+            return
+        
+        from gui.dialogs import ImportDialog
+        dialog = ImportDialog(self.root)
+        self.root.wait_window(dialog.dialog)
+        if not dialog.result:
+            return
+        
+        from storage.vault import KeysChangedError
+        try:
+            self.vault.sync_header()
+        except KeysChangedError as e:
+            self.keys_changed(e)
+            return
+        # Entries are encrypted under the keys of this header
+        generation = self.vault.header_generation
+        plan = self.vault.import_plan(dialog.result['policy'])
+        self.run_task("Importing passwords", self.read_import, dialog.result,
+                      plan,
+                      on_done=lambda entries: self.finish_import(
+                          entries, plan, generation),
+                      on_error=lambda e: messagebox.showerror(
+                          "Error", f"Import failed: {e}"))
+    
+    def read_import(self, task, options, plan):
+        # Worker thread: parse, validate and encrypt, but save nothing yet
+        return self.vault.read_import(options['path'], plan,
+                                      options['passphrase'],
+                                      on_progress=task.report,
+                                      cancelled=lambda: task.cancelled)
+    
+    def finish_import(self, entries, plan, header_generation):
+        # One save and one refresh for the whole import
+        from storage.vault import KeysChangedError
+        try:
+            changes = self.vault.put_entries(entries, header_generation)
+        except KeysChangedError as e:
+            self.keys_changed(e)
+            return
+        self.refresh_password_list(changes)
+        
+        stats = plan.stats
+        summary = (f"Imported {stats['imported']} of {stats['read']} rows.\n"
+                   f"Replaced: {stats['replaced']}, renamed: {stats['renamed']}, "
+                   f"skipped: {stats['skipped']}, duplicates: {stats['duplicates']}, "
+                   f"invalid: {stats['invalid']}")
+        if plan.errors:
+            summary += "\n\n" + "\n".join(plan.errors[:10])
+        messagebox.showinfo("Import finished", summary)
     
     def search_passwords(self, event=None):
-        search_term = self.search_entry.get().lower()
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-            
-        for account, data in self.passwords.items():
-            if search_term in account.lower() or \
-               search_term in data['username'].lower():
-                password = data['password']
-                if not self.is_encrypted and self.fernet:
-                    try:
-                        password = self.fernet.decrypt(
-                            password.encode()).decode()
-                    except:
-                        password = "**Decryption Failed**"
-                
-                self.tree.insert('', 'end', values=(
-                    account,
-                    data['username'],
-                    password if not self.is_encrypted else "********"
-                ))
+        search_term = self.search_entry.get()
+        with self.vault.metrics.span("search_passwords"):
+            if self.indexing is not None:
+                # Plain substring matches until the index is built
+                matches = [account for account, _
+                           in self.vault.scan(search_term)][:self.search_limit]
+            else:
+                # Fuzzy and ranked, only the best matches reach the Treeview
+                matches = self.vault.search(search_term, limit=self.search_limit)
+            self.show_rows(matches, scroll_to_top=True)
+            self.showing_all = False
+    
+    def build_search_index(self):
+        """Index a plain vault in the background, a large one would
+        otherwise freeze the window on the first keystroke"""
+        index = self.vault.search_index
+        if self.indexing is not None or self.vault.sealed or index.ready:
+            return
+        
+        # Entries are replaced, never mutated, so a shallow copy is a
+        # consistent snapshot even while the vault keeps changing
+        entries = dict(self.vault.passwords)
+        
+        def finished():
+            self.indexing = None
+        
+        self.indexing = self.tasks.submit(
+            lambda task, entries: self.vault.build_index(entries), entries,
+            resources=("index",),
+            on_done=lambda index: self.index_built(index, entries),
+            # Searching builds the index itself then
+            on_error=lambda e: None, on_finish=finished)
+    
+    def index_built(self, index, entries):
+        self.indexing = None
+        if self.vault.adopt_index(index, entries) and self.search_entry.get():
+            self.search_passwords()
     
     def backup_passwords(self):
-        if not self.fernet:
+        if not self.vault.unlocked:
             messagebox.showerror("Error", "Please login first")
             return
-            
-        backup_file = f"passwords_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(backup_file, 'w') as f:
-            json.dump(self.passwords, f)
-        messagebox.showinfo("Success", f"Backup created: {backup_file}")
+        
+        # Entries are replaced, never mutated, so a shallow copy is a
+        # consistent snapshot even while the vault keeps changing
+        self.run_task("Backing up passwords",
+                      lambda task, entries, header: self.vault.backup(entries, header),
+                      dict(self.vault.passwords), self.vault.header,
+                      resources=("backup",),
+                      on_done=self.backup_done,
+                      on_error=lambda e: messagebox.showerror(
+                          "Error", f"Backup failed: {e}"))
+    
+    def backup_done(self, manifest):
+        stats = manifest['stats']
+        messagebox.showinfo(
+            "Success",
+            f"Backup {manifest['id']} created: {manifest['entries']} passwords.\n"
+            f"{stats['new_chunks']} of {stats['chunks']} chunks changed, "
+            f"{stats['bytes_written'] / 1024:.1f} KB written "
+            f"in {stats['seconds'] * 1000:.0f} ms.")
+    
+    def manage_backups(self):
+        if not self.vault.unlocked:
+            messagebox.showerror("Error", "Please login first")
+            return
+        
+        from gui.dialogs import BackupDialog
+        from storage.archive import verify_archive
+        dialog = BackupDialog(self.root, self.vault.backups.snapshots())
+        self.root.wait_window(dialog.dialog)
+        if not dialog.result:
+            return
+        
+        action = dialog.result['action']
+        if action == 'archive':
+            path = dialog.result['path']
+            self.run_task("Writing backup archive", self.write_backup_archive,
+                          dialog.result, resources=("backup",),
+                          on_done=lambda stats: messagebox.showinfo(
+                              "Success", f"{stats['entries']} passwords archived to "
+                              f"{path} ({stats['bytes'] / 1024:.1f} KB, "
+                              f"{stats['raw_bytes'] / 1024:.1f} KB uncompressed)"),
+                          on_error=lambda e: messagebox.showerror(
+                              "Error", f"Archive failed: {e}"))
+        elif action == 'verify_archive':
+            self.run_task("Verifying backup archive",
+                          lambda task, path: verify_archive(path),
+                          dialog.result['path'], resources=(),
+                          on_done=self.archive_verified,
+                          on_error=lambda e: messagebox.showerror(
+                              "Error", f"The archive is damaged: {e}"))
+        elif action == 'restore_archive':
+            self.restore_backup(archive=dialog.result['path'])
+        elif action == 'prune':
+            self.run_task("Pruning backups", lambda task, keep: self.vault.backups.prune(keep),
+                          dialog.result['keep'], resources=("backup",),
+                          on_done=lambda result: messagebox.showinfo(
+                              "Success", f"Removed {result[0]} backups, "
+                              f"freed {result[1] / 1024:.1f} KB"),
+                          on_error=lambda e: messagebox.showerror(
+                              "Error", f"Pruning failed: {e}"))
+        else:
+            self.restore_backup(dialog.result['snapshot'])
+    
+    def write_backup_archive(self, task, options):
+        # Worker thread, the snapshot streams chunk by chunk into the archive
+        return self.vault.write_archive(
+            options['path'], options['snapshot'], options['compression'],
+            on_progress=task.report, cancelled=lambda: task.cancelled)
+    
+    def archive_verified(self, result):
+        if result['bad']:
+            messagebox.showerror(
+                "Error", f"{len(result['bad'])} of {result['blocks']} blocks "
+                "of the archive are damaged")
+            return
+        messagebox.showinfo(
+            "Success", f"All {result['blocks']} blocks ({result['entries']} "
+            f"passwords) are intact, checked in {result['seconds'] * 1000:.0f} ms")
+    
+    def restore_backup(self, snapshot_id=None, archive=None):
+        if self.vault_busy():
+            return
+        if not messagebox.askyesno(
+                "Confirm", "Replace the vault with this backup? Changes made "
+                "since it was taken will be lost."):
+            return
+        
+        if archive:
+            work, source = self.read_backup_archive, archive
+        else:
+            work, source = (lambda task, snapshot: self.vault.backups.restore(snapshot),
+                            snapshot_id)
+        self.run_task("Restoring backup", work, source,
+                      resources=("vault", "backup"),
+                      on_done=self.finish_restore,
+                      on_error=lambda e: messagebox.showerror(
+                          "Error", f"Restore failed: {e}"))
+    
+    def read_backup_archive(self, task, path):
+        return self.vault.read_archive(path, on_progress=task.report,
+                                       cancelled=lambda: task.cancelled)
+    
+    def finish_restore(self, result):
+        entries, _ = result
+        if not self.vault.restore(*result):
+            self.refresh_password_list()
+            messagebox.showinfo("Success", f"Restored {len(entries)} passwords")
+            return
+        
+        # Entries of the backup need the master password and data key of
+        # their time, so its header came back too and a new login is due
+        self.lock()
+        messagebox.showinfo(
+            "Success", f"Restored {len(entries)} passwords. Log in with the "
+            "master password that was in use when the backup was taken.")
+    
+    def show_performance(self):
+        from gui.dialogs import PerformanceDialog
+        PerformanceDialog(self.root, self.vault.metrics, self.vault.decrypted)
     
     def clear_data(self):
-        if messagebox.askyesno("Confirm", "Are you sure? This will delete all passwords!"):
-            self.passwords = {}
-            self.save_data()
+        if self.vault_busy():
+            return
+        if messagebox.askyesno("Confirm", "Are you sure? This will delete all passwords and their history!"):
+            from storage.vault import KeysChangedError
+            try:
+                self.vault.clear()
+            except KeysChangedError as e:
+                self.keys_changed(e)
+                return
             self.refresh_password_list()
     
     def change_master_password(self):
-        if not self.fernet:
+        if not self.vault.unlocked:
             messagebox.showerror("Error", "Please login first")
             return
         
@@ -315,39 +785,39 @@ class PasswordManager:
                 messagebox.showerror("Error", "Password too short!")
                 return
             
-            # Verify current password
-            try:
-                test_key = self.generate_key(current_password.get())
-                test_fernet = Fernet(test_key)
-                # Try to decrypt something to verify the password
-                for _, data in self.passwords.items():
-                    test_fernet.decrypt(data['password'].encode())
-                    break
-            except:
-                messagebox.showerror("Error", "Current password is incorrect!")
+            if self.vault_busy():
                 return
             
-            # Re-encrypt all passwords with new key
-            new_key = self.generate_key(new_password.get())
-            new_fernet = Fernet(new_key)
-            
-            for account in self.passwords:
-                decrypted = self.fernet.decrypt(
-                    self.passwords[account]['password'].encode()).decode()
-                self.passwords[account]['password'] = new_fernet.encrypt(
-                    decrypted.encode()).decode()
-            
-            self.key = new_key
-            self.fernet = new_fernet
-            self.save_data()
+            # Only the data key gets re-wrapped, no entry is re-encrypted
+            self.run_task("Changing master password",
+                          lambda task, *args: self.vault.derive_new_master_key(*args),
+                          current_password.get(), new_password.get(),
+                          self.vault.verification_sample(), self.vault.header,
+                          on_done=finish_change, on_error=failed_change)
+        
+        def finish_change(result):
+            from storage.vault import KeysChangedError
+            try:
+                self.vault.rewrap(*result)
+            except KeysChangedError as e:
+                dialog.destroy()
+                self.keys_changed(e)
+                return
             dialog.destroy()
             messagebox.showinfo("Success", "Master password changed successfully!")
         
+        def failed_change(error):
+            from cryptography.fernet import InvalidToken
+            if isinstance(error, InvalidToken):
+                messagebox.showerror("Error", "Current password is incorrect!")
+            else:
+                messagebox.showerror("Error", f"Could not change password: {error}")
+        
         ttk.Button(dialog, text="Change Password", 
                    command=change_password).pack(pady=20)
     
     def show_context_menu(self, event):
-        if not self.tree.selection():
+        if self.selected_account() is None:
             return
         
         menu = tk.Menu(self.root, tearoff=0)
@@ -356,56 +826,103 @@ class PasswordManager:
         menu.add_command(label="Copy Password", 
                         command=lambda: self.copy_to_clipboard("password"))
         menu.add_command(label="Edit", command=self.edit_password)
+        menu.add_command(label="History", command=self.show_history)
         menu.add_command(label="Delete", command=self.delete_password)
         
         menu.tk_popup(event.x_root, event.y_root)
     
     def copy_to_clipboard(self, field):
-        selection = self.tree.selection()[0]
-        item = self.tree.item(selection)
-        value = item['values'][1 if field == "username" else 2]
+        key = self.selected_account()
+        data = self.vault.passwords[key]
         
-        if field == "password" and self.is_encrypted:
-            encrypted = self.passwords[item['values'][0]]['password']
-            value = self.fernet.decrypt(encrypted.encode()).decode()
+        if field == "username":
+            value = self.vault.label(key, data)[1]
+        else:
+            value = self.vault.decrypt_password(key, data)
         
         self.root.clipboard_clear()
         self.root.clipboard_append(value)
         messagebox.showinfo("Success", f"{field.title()} copied to clipboard!")
     
     def edit_password(self):
-        selection = self.tree.selection()[0]
-        item = self.tree.item(selection)
-        account = item['values'][0]
+        if self.vault_busy():
+            return
+        key = self.selected_account()
+        account, username = self.vault.label(key)
         
+        from gui.dialogs import AddPasswordDialog
         dialog = AddPasswordDialog(self.root)
         dialog.account_entry.insert(0, account)
-        dialog.username_entry.insert(0, self.passwords[account]['username'])
+        dialog.username_entry.insert(0, username)
         if not self.is_encrypted:
-            decrypted = self.fernet.decrypt(
-                self.passwords[account]['password'].encode()).decode()
+            decrypted = self.vault.decrypt_password(key)
             dialog.password_entry.insert(0, decrypted)
         
         self.root.wait_window(dialog.dialog)
         if dialog.result:
             self.add_password(dialog.result)
     
+    def show_history(self):
+        """Earlier versions of the selected entry, one can be restored"""
+        from storage.vault import KeysChangedError
+        account = self.vault.label(self.selected_account())[0]
+        try:
+            versions = self.vault.versions(account)
+        except KeysChangedError as e:
+            self.keys_changed(e)
+            return
+        if not versions:
+            messagebox.showinfo("History", f"No earlier versions of {account}.")
+            return
+        
+        from gui.dialogs import HistoryDialog
+        dialog = HistoryDialog(self.root, account, versions)
+        self.root.wait_window(dialog.dialog)
+        if dialog.result is None or self.vault_busy():
+            return
+        # The version it replaces goes into the history in turn
+        try:
+            changes = self.vault.restore_version(account, dialog.result)
+        except KeysChangedError as e:
+            self.keys_changed(e)
+            return
+        self.refresh_password_list(changes)
+        messagebox.showinfo("Success", f"Earlier version of {account} restored!")
+    
     def delete_password(self):
+        if self.vault_busy():
+            return
         if not messagebox.askyesno("Confirm", "Are you sure you want to delete this password?"):
             return
         
-        selection = self.tree.selection()[0]
-        item = self.tree.item(selection)
-        account = item['values'][0]
-        
-        del self.passwords[account]
-        self.save_data()
-        self.refresh_password_list()
+        from storage.vault import KeysChangedError
+        account = self.selected_account()
+        try:
+            changes = self.vault.delete(account)
+        except KeysChangedError as e:
+            self.keys_changed(e)
+            return
+        self.refresh_password_list(changes)
+    
+    def on_close(self):
+        import sqlite3
+        self.tasks.shutdown()
+        try:
+            self.vault.close()
+        except (OSError, sqlite3.Error) as e:
+            messagebox.showerror("Error", f"Could not save passwords: {e}")
+        if self.profile_file:
+            try:
+                self.vault.metrics.dump(self.profile_file)
+            except OSError as e:
+                messagebox.showerror("Error", f"Could not save timings: {e}")
+        self.root.destroy()
     
     def run(self):
         self.root.mainloop()
 
 if __name__ == "__main__":
-    app = PasswordManager()
+    # PM_PROFILE=perf.json records where time goes and saves it on exit
+    app = PasswordManager(profile_file=os.environ.get("PM_PROFILE"))
     app.run()
 
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import lzma
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from utils.pool import usable_cpus
+
+ARCHIVE_MAGIC = b"PWBACKUP 1\n"
+# Compressed size, rows in the block, SHA-256 of the compressed bytes.
+# A block with size 0 ends the archive: its rows are the total and its
+# digest covers every block digest, so a truncated archive is caught too.
+BLOCK = struct.Struct(">II32s")
+
+COMPRESSORS = {
+    'zlib': (lambda data: zlib.compress(data, 6), zlib.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+}
+
+
+class ArchiveCancelled(Exception):
+    pass
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def write_archive(f, entries, header=None, compression='zlib', block_size=1000,
+                  total=None, on_progress=None, cancelled=None):
+    """Stream (account, entry) pairs into the binary file f as an archive
+
+    Entries stay encrypted, blocks of block_size rows are compressed one
+    at a time and checksummed. Returns the archive's stats.
+    """
+    if compression not in COMPRESSORS:
+        raise ArchiveError(f"Unknown compression: {compression}")
+    compress = COMPRESSORS[compression][0]
+    f.write(ARCHIVE_MAGIC)
+    meta = {'compression': compression,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'header': header}
+    f.write(json.dumps(meta).encode() + b"\n")
+
+    digests = []
+    stats = {'entries': 0, 'blocks': 0, 'raw_bytes': 0, 'bytes': 0}
+
+    def flush(rows):
+        raw = json.dumps(rows).encode()
+        data = compress(raw)
+        digest = hashlib.sha256(data).digest()
+        f.write(BLOCK.pack(len(data), len(rows), digest))
+        f.write(data)
+        digests.append(digest)
+        stats['entries'] += len(rows)
+        stats['blocks'] += 1
+        stats['raw_bytes'] += len(raw)
+        stats['bytes'] += BLOCK.size + len(data)
+        if on_progress:
+            on_progress(stats['entries'], total)
+
+    rows = []
+    for account, entry in entries:
+        rows.append([account, entry['username'], entry['password']])
+        if len(rows) >= block_size:
+            if cancelled and cancelled():
+                raise ArchiveCancelled()
+            flush(rows)
+            rows = []
+    if rows:
+        flush(rows)
+    f.write(BLOCK.pack(0, stats['entries'], _seal(digests)))
+    return stats
+
+
+def _seal(digests):
+    return hashlib.sha256(b"".join(digests)).digest()
+
+
+def read_meta(f):
+    """Check the magic of an open archive and return its metadata line"""
+    if f.readline() != ARCHIVE_MAGIC:
+        raise ArchiveError("Not a password backup archive")
+    try:
+        meta = json.loads(f.readline())
+    except ValueError:
+        raise ArchiveError("The archive header is damaged") from None
+    if meta.get('compression') not in COMPRESSORS:
+        raise ArchiveError(f"Unknown compression: {meta.get('compression')}")
+    return meta
+
+
+def scan_blocks(f):
+    """(offset, size, rows, digest) of every block, payloads are skipped
+
+    Checks the structure only: a missing end marker, a short block or a
+    row count or digest list that does not add up raises ArchiveError.
+    """
+    blocks = []
+    rows = 0
+    while True:
+        head = f.read(BLOCK.size)
+        if len(head) < BLOCK.size:
+            raise ArchiveError("The archive is truncated")
+        size, count, digest = BLOCK.unpack(head)
+        if size == 0:
+            if count != rows or digest != _seal([block[3] for block in blocks]):
+                raise ArchiveError("The archive is incomplete")
+            return blocks
+        offset = f.tell()
+        f.seek(size, os.SEEK_CUR)
+        if f.tell() > os.fstat(f.fileno()).st_size:
+            raise ArchiveError("The archive is truncated")
+        blocks.append((offset, size, count, digest))
+        rows += count
+
+
+def _check_blocks(path, blocks):
+    # Thread pool worker. hashlib drops the GIL on large buffers, so
+    # threads hash in parallel without the cost of spawning processes.
+    bad = []
+    with open(path, 'rb') as f:
+        for index, (offset, size, _, digest) in blocks:
+            f.seek(offset)
+            if hashlib.sha256(f.read(size)).digest() != digest:
+                bad.append(index)
+    return bad
+
+
+def verify_archive(path, workers=None, batch_blocks=64):
+    """Check every block checksum in parallel, nothing is decrypted
+
+    Returns {'blocks', 'entries', 'bad', 'seconds'} where bad lists the
+    indexes of damaged blocks. Structural damage raises ArchiveError.
+    """
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        read_meta(f)
+        blocks = scan_blocks(f)
+    indexed = list(enumerate(blocks))
+    batches = [indexed[i:i + batch_blocks]
+               for i in range(0, len(indexed), batch_blocks)]
+    bad = []
+    with ThreadPoolExecutor(max_workers=workers or usable_cpus()) as pool:
+        for damaged in pool.map(lambda batch: _check_blocks(path, batch), batches):
+            bad.extend(damaged)
+    return {'blocks': len(blocks), 'entries': sum(block[2] for block in blocks),
+            'bad': bad, 'seconds': time.perf_counter() - start}
+
+
+def read_archive(path, on_progress=None, cancelled=None):
+    """Yield (account, entry) pairs block by block, checking each checksum
+
+    Only one block is decompressed at a time. Damage raises ArchiveError
+    before the entries of the damaged block are yielded.
+    """
+    with open(path, 'rb') as f:
+        meta = read_meta(f)
+        decompress = COMPRESSORS[meta['compression']][1]
+        blocks = scan_blocks(f)
+        total = sum(block[2] for block in blocks)
+        done = 0
+        for index, (offset, size, count, digest) in enumerate(blocks):
+            if cancelled and cancelled():
+                raise ArchiveCancelled()
+            f.seek(offset)
+            data = f.read(size)
+            if hashlib.sha256(data).digest() != digest:
+                raise ArchiveError(f"Block {index} of the archive is damaged")
+            rows = json.loads(decompress(data))
+            if len(rows) != count:
+                raise ArchiveError(f"Block {index} of the archive is damaged")
+            for account, username, password in rows:
+                yield account, {'username': username, 'password': password}
+            done += count
+            if on_progress:
+                on_progress(done, total)
+
+
+def archive_header(path):
+    """Vault header stored in the archive, None for a legacy vault"""
+    with open(path, 'rb') as f:
+        return read_meta(f)['header']
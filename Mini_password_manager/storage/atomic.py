@@ -0,0 +1,40 @@
+import json
+import os
+import tempfile
+
+
+def atomic_write(path, write, mode='w', newline=None):
+    """Call write(f) on a temp file and rename it over path once it is synced
+
+    Readers see either the old or the new file, never a partial one.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, mode, newline=newline) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    fsync_directory(directory)
+
+
+def atomic_write_json(path, data):
+    """Write data as JSON so readers see either the old or the new file"""
+    atomic_write(path, lambda f: json.dump(data, f))
+
+
+def fsync_directory(directory):
+    """Make a rename inside directory durable, where the OS supports it"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
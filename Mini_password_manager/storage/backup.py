@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import time
+import zlib
+from datetime import datetime
+
+from storage.atomic import atomic_write, atomic_write_json
+
+
+class BackupError(Exception):
+    pass
+
+
+def is_boundary(account, chunk_bits):
+    """Whether a chunk ends after account, decided by the account alone
+
+    Boundaries depend on content rather than position, so adding or
+    removing an entry only changes the chunk it lands in.
+    """
+    digest = hashlib.sha1(account.encode()).digest()
+    return int.from_bytes(digest[:4], 'big') >> (32 - chunk_bits) == 0
+
+
+class BackupStore:
+    """Deduplicated, incremental vault snapshots.
+
+    A snapshot splits the vault into content-defined chunks of about
+    2 ** chunk_bits entries and stores each chunk once, zlib-compressed,
+    under its SHA-256 in ``objects/``. The per-snapshot manifest in ``snapshots/`` lists the
+    chunk hashes and the vault header, so a snapshot of a vault where a
+    few entries changed only writes the few chunks holding them.
+
+    Entries are replaced, never mutated, so a chunk whose entries are the
+    very same objects as last time is known unchanged without serializing
+    it again.
+    """
+
+    def __init__(self, directory, chunk_bits=6):
+        self.directory = directory
+        self.chunk_bits = chunk_bits
+        self.objects_dir = os.path.join(directory, "objects")
+        self.snapshots_dir = os.path.join(directory, "snapshots")
+        # first account of a chunk -> (entries tuple, chunk hash)
+        self._chunk_cache = {}
+
+    def snapshot(self, passwords, header=None):
+        """Back up passwords (and the vault header), returns the manifest"""
+        start = time.perf_counter()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+
+        chunks = []
+        new_chunks = 0
+        bytes_written = 0
+        cache = {}
+        for chunk in self._split(passwords.items()):
+            first = chunk[0][0]
+            cached = self._chunk_cache.get(first)
+            if cached is not None and _same_entries(cached[0], chunk):
+                digest = cached[1]
+            else:
+                data = json.dumps([[account, entry['username'], entry['password']]
+                                   for account, entry in chunk]).encode()
+                digest = hashlib.sha256(data).hexdigest()
+                if not os.path.exists(self._object_path(digest)):
+                    new_chunks += 1
+                    bytes_written += self._write_object(digest, data)
+            cache[first] = (chunk, digest)
+            chunks.append(digest)
+        self._chunk_cache = cache
+
+        now = datetime.now()
+        manifest = {
+            'id': now.strftime("%Y%m%dT%H%M%S%f"),
+            'created': now.isoformat(timespec='seconds'),
+            'entries': len(passwords),
+            'chunks': chunks,
+            'header': header,
+        }
+        manifest['stats'] = {
+            'chunks': len(chunks),
+            'new_chunks': new_chunks,
+            'bytes_written': bytes_written,
+            'seconds': time.perf_counter() - start,
+        }
+        atomic_write_json(self._manifest_path(manifest['id']), manifest)
+        return manifest
+
+    def snapshots(self):
+        """Every manifest, oldest first"""
+        if not os.path.isdir(self.snapshots_dir):
+            return []
+        manifests = []
+        for name in sorted(os.listdir(self.snapshots_dir)):
+            if name.endswith(".json"):
+                manifests.append(self.manifest(name[:-len(".json")]))
+        return manifests
+
+    def manifest(self, snapshot_id):
+        path = self._manifest_path(snapshot_id)
+        if not os.path.exists(path):
+            raise BackupError(f"No backup snapshot {snapshot_id}")
+        with open(path) as f:
+            return json.load(f)
+
+    def iter_entries(self, snapshot_id):
+        """Yield (account, entry) pairs of a snapshot, one chunk at a time"""
+        for digest in self.manifest(snapshot_id)['chunks']:
+            for account, username, password in json.loads(self._read_object(digest)):
+                yield account, {'username': username, 'password': password}
+
+    def restore(self, snapshot_id):
+        """The passwords dict and vault header a snapshot was taken of"""
+        return dict(self.iter_entries(snapshot_id)), self.manifest(snapshot_id)['header']
+
+    def prune(self, keep):
+        """Delete all but the newest keep snapshots and chunks nobody uses
+
+        Returns (snapshots removed, bytes freed).
+        """
+        manifests = self.snapshots()
+        doomed = manifests[:max(0, len(manifests) - keep)]
+        for manifest in doomed:
+            os.remove(self._manifest_path(manifest['id']))
+
+        # Manifests go first, so a crash here only leaves unused chunks
+        live = {digest for manifest in manifests[len(doomed):]
+                for digest in manifest['chunks']}
+        freed = 0
+        for digest in self._object_digests():
+            if digest not in live:
+                path = self._object_path(digest)
+                freed += os.path.getsize(path)
+                os.remove(path)
+        self._chunk_cache = {first: cached for first, cached
+                             in self._chunk_cache.items() if cached[1] in live}
+        return len(doomed), freed
+
+    def size(self):
+        """Bytes used by every chunk and manifest"""
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        return total
+
+    def _split(self, items):
+        chunk = []
+        for account, entry in items:
+            chunk.append((account, entry))
+            if is_boundary(account, self.chunk_bits):
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def _manifest_path(self, snapshot_id):
+        return os.path.join(self.snapshots_dir, snapshot_id + ".json")
+
+    def _write_object(self, digest, data):
+        # Chunks are addressed by their plain bytes and stored compressed
+        path = self._object_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = zlib.compress(data, 6)
+        atomic_write(path, lambda f: f.write(compressed), mode='wb')
+        return len(compressed)
+
+    def _read_object(self, digest):
+        with open(self._object_path(digest), 'rb') as f:
+            compressed = f.read()
+        try:
+            data = zlib.decompress(compressed)
+        except zlib.error:
+            data = b""
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise BackupError(f"Backup chunk {digest} is corrupted")
+        return data
+
+    def _object_digests(self):
+        if not os.path.isdir(self.objects_dir):
+            return
+        for prefix in os.listdir(self.objects_dir):
+            for rest in os.listdir(os.path.join(self.objects_dir, prefix)):
+                if not rest.endswith(".tmp"):
+                    yield prefix + rest
+
+
+def _same_entries(cached, chunk):
+    return len(cached) == len(chunk) and all(
+        account == cached_account and entry is cached_entry
+        for (account, entry), (cached_account, cached_entry) in zip(chunk, cached))
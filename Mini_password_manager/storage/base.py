@@ -0,0 +1,164 @@
+from storage.lock import VaultLock
+from storage.merge import diff, merge_vaults
+from storage.writer import CoalescingWriter
+
+
+class StorageBackend:
+    """Interface implemented by every vault storage mode.
+
+    ``load`` returns the dict the app works on. The backend keeps a
+    reference to that dict and mirrors every change made through ``put``,
+    ``delete`` and ``clear`` to disk, so callers never mutate it directly.
+    """
+
+    def __init__(self, data_file):
+        self.data_file = data_file
+        self.passwords = {}
+        # Shared with every process that opens the same vault
+        self.lock = VaultLock(data_file + ".lock")
+        # Vault generation the dict reflects
+        self.generation = 0
+
+    def load(self):
+        raise NotImplementedError
+
+    def put(self, account, entry):
+        """Add or replace a single entry"""
+        raise NotImplementedError
+
+    def put_many(self, entries):
+        """Add or replace several entries with as few disk writes as possible"""
+        for account, entry in entries.items():
+            self.put(account, entry)
+
+    def delete(self, account):
+        """Remove a single entry"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Remove every entry"""
+        raise NotImplementedError
+
+    def rewrite(self):
+        """Persist the whole vault, e.g. after every entry was re-keyed"""
+        raise NotImplementedError
+
+    def search(self, term):
+        """Return (account, entry) pairs whose account or username contains term"""
+        term = term.lower()
+        return [(account, data) for account, data in self.passwords.items()
+                if term in account.lower() or term in data['username'].lower()]
+
+    def refresh(self):
+        """Take in the changes other processes saved since the last refresh
+
+        Returns {account: entry, or None when removed} for every change
+        that reached the dict, so callers can update their views of it.
+        """
+        return {}
+
+    def flush(self):
+        """Block until every change has reached the disk"""
+
+    def close(self):
+        self.flush()
+
+
+class WholeFileStore(StorageBackend):
+    """Backend that saves the whole vault as one file on every change.
+
+    Saves run on a background writer and never clobber another process:
+    when the vault generation moved since the dict was last in sync, the
+    file is read back and three-way merged with the change before it is
+    replaced. Subclasses only provide ``read`` and ``write``.
+    """
+
+    def __init__(self, data_file, save_delay=0.5):
+        super().__init__(data_file)
+        # (generation, vault as it was on disk then) of the last sync
+        self._synced = (0, {})
+        # account -> (entry a merge replaced, merged entry) for refresh
+        self._external = {}
+        # Full-vault saves run on a background thread, bursts are merged
+        self.writer = CoalescingWriter(self._save, delay=save_delay)
+
+    def read(self):
+        """The vault as saved on disk"""
+        raise NotImplementedError
+
+    def write(self, passwords):
+        raise NotImplementedError
+
+    def load(self):
+        with self.lock:
+            self.passwords = self.read()
+            self.generation = self.lock.generation()
+            self._synced = (self.generation, dict(self.passwords))
+        return self.passwords
+
+    def put(self, account, entry):
+        self.passwords[account] = entry
+        self.rewrite()
+
+    def put_many(self, entries):
+        self.passwords.update(entries)
+        self.rewrite()
+
+    def delete(self, account):
+        del self.passwords[account]
+        self.rewrite()
+
+    def clear(self):
+        self.passwords.clear()
+        self.rewrite()
+
+    def rewrite(self):
+        # Entries are replaced, never mutated, so a shallow copy is enough
+        generation, base = self._synced
+        self.writer.submit((generation, base, dict(self.passwords)))
+
+    def refresh(self):
+        # Cheap enough to poll: one small read when nothing changed
+        if self.lock.generation() == self.generation and not self._external:
+            return {}
+        changes = {}
+        with self.lock:
+            external, self._external = self._external, {}
+            for account, (replaced, entry) in external.items():
+                if self.passwords.get(account) is replaced:
+                    changes[account] = entry
+
+            generation = self.lock.generation()
+            if generation != self.generation:
+                theirs = self.read()
+                merged = merge_vaults(self._synced[1], self.passwords, theirs)
+                changes.update(diff(self.passwords, merged))
+                self.generation = generation
+                self._synced = (generation, theirs)
+
+            for account, entry in changes.items():
+                if entry is None:
+                    self.passwords.pop(account, None)
+                else:
+                    self.passwords[account] = entry
+        return changes
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+
+    def _save(self, payload):
+        # Writer thread. base is the disk state snapshot was made from.
+        generation, base, snapshot = payload
+        with self.lock:
+            if self.lock.generation() != generation:
+                merged = merge_vaults(base, snapshot, self.read())
+                for account, entry in diff(snapshot, merged).items():
+                    replaced = self._external.get(account, (snapshot.get(account),))[0]
+                    self._external[account] = (replaced, entry)
+                snapshot = merged
+            self.write(snapshot)
+            self.generation = self.lock.bump()
+            self._synced = (self.generation, snapshot)
@@ -0,0 +1,207 @@
+"""Binary vault format with an offset index.
+
+Layout of a ``.vault`` file (integers are little-endian)::
+
+    header   magic "PWV1", version u16, flags u16, entry count u32,
+             accounts size u32, usernames size u32
+    index    accounts   UTF-8, NUL separated
+             usernames  UTF-8, NUL separated
+             offsets    u64 per entry, relative to the first blob
+             lengths    u32 per entry
+    blobs    raw (base64-decoded) Fernet tokens
+
+The file is mapped with ``mmap`` so opening a vault only parses the index.
+The index is stored column by column so it decodes in a handful of bulk
+operations. A token is sliced out of the mapping the first time an
+entry's password is read, which in practice means when it is revealed,
+copied or edited.
+"""
+import argparse
+import base64
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Mapping
+
+from storage.atomic import atomic_write
+from storage.base import WholeFileStore
+
+MAGIC = b'PWV1'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIII')
+SEPARATOR = '\0'
+
+
+class VaultFormatError(Exception):
+    pass
+
+
+class LazyEntry(Mapping):
+    """Vault entry whose ciphertext stays in the mapped file until read"""
+
+    __slots__ = ('username', '_buf', '_offset', '_length')
+
+    def __init__(self, username, buf, offset, length):
+        self.username = username
+        self._buf = buf
+        self._offset = offset
+        self._length = length
+
+    def __getitem__(self, key):
+        if key == 'username':
+            return self.username
+        if key == 'password':
+            return base64.urlsafe_b64encode(self.token()).decode()
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(('username', 'password'))
+
+    def __len__(self):
+        return 2
+
+    def token(self):
+        """Raw Fernet token bytes"""
+        return self._buf[self._offset:self._offset + self._length]
+
+
+def entry_token(entry):
+    if isinstance(entry, LazyEntry):
+        return entry.token()
+    return base64.urlsafe_b64decode(entry['password'])
+
+
+def _column(typecode, data):
+    column = array(typecode)
+    column.frombytes(data)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+
+def _split(data, count):
+    return data.decode().split(SEPARATOR) if count else []
+
+
+def read_vault(path):
+    """Map a vault file and return {account: LazyEntry} from its index"""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return {}
+
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(buf) < HEADER.size:
+        raise VaultFormatError("file too short")
+    magic, version, _, count, accounts_size, usernames_size = \
+        HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise VaultFormatError("not a vault file")
+    if version != VERSION:
+        raise VaultFormatError(f"unsupported vault version {version}")
+
+    pos = HEADER.size
+    accounts = _split(buf[pos:pos + accounts_size], count)
+    pos += accounts_size
+    usernames = _split(buf[pos:pos + usernames_size], count)
+    pos += usernames_size
+    offsets = _column('Q', buf[pos:pos + 8 * count])
+    pos += 8 * count
+    lengths = _column('I', buf[pos:pos + 4 * count])
+    pos += 4 * count
+    if len(accounts) != count or len(usernames) != count:
+        raise VaultFormatError("corrupt index")
+
+    blobs_start = pos
+    return {
+        account: LazyEntry(username, buf, blobs_start + offset, length)
+        for account, username, offset, length
+        in zip(accounts, usernames, offsets, lengths)
+    }
+
+
+def write_vault(path, passwords):
+    """Atomically write passwords (plain dicts or LazyEntry) as a vault file"""
+    accounts = []
+    usernames = []
+    offsets = array('Q')
+    lengths = array('I')
+    tokens = []
+    offset = 0
+    for account, entry in passwords.items():
+        if SEPARATOR in account or SEPARATOR in entry['username']:
+            raise ValueError("account and username may not contain NUL")
+        token = entry_token(entry)
+        accounts.append(account)
+        usernames.append(entry['username'])
+        offsets.append(offset)
+        lengths.append(len(token))
+        tokens.append(token)
+        offset += len(token)
+
+    accounts = SEPARATOR.join(accounts).encode()
+    usernames = SEPARATOR.join(usernames).encode()
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+        lengths.byteswap()
+
+    def write(f):
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(tokens),
+                            len(accounts), len(usernames)))
+        f.write(accounts)
+        f.write(usernames)
+        f.write(offsets.tobytes())
+        f.write(lengths.tobytes())
+        for token in tokens:
+            f.write(token)
+
+    atomic_write(path, write, mode='wb')
+
+
+def convert_json_vault(json_path, vault_path):
+    """Convert a passwords.json vault into the binary format"""
+    with open(json_path, 'r') as f:
+        passwords = json.load(f)
+    write_vault(vault_path, passwords)
+    return len(passwords)
+
+
+class BinaryStore(WholeFileStore):
+    """Vault storage in the binary format, saved by a background writer"""
+
+    def __init__(self, data_file, legacy_file=None, save_delay=0.5):
+        super().__init__(data_file, save_delay=save_delay)
+        self.legacy_file = legacy_file
+
+    def load(self):
+        """Read the index, converting a legacy JSON vault on first use"""
+        with self.lock:
+            if (not os.path.exists(self.data_file) and self.legacy_file
+                    and os.path.exists(self.legacy_file)):
+                convert_json_vault(self.legacy_file, self.data_file)
+            return super().load()
+
+    def read(self):
+        return read_vault(self.data_file)
+
+    def write(self, passwords):
+        # Lazy entries keep their mapping alive after the file is replaced
+        write_vault(self.data_file, passwords)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert a passwords.json vault to the binary format")
+    parser.add_argument('json_file', nargs='?', default='passwords.json')
+    parser.add_argument('vault_file', nargs='?', default='passwords.vault')
+    args = parser.parse_args()
+
+    count = convert_json_vault(args.json_file, args.vault_file)
+    print(f"Converted {count} entries to {args.vault_file}")
+
+
+if __name__ == '__main__':
+    main()
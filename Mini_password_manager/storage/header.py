@@ -0,0 +1,51 @@
+import json
+import os
+
+from storage.atomic import atomic_write_json
+
+# Version 2 added the key check, 3 the wrapped data key, and 4 sealed
+# entries, their index key and the wrapped key of the entry history.
+# Older programs must not touch a vault whose header they only half
+# understand
+HEADER_VERSION = 4
+# Headers are only stamped past this with a field that needs it, plain
+# vaults stay readable by programs that know version 3
+BASE_VERSION = 3
+# Optional field -> first version that knows it
+FIELD_VERSIONS = {'sealed': 4, 'wrapped_index_key': 4,
+                  'wrapped_history_key': 4}
+
+
+class HeaderError(Exception):
+    pass
+
+
+def new_header(kdf, vault_id, key_check, wrapped_key):
+    return {'version': BASE_VERSION, 'vault_id': vault_id, 'kdf': kdf,
+            'key_check': key_check, 'wrapped_key': wrapped_key}
+
+
+def load_header(path):
+    """Vault header dict, or None for a vault created before headers existed"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        header = json.load(f)
+    if header.get('version', 0) > HEADER_VERSION:
+        raise HeaderError(
+            f"Vault header version {header['version']} is newer than this "
+            f"program supports ({HEADER_VERSION})")
+    return header
+
+
+def required_version(header):
+    """Oldest version whose programs understand every field of header"""
+    return max([header.get('version', 0)] + [
+        version for field, version in FIELD_VERSIONS.items()
+        if field in header])
+
+
+def save_header(path, header):
+    """Write header, stamped with the version its fields need"""
+    header['version'] = required_version(header)
+    atomic_write_json(path, header)
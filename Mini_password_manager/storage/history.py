@@ -0,0 +1,220 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+from storage.atomic import atomic_write
+from storage.lock import VaultLock
+
+FIELDS = ('username', 'password')
+
+
+class HistoryStore:
+    """Past versions of every entry, kept as encrypted deltas.
+
+    Each time an entry is replaced or deleted, the version it had is
+    appended to one file as a line holding the entry id, the time it was
+    replaced and a Fernet token over only the fields that differ from the
+    entry's previous version. The oldest kept version of an entry holds
+    every field. Most edits change one field, so a version costs about
+    one small token, and nothing but the versions of one entry is ever
+    decrypted to show them.
+
+    Versions are encrypted with a key of their own, wrapped by the master
+    key in the header, so rotating the data key or sealing the vault
+    leaves them alone. Entry ids are HMACs of the account name under that
+    key, the file never holds a name. Its first line identifies the key;
+    a file written under another key, after a restore brought back an
+    older header, is started over.
+
+    Retention keeps the newest max_versions versions of each entry and
+    none older than max_age seconds. Reads apply it straight away, the
+    file is rewritten without the expired versions once compact_after of
+    them piled up. Processes sharing the vault take turns on a lock file
+    and read each other's appends before their own.
+    """
+
+    def __init__(self, path, key, max_versions=10, max_age=365 * 24 * 3600,
+                 compact_after=256):
+        from cryptography.fernet import Fernet
+
+        self.path = path
+        self.cipher = Fernet(key)
+        self._id_key = hmac.new(base64.urlsafe_b64decode(key), b"history entry id",
+                                hashlib.sha256).digest()
+        self.key_id = self._entry_id("\0key")
+        self.max_versions = max_versions
+        self.max_age = max_age
+        self.compact_after = compact_after
+        self.lock = VaultLock(path + ".lock")
+        self._records = None  # entry id -> [(replaced at, token)], oldest first
+        self._offset = 0  # where this process stopped reading the file
+        self._inode = None
+        self._expired = 0
+
+    def record(self, account, username, password, replaced_at=None):
+        """Keep a version of account that is being replaced or deleted"""
+        self.record_many({account: (username, password)}, replaced_at)
+
+    def record_many(self, versions, replaced_at=None):
+        """Keep {account: (username, password)} versions with one write"""
+        if replaced_at is None:
+            replaced_at = time.time()
+        with self.lock:
+            self._catch_up()
+            lines = []
+            for account, (username, password) in versions.items():
+                entry_id = self._entry_id(account)
+                records = self._records.setdefault(entry_id, [])
+                version = {'username': username, 'password': password}
+                previous = self._versions(records)
+                delta = {field: value for field, value in version.items()
+                         if not previous or previous[-1][1].get(field) != value}
+                if not delta:
+                    continue
+                token = self.cipher.encrypt(json.dumps(delta).encode()).decode()
+                records.append((replaced_at, token))
+                lines.append({'id': entry_id, 'at': replaced_at, 'delta': token})
+                if len(records) > self.max_versions:
+                    self._expired += 1
+            if not lines:
+                return
+            self._append(lines)
+            if self._expired >= self.compact_after:
+                self.compact()
+
+    def versions(self, account):
+        """[(replaced at, username, password)] of account, newest first"""
+        with self.lock:
+            self._catch_up()
+            records = self._records.get(self._entry_id(account), [])
+            return [(replaced_at, version.get('username'), version.get('password'))
+                    for replaced_at, version in reversed(self._retained(records))]
+
+    def compact(self):
+        """Rewrite the file with only the versions retention keeps"""
+        with self.lock:
+            self._catch_up()
+            kept = {}
+            for entry_id, records in self._records.items():
+                versions = self._retained(records)
+                if versions:
+                    kept[entry_id] = self._encode(versions)
+
+            def write(f):
+                f.write(json.dumps({'key': self.key_id}) + "\n")
+                for entry_id, records in kept.items():
+                    for replaced_at, token in records:
+                        f.write(json.dumps({'id': entry_id, 'at': replaced_at,
+                                            'delta': token}) + "\n")
+
+            atomic_write(self.path, write)
+            self._records = kept
+            self._expired = 0
+            self._sync_position()
+
+    def clear(self):
+        """Forget every version"""
+        with self.lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._records = {}
+            self._offset = 0
+            self._inode = None
+            self._expired = 0
+
+    def _entry_id(self, account):
+        mac = hmac.new(self._id_key, account.encode(), hashlib.sha256)
+        return base64.urlsafe_b64encode(mac.digest()[:12]).decode()
+
+    def _versions(self, records):
+        """[(replaced at, full version)] rebuilt from the deltas"""
+        versions = []
+        version = {}
+        for replaced_at, token in records:
+            version = dict(version)
+            version.update(json.loads(self.cipher.decrypt(token.encode())))
+            versions.append((replaced_at, version))
+        return versions
+
+    def _retained(self, records):
+        oldest = time.time() - self.max_age
+        return [(replaced_at, version)
+                for replaced_at, version in self._versions(records)[-self.max_versions:]
+                if replaced_at >= oldest]
+
+    def _encode(self, versions):
+        """[(replaced at, token)] of full versions, as deltas again"""
+        records = []
+        previous = {}
+        for replaced_at, version in versions:
+            delta = {field: version[field] for field in FIELDS
+                     if field in version and previous.get(field) != version[field]}
+            records.append((replaced_at, self.cipher.encrypt(
+                json.dumps(delta).encode()).decode()))
+            previous = version
+        return records
+
+    def _append(self, lines):
+        # Only called under the lock, after _catch_up
+        with open(self.path, 'a') as f:
+            if f.tell() == 0:
+                f.write(json.dumps({'key': self.key_id}) + "\n")
+            f.write("".join(json.dumps(line) + "\n" for line in lines))
+            f.flush()
+            os.fsync(f.fileno())
+        self._sync_position()
+
+    def _sync_position(self):
+        status = os.stat(self.path)
+        self._offset = status.st_size
+        self._inode = status.st_ino
+
+    def _catch_up(self):
+        """Read what was appended since, or the whole file if it was replaced"""
+        try:
+            status = os.stat(self.path)
+        except FileNotFoundError:
+            self._records = {}
+            self._offset = 0
+            self._inode = None
+            return
+        if (self._records is None or status.st_ino != self._inode
+                or status.st_size < self._offset):
+            self._records = {}
+            self._offset = 0
+            self._expired = 0
+        if status.st_size == self._offset:
+            self._inode = status.st_ino
+            return
+
+        with open(self.path, 'rb+') as f:
+            f.seek(self._offset)
+            while True:
+                position = f.tell()
+                line = f.readline()
+                try:
+                    record = json.loads(line) if line.endswith(b"\n") else None
+                except ValueError:
+                    record = None
+                if record is None:
+                    # Torn by a writer that crashed, appending after it
+                    # would hide the records that follow
+                    f.truncate(position)
+                    break
+                if 'key' in record:
+                    if record['key'] != self.key_id:
+                        # Versions of another key, they cannot be read
+                        f.truncate(0)
+                        self._records = {}
+                        position = 0
+                        break
+                    continue
+                records = self._records.setdefault(record['id'], [])
+                records.append((record['at'], record['delta']))
+                if len(records) > self.max_versions:
+                    self._expired += 1
+            self._offset = position
+        self._inode = status.st_ino
@@ -0,0 +1,375 @@
+import json
+import os
+import tempfile
+import threading
+
+from storage.atomic import atomic_write_json, fsync_directory
+from storage.base import StorageBackend
+from storage.merge import diff, merge_entry
+
+
+class JournalStore(StorageBackend):
+    """Vault storage made of a JSON snapshot plus an append-only change log.
+
+    Every add, edit or delete appends one fsync'd record to the journal
+    instead of rewriting the whole vault. ``load`` replays the journal on
+    top of the snapshot, and once the journal grows past
+    ``compact_threshold`` bytes it is folded back into the snapshot on a
+    background thread.
+
+    Several processes can share the vault. Changes are made under the
+    vault lock, after reading the records other processes appended since
+    (only the new ones, from where this process stopped), and an entry
+    changed on both sides is three-way merged before ours is appended.
+    Each journal starts with its segment number: a process that finds
+    the journal replaced by more than the next segment missed records
+    and reloads the vault instead.
+
+    Locks are always taken vault lock first, then ``_lock``. The
+    compactor thread takes the vault lock, so it is only waited for
+    while holding neither.
+    """
+
+    def __init__(self, data_file, compact_threshold=1024 * 1024):
+        super().__init__(data_file)
+        self.journal_file = data_file + ".journal"
+        # Journal segment that is being folded into the snapshot
+        self.compacting_file = data_file + ".journal.compacting"
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._journal = None
+        self._tail = None  # reads the journal where this process stopped
+        self._segment = 0  # number of the journal segment being read
+        self._compactor = None
+        self._external = {}  # changes of other processes not yet refreshed
+
+    def load(self):
+        """Load the snapshot and replay any journal records on top of it"""
+        with self.lock:
+            self.passwords = {}
+            self._read_vault(self.passwords)
+            self.generation = self.lock.generation()
+        return self.passwords
+
+    def put(self, account, entry):
+        self._commit({account: entry})
+
+    def put_many(self, entries):
+        # One fsync for the whole batch, a torn tail only loses whole records
+        self._commit(entries)
+
+    def delete(self, account):
+        if account not in self.passwords:
+            raise KeyError(account)
+        self._commit({account: None})
+
+    def clear(self):
+        with self.lock:
+            self._catch_up()
+            self.passwords.clear()
+            self._append({'op': 'clear'})
+
+    def rewrite(self):
+        """Save the dict as the whole vault, e.g. after a restore"""
+        self.wait_for_compaction()
+        with self.lock, self._lock:
+            # A compaction started since gives up on finding its segment gone
+            self._compactor = None
+            # The old log is superseded, were it replayed over the new
+            # snapshot it would bring back entries the dict dropped
+            self._close_journal()
+            for path in (self.compacting_file, self.journal_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            atomic_write_json(self.data_file, self.passwords)
+            # Skipping a segment number makes other processes reload
+            self._open_journal(self._segment + 2)
+            self.generation = self.lock.bump()
+
+    def refresh(self):
+        # Cheap enough to poll: one small read when nothing changed
+        if self.lock.generation() == self.generation and not self._external:
+            return {}
+        with self.lock:
+            self._catch_up()
+            changes, self._external = self._external, {}
+        return changes
+
+    def compact(self, wait=False):
+        """Fold the journal into a fresh snapshot"""
+        self.wait_for_compaction()
+        with self.lock:
+            self._start_compaction()
+        if wait:
+            self.wait_for_compaction()
+
+    def _start_compaction(self):
+        # Needs the vault lock. A compaction still running, started by a
+        # thread in between, gives up once its segment grows
+        with self._lock:
+            # The snapshot must hold every record of the segment
+            self._catch_up()
+
+            # Rotate the journal so new writes never wait on the snapshot
+            self._close_journal()
+            self._rotate_journal()
+            self._open_journal(self._segment + 1)
+            segment_size = (os.path.getsize(self.compacting_file)
+                            if os.path.exists(self.compacting_file) else None)
+            self.generation = self.lock.bump()
+
+            # Entries are replaced, never mutated, so a shallow copy is a
+            # consistent view of the vault at this point of the journal
+            snapshot = dict(self.passwords)
+            self._compactor = threading.Thread(
+                target=self._write_compaction, args=(snapshot, segment_size),
+                daemon=True)
+            self._compactor.start()
+
+    def wait_for_compaction(self):
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+    def flush(self):
+        # Appends are synced as they happen, only compaction can be pending
+        self.wait_for_compaction()
+
+    def close(self):
+        self.wait_for_compaction()
+        self._close_journal()
+
+    def _commit(self, changes):
+        """Apply {account: entry, or None to delete} and journal it"""
+        with self.lock:
+            started_from = {account: self.passwords.get(account)
+                            for account in changes}
+            external = self._catch_up()
+            records = []
+            for account, entry in changes.items():
+                if account in external:
+                    # Changed elsewhere since the caller looked at it
+                    entry = merge_entry(started_from[account], entry,
+                                        self.passwords.get(account))
+                    self._external[account] = entry
+                if entry is None:
+                    self.passwords.pop(account, None)
+                    records.append({'op': 'delete', 'account': account})
+                else:
+                    self.passwords[account] = entry
+                    records.append({'op': 'put', 'account': account,
+                                    'entry': entry})
+            self._append(*records)
+
+    def _append(self, *records):
+        # Only called under the vault lock, after _catch_up
+        self._journal.write("".join(json.dumps(record) + "\n"
+                                    for record in records))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._tail.seek(0, os.SEEK_END)
+        self.generation = self.lock.bump()
+
+        compacting = self._compactor is not None and self._compactor.is_alive()
+        if not compacting and self._journal.tell() >= self.compact_threshold:
+            self._start_compaction()
+
+    def _catch_up(self):
+        """Apply what other processes journaled since, returns the changes
+
+        Needs the vault lock. Only the new records are read: the rest of
+        the old journal if another process compacted, then the new one.
+        """
+        changes = {}
+        if self.lock.generation() == self.generation:
+            return changes
+        self._read_tail(changes)
+        if self._journal_replaced():
+            segment = self._segment
+            self._close_journal()
+            self._open_journal(segment + 1)
+            if self._segment == segment + 1:
+                self._read_tail(changes)
+            else:
+                self._reload(changes)
+
+        # Whatever is left after the last whole record was torn by a
+        # writer that crashed, appending after it would hide our records
+        size = os.fstat(self._journal.fileno()).st_size
+        if size != self._tail.tell():
+            self._journal.truncate(self._tail.tell())
+
+        self.generation = self.lock.generation()
+        self._external.update(changes)
+        return changes
+
+    def _reload(self, changes):
+        # Records were missed, read the whole vault and keep unchanged
+        # entries as they are
+        self._close_journal()
+        ours = self.passwords
+        theirs = {}
+        self._read_vault(theirs)
+        self.passwords = ours
+        changed = diff(ours, theirs)
+        for account, entry in changed.items():
+            if entry is None:
+                del self.passwords[account]
+            else:
+                self.passwords[account] = entry
+        changes.update(changed)
+
+    def _read_vault(self, passwords):
+        """Read snapshot and journals into passwords, open the journal
+
+        Replays into passwords through self.passwords, which is left
+        pointing at it.
+        """
+        self.passwords = passwords
+        passwords.update(self._read_snapshot())
+        crashed_compaction = os.path.exists(self.compacting_file)
+        if crashed_compaction:
+            self._replay(self.compacting_file)
+        self._replay(self.journal_file)
+
+        # A compaction was interrupted (or another process is still
+        # writing its snapshot), finish it before taking new writes
+        if crashed_compaction:
+            atomic_write_json(self.data_file, passwords)
+            os.remove(self.compacting_file)
+            if os.path.exists(self.journal_file):
+                os.remove(self.journal_file)
+            self.lock.bump()
+
+        self._open_journal(self._segment + 1)
+        self._tail.seek(0, os.SEEK_END)
+
+    def _read_tail(self, changes):
+        while True:
+            position = self._tail.tell()
+            line = self._tail.readline()
+            if not line.endswith(b"\n"):
+                self._tail.seek(position)
+                return
+            try:
+                record = json.loads(line)
+            except ValueError:
+                self._tail.seek(position)
+                return
+            self._apply(record, changes)
+
+    def _journal_replaced(self):
+        try:
+            current = os.stat(self.journal_file)
+        except FileNotFoundError:
+            return True
+        return current.st_ino != os.fstat(self._tail.fileno()).st_ino
+
+    def _open_journal(self, segment):
+        """Open the journal, starting it as segment if it is new"""
+        self._journal = open(self.journal_file, 'a')
+        if self._journal.tell() == 0:
+            self._journal.write(json.dumps({'op': 'segment',
+                                            'segment': segment}) + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+        self._tail = open(self.journal_file, 'rb')
+        # Journals older than segment numbers count as segment 0
+        try:
+            first = json.loads(self._tail.readline())
+        except ValueError:
+            first = {}
+        self._segment = first.get('segment', 0) if first.get('op') == 'segment' else 0
+        self._tail.seek(0)
+
+    def _close_journal(self):
+        for f in (self._journal, self._tail):
+            if f is not None:
+                f.close()
+        self._journal = None
+        self._tail = None
+
+    def _rotate_journal(self):
+        if not os.path.exists(self.journal_file):
+            return
+        if not os.path.exists(self.compacting_file):
+            os.replace(self.journal_file, self.compacting_file)
+            return
+
+        # The last compaction failed, keep its records ahead of ours
+        with open(self.compacting_file, 'ab') as dst, \
+                open(self.journal_file, 'rb') as src:
+            dst.write(src.read())
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.remove(self.journal_file)
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.data_file):
+            return {}
+        try:
+            with open(self.data_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _replay(self, path):
+        if not os.path.exists(path):
+            return
+
+        good_offset = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn write from a crash, drop it and everything after
+                    break
+                self._apply(record)
+                good_offset += len(line)
+
+        if good_offset != os.path.getsize(path):
+            with open(path, 'r+b') as f:
+                f.truncate(good_offset)
+
+    def _apply(self, record, changes=None):
+        op = record.get('op')
+        if changes is None:
+            changes = {}
+        if op == 'put':
+            self.passwords[record['account']] = record['entry']
+            changes[record['account']] = record['entry']
+        elif op == 'delete':
+            self.passwords.pop(record['account'], None)
+            changes[record['account']] = None
+        elif op == 'clear':
+            changes.update((account, None) for account in self.passwords)
+            self.passwords.clear()
+        elif op == 'segment':
+            self._segment = record['segment']
+
+    def _write_compaction(self, snapshot, segment_size):
+        directory = os.path.dirname(os.path.abspath(self.data_file))
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=os.path.basename(self.data_file) + ".", suffix=".tmp",
+            dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        with self.lock:
+            current = (os.path.getsize(self.compacting_file)
+                       if os.path.exists(self.compacting_file) else None)
+            if current != segment_size:
+                # Another process added to the segment or finished it, the
+                # snapshot is its job now
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, self.data_file)
+            fsync_directory(directory)
+
+            # Replaying the old segment over the new snapshot is harmless, so
+            # it only goes away once the snapshot is safely on disk
+            if current is not None:
+                os.remove(self.compacting_file)
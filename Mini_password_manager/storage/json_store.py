@@ -0,0 +1,21 @@
+import json
+import os
+
+from storage.atomic import atomic_write_json
+from storage.base import WholeFileStore
+
+
+class JsonStore(WholeFileStore):
+    """The original passwords.json layout, rewritten in full on every change"""
+
+    def read(self):
+        if not os.path.exists(self.data_file):
+            return {}
+        try:
+            with open(self.data_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write(self, passwords):
+        atomic_write_json(self.data_file, passwords)
@@ -0,0 +1,97 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# The generation is kept as fixed-width digits at the start of the lock
+# file, so it is overwritten in place and readable without the lock
+GENERATION_WIDTH = 20
+# Windows locks byte ranges and blocks reads of them, lock one past the
+# generation instead
+LOCK_OFFSET = 1024
+
+
+class VaultLock:
+    """Advisory lock shared by every process that opens the same vault.
+
+    Used as a context manager around anything that changes the vault
+    files. It is reentrant within a process and also serializes threads,
+    so a background writer and the UI thread take turns like two
+    processes do.
+
+    The lock file also holds the vault generation, a counter each writer
+    bumps after changing the vault. Comparing it with the generation last
+    seen is a cheap way to tell whether another process changed anything.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                _lock(self._fd)
+            except BaseException:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                _unlock(self._fd)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+        self._thread_lock.release()
+
+    def generation(self):
+        """Generation of the vault on disk, 0 before its first change"""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read(GENERATION_WIDTH)
+        except FileNotFoundError:
+            return 0
+        try:
+            return int(data)
+        except ValueError:
+            return 0
+
+    def bump(self):
+        """Record a change to the vault, only while holding the lock"""
+        if self._fd is None:
+            raise RuntimeError("bump() needs the vault lock")
+        generation = self.generation() + 1
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, str(generation).zfill(GENERATION_WIDTH).encode())
+        return generation
+
+
+def _lock(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+    else:
+        os.lseek(fd, LOCK_OFFSET, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+
+
+def _unlock(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, LOCK_OFFSET, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,63 @@
+"""Three-way merge of vault entries changed by two processes at once.
+
+``base`` is the version both sides started from, ``ours`` and ``theirs``
+the two edited versions. A missing entry is None. Whatever only one side
+changed is taken from that side. When both changed the same entry the
+fields are merged one by one, and a field both changed keeps our value.
+Sealed entries are one token and its index, so ours wins whole.
+An edit beats a delete, a lost password is worse than a revived one.
+"""
+
+from utils.blind_index import is_sealed
+
+FIELDS = ('username', 'password')
+
+
+def _same(a, b):
+    # Entries are replaced, never mutated, identity settles most cases
+    return a is b or (a is not None and b is not None and a == b)
+
+
+def merge_entry(base, ours, theirs):
+    """Merged entry, or None when it should be deleted"""
+    if _same(ours, theirs) or _same(base, theirs):
+        return ours
+    if _same(base, ours):
+        return theirs
+    if ours is None or theirs is None:
+        return theirs if ours is None else ours
+    if base is None or any(map(is_sealed, (base, ours, theirs))):
+        return ours
+    merged = {}
+    for field in FIELDS:
+        if ours[field] == base[field]:
+            merged[field] = theirs[field]
+        else:
+            merged[field] = ours[field]
+    return merged
+
+
+def merge_vaults(base, ours, theirs):
+    """Merge three {account: entry} dicts, returns the merged dict
+
+    Accounts keep the order of theirs, accounts only we added follow.
+    """
+    merged = {}
+    for account, entry in theirs.items():
+        result = merge_entry(base.get(account), ours.get(account), entry)
+        if result is not None:
+            merged[account] = result
+    for account, entry in ours.items():
+        if account not in theirs:
+            result = merge_entry(base.get(account), entry, None)
+            if result is not None:
+                merged[account] = result
+    return merged
+
+
+def diff(old, new):
+    """{account: entry, or None when removed} that turns old into new"""
+    changes = {account: entry for account, entry in new.items()
+               if not _same(old.get(account), entry)}
+    changes.update((account, None) for account in old if account not in new)
+    return changes
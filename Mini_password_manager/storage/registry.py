@@ -0,0 +1,41 @@
+import os
+
+LEGACY_FILE = "passwords.json"
+# KDF parameters and salt, shared by every storage mode
+HEADER_FILE = "vault.header.json"
+# Progress of an interrupted data key rotation
+ROTATION_CHECKPOINT = "vault.rotation.checkpoint"
+# Chunks and manifests of the deduplicated backups
+BACKUP_DIR = "backups"
+# Encrypted past versions of the entries
+HISTORY_FILE = "vault.history"
+
+# Storage mode -> file the vault lives in
+DATA_FILES = {
+    'json': "passwords.json",
+    'journal': "passwords.json",
+    'binary': "passwords.vault",
+    'sqlite': "passwords.db",
+}
+
+
+def create_store(mode, directory=".", save_delay=0.5):
+    """Build the storage backend for mode without loading it yet"""
+    if mode not in DATA_FILES:
+        raise ValueError(f"Unknown storage mode: {mode}")
+    data_file = os.path.join(directory, DATA_FILES[mode])
+    legacy_file = os.path.join(directory, LEGACY_FILE)
+
+    # Only the backend in use is imported, sqlite3 and mmap cost startup time
+    if mode == 'json':
+        from storage.json_store import JsonStore
+        return JsonStore(data_file, save_delay=save_delay)
+    if mode == 'journal':
+        from storage.journal import JournalStore
+        return JournalStore(data_file)
+    if mode == 'binary':
+        from storage.binary import BinaryStore
+        return BinaryStore(data_file, legacy_file=legacy_file,
+                           save_delay=save_delay)
+    from storage.sqlite_store import SqliteStore
+    return SqliteStore(data_file, legacy_file=legacy_file)
@@ -0,0 +1,164 @@
+import json
+import os
+import sqlite3
+
+from storage.base import StorageBackend
+from storage.merge import diff, merge_entry
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    account TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    password TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_entries_username ON entries(username);
+"""
+
+
+class SqliteStore(StorageBackend):
+    """Vault storage with one SQLite row per entry.
+
+    Every change is one transaction over just its rows, so edits cost the
+    same no matter how large the vault is. Rows another process changed
+    since they were read are three-way merged, as in the journal. The
+    database runs in WAL mode and the account primary key plus the
+    username index back lookups and search.
+    SQLite does its own locking between processes, its data_version
+    serves as the vault generation.
+    """
+
+    def __init__(self, data_file, legacy_file=None):
+        super().__init__(data_file)
+        self.legacy_file = legacy_file
+        self.conn = None
+        self._merged = {}  # entries put() merged, for the next refresh
+
+    def load(self):
+        """Open the database, importing a legacy JSON vault on first use"""
+        is_new = not os.path.exists(self.data_file)
+        self.conn = sqlite3.connect(self.data_file)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+        if is_new and self.legacy_file and os.path.exists(self.legacy_file):
+            with open(self.legacy_file, 'r') as f:
+                self.passwords = json.load(f)
+            self.rewrite()
+
+        self.generation = self._data_version()
+        self.passwords = self._read_rows()
+        return self.passwords
+
+    def refresh(self):
+        # Only commits of other connections move data_version
+        changes, self._merged = self._merged, {}
+        version = self._data_version()
+        if version == self.generation:
+            return changes
+        self.generation = version
+        changes.update(diff(self.passwords, self._read_rows()))
+        for account, entry in changes.items():
+            if entry is None:
+                del self.passwords[account]
+            else:
+                self.passwords[account] = entry
+        return changes
+
+    def _read_rows(self):
+        rows = self.conn.execute(
+            "SELECT account, username, password FROM entries ORDER BY rowid")
+        return {account: {'username': username, 'password': password}
+                for account, username, password in rows}
+
+    def _data_version(self):
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def put(self, account, entry):
+        self._commit({account: entry})
+
+    def put_many(self, entries):
+        self._commit(entries)
+
+    def delete(self, account):
+        if account not in self.passwords:
+            raise KeyError(account)
+        self._commit({account: None})
+
+    def _commit(self, changes):
+        """Apply {account: entry, or None to delete} in one transaction"""
+        with self.conn:
+            # Another process may have edited the entries since they were read
+            self.conn.execute("BEGIN IMMEDIATE")
+            stored = self._read_accounts(list(changes))
+            applied, upserts, deletes = {}, [], []
+            for account, entry in changes.items():
+                theirs = stored.get(account)
+                base = self.passwords.get(account)
+                if theirs != base:
+                    entry = merge_entry(base, entry, theirs)
+                    self._merged[account] = entry
+                applied[account] = entry
+                if entry is None:
+                    deletes.append((account,))
+                else:
+                    upserts.append(
+                        (account, entry['username'], entry['password']))
+            self.conn.executemany(
+                "INSERT INTO entries (account, username, password) "
+                "VALUES (?, ?, ?) ON CONFLICT(account) DO UPDATE SET "
+                "username = excluded.username, password = excluded.password",
+                upserts)
+            self.conn.executemany(
+                "DELETE FROM entries WHERE account = ?", deletes)
+        for account, entry in applied.items():
+            if entry is None:
+                self.passwords.pop(account, None)
+            else:
+                self.passwords[account] = entry
+
+    def _read_accounts(self, accounts):
+        """{account: entry} of the rows of accounts, missing ones left out"""
+        entries = {}
+        # Chunked to stay under SQLite's limit on query parameters
+        for start in range(0, len(accounts), 500):
+            chunk = accounts[start:start + 500]
+            rows = self.conn.execute(
+                "SELECT account, username, password FROM entries "
+                "WHERE account IN (%s)" % ", ".join("?" * len(chunk)), chunk)
+            entries.update((account, {'username': username,
+                                      'password': password})
+                           for account, username, password in rows)
+        return entries
+
+    def clear(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM entries")
+        self.passwords.clear()
+
+    def rewrite(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM entries")
+            self.conn.executemany(
+                "INSERT INTO entries (account, username, password) "
+                "VALUES (?, ?, ?)",
+                ((account, data['username'], data['password'])
+                 for account, data in self.passwords.items()))
+
+    def search(self, term):
+        # LIKE is case-insensitive for ASCII, escape its wildcards
+        pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%") \
+            .replace("_", "\\_") + "%"
+        # Rows another process committed are not in self.passwords yet
+        rows = self.conn.execute(
+            "SELECT account, username, password FROM entries "
+            "WHERE account LIKE ? ESCAPE '\\' OR username LIKE ? ESCAPE '\\' "
+            "ORDER BY rowid", (pattern, pattern))
+        return [(account, {'username': username, 'password': password})
+                for account, username, password in rows]
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,895 @@
+import os
+
+from storage.header import (BASE_VERSION, load_header, new_header,
+                            save_header)
+from storage.lock import VaultLock
+from storage.merge import diff
+from storage.registry import (BACKUP_DIR, HEADER_FILE, HISTORY_FILE,
+                              ROTATION_CHECKPOINT, create_store)
+from utils.decrypt_cache import DecryptCache
+from utils.envelope import data_cipher, new_data_key, unwrap_key, wrap_key
+from utils.kdf import (DEFAULT_TARGET, LEGACY_PARAMS, calibrate, derive_key,
+                       key_check, needs_retune, new_vault_id, timed_derive_key,
+                       verify_key, with_new_salt)
+from utils.metrics import Metrics
+
+
+class KeysChangedError(Exception):
+    """Another process changed the vault keys under an operation.
+
+    After a master password change the vault is locked and needs a new
+    login, otherwise the operation only has to be started again.
+    """
+
+
+class VaultExistsError(Exception):
+    """A new vault was asked for where one already exists.
+
+    Its data key and entries would be lost for good, a new master password
+    for an existing vault goes through rewrap() after unlocking.
+    """
+
+
+class VaultStore:
+    """A vault on disk, without any user interface.
+
+    Ties the storage backend, the header and the data key together:
+    unlock with the master password, then read, change, search, import,
+    export and back up entries. The Tk app and the command line both
+    drive one of these.
+
+    Slow calls (key derivation, export, import, backup) touch neither the
+    header nor the entries dict unless stated, so the app can run them on
+    a worker thread; they take on_progress and cancelled callbacks. The
+    backend, crypto and everything past key derivation are imported on
+    first use, a command that reads one entry loads little else.
+
+    A sealed vault (see utils.blind_index) encrypts account and username
+    too. Its dict is keyed by entry ids instead of account names, so
+    callers go through key_of() and label() rather than reading either
+    from the dict.
+
+    Replacing or deleting an entry keeps the version it had in the
+    history (see storage.history), so an overwrite can be undone without
+    a backup.
+
+    Other processes may change the header at any time (rotate the data
+    key, change the master password, seal the vault). Every header write
+    bumps a generation kept next to it, refresh() and every change read
+    the header again when it moved, so entries are never encrypted under
+    a key another process dropped and header writes never undo one made
+    elsewhere.
+    """
+
+    def __init__(self, storage_mode="journal", directory=".", save_delay=0.5,
+                 unlock_target=DEFAULT_TARGET, metrics=None):
+        self.storage_mode = storage_mode  # "journal", "sqlite", "binary" or "json"
+        self.directory = directory
+        self.save_delay = save_delay
+        # Seconds one unlock should take, key derivation is tuned to match
+        self.unlock_target = unlock_target
+        self.header_file = os.path.join(directory, HEADER_FILE)
+        self.rotation_checkpoint = os.path.join(directory, ROTATION_CHECKPOINT)
+        # Serializes header writes between processes, its generation tells
+        # whether the header changed since it was read
+        self.header_lock = VaultLock(self.header_file + ".lock")
+        self.header_generation = self.header_lock.generation()
+        # KDF parameters and salt, None for vaults older than the header
+        self.header = load_header(self.header_file)
+        # The master key only wraps the data key, entries are encrypted by
+        # self.cipher
+        self.key = None
+        self.cipher = None
+        # Seals whole entries, set while a sealed vault is unlocked
+        self.sealer = None
+        self.store = None
+        self.passwords = None
+        self.search_index = None
+        self._backups = None
+        self._history = None
+        # Recently decrypted passwords, (account, username, password) for
+        # sealed entries, wiped on lock and re-key
+        self.decrypted = DecryptCache(max_size=1024, ttl=60)
+        # Timings of the hot paths, only recorded when enabled
+        self.metrics = metrics if metrics is not None else Metrics()
+
+    def open(self):
+        """Read the vault, once per run. Entries stay encrypted"""
+        if self.store is not None:
+            return
+        self.store = create_store(self.storage_mode, directory=self.directory,
+                                  save_delay=self.save_delay)
+        with self.metrics.span("load"):
+            # The store keeps this dict in sync with disk, change it via the store
+            self.passwords = self.store.load()
+        self.search_index = self.new_index()
+
+    @property
+    def sealed(self):
+        return bool(self.header and self.header.get('sealed'))
+
+    def new_index(self):
+        """Built on the first search, then kept up to date incrementally"""
+        if self.sealed:
+            # Needs no key, the blind tokens are stored in the entries
+            from utils.blind_index import BlindIndex
+            return BlindIndex(self.passwords)
+        from utils.search_index import SearchIndex
+        return SearchIndex(self.passwords)
+
+    def build_index(self, entries):
+        """Search index over a snapshot of the entries of a plain vault
+
+        Safe to call from a worker thread, hand the result to adopt_index().
+        """
+        from utils.search_index import SearchIndex
+        index = SearchIndex()
+        index.build(entries)
+        return index
+
+    def adopt_index(self, index, entries):
+        """Search with index, built from the entries snapshot, from now on
+
+        Catches up with what changed since the snapshot. Returns False and
+        keeps the current index when the vault was sealed or closed, or a
+        search already built it meanwhile.
+        """
+        if self.passwords is None or self.sealed or self.search_index.ready:
+            return False
+        for account, entry in diff(entries, self.passwords).items():
+            if entry is None:
+                index.remove(account)
+            else:
+                index.add(account, entry['username'])
+        self.search_index = index
+        return True
+
+    def use_cipher(self, cipher):
+        """Encrypt entries with cipher from now on, None when locking"""
+        self.cipher = cipher
+        self.sealer = None
+        if cipher is not None and self.sealed:
+            from utils.blind_index import EntrySealer
+            self.sealer = EntrySealer(
+                cipher, unwrap_key(self.key, self.header['wrapped_index_key']))
+
+    @property
+    def backups(self):
+        """Deduplicated snapshots, unchanged chunks are never written twice"""
+        if self._backups is None:
+            from storage.backup import BackupStore
+            self._backups = BackupStore(os.path.join(self.directory, BACKUP_DIR))
+        return self._backups
+
+    @property
+    def history(self):
+        """Past versions of the entries, needs the vault unlocked"""
+        if self._history is None:
+            from storage.history import HistoryStore
+
+            with self.header_lock:
+                self.sync_header()
+                if 'wrapped_history_key' not in self.header:
+                    header = dict(self.header)
+                    header['wrapped_history_key'] = wrap_key(self.key, new_data_key())
+                    self.write_header(header)
+            self._history = HistoryStore(
+                os.path.join(self.directory, HISTORY_FILE),
+                unwrap_key(self.key, self.header['wrapped_history_key']))
+        return self._history
+
+    @property
+    def unlocked(self):
+        return self.cipher is not None
+
+    def save(self):
+        """Write the whole dict as the vault"""
+        with self.metrics.span("save"):
+            self.store.rewrite()
+
+    def flush(self):
+        """Block until every requested save has reached the disk"""
+        self.store.flush()
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+
+    # Keys
+
+    def write_header(self, header):
+        """Save header, None removes it. Only under header_lock, after
+        sync_header(), so no change of another process is overwritten"""
+        if header is None:
+            if os.path.exists(self.header_file):
+                os.remove(self.header_file)
+        else:
+            save_header(self.header_file, header)
+        self.header = header
+        self.header_generation = self.header_lock.bump()
+
+    def sync_header(self):
+        """Take in the header another process saved, True if it changed
+
+        An unlocked vault switches to the data keys of the new header. If
+        the master password changed meanwhile the vault locks itself and
+        KeysChangedError is raised.
+        """
+        if self.header_lock.generation() == self.header_generation:
+            return False
+        with self.header_lock:
+            generation = self.header_lock.generation()
+            if generation == self.header_generation:
+                return False
+            was_sealed = self.sealed
+            self.header = load_header(self.header_file)
+            self.header_generation = generation
+            if self.sealed != was_sealed and self.passwords is not None:
+                self.search_index = self.new_index()
+            if self.key is None:
+                return True
+            self._history = None
+            self.decrypted.clear()
+            check = self.header and self.header.get('key_check')
+            if check is None or not verify_key(self.key, self.header['vault_id'], check):
+                self.lock()
+                raise KeysChangedError("The master password was changed in "
+                                       "another window, please log in again")
+            self.use_cipher(data_cipher(self.key, self.header))
+        return True
+
+    def kdf_params(self):
+        return self.header['kdf'] if self.header else LEGACY_PARAMS
+
+    def unlock(self, master_password, sample, header):
+        """Derive the key for master_password and verify it
+
+        Returns (key, params, seconds the derivation took), raises
+        InvalidToken for a wrong password. Only uses its arguments, so it
+        can run on a worker thread.
+        """
+        if header:
+            candidates = [(header['kdf'], header.get('key_check'))]
+            if 'pending_kdf' in header:
+                # An interrupted re-key may have saved entries under the new params
+                candidates.append((header['pending_kdf'],
+                                   header['pending_key_check']))
+        else:
+            candidates = [(LEGACY_PARAMS, None)]
+
+        for params, check in candidates:
+            with self.metrics.span("kdf"):
+                key, elapsed = timed_derive_key(master_password, params)
+            if self.key_matches(key, header, check, sample):
+                return key, params, elapsed
+        from cryptography.fernet import InvalidToken
+        raise InvalidToken
+
+    @staticmethod
+    def key_matches(key, header, check, sample):
+        if check is not None:
+            # One constant-time MAC comparison, no entry is touched
+            return verify_key(key, header['vault_id'], check)
+        # Vaults older than the key check can only be verified on an entry
+        if sample is None:
+            return True
+        from cryptography.fernet import Fernet, InvalidToken
+        try:
+            Fernet(key).decrypt(sample.encode())
+        except InvalidToken:
+            return False
+        return True
+
+    def verification_sample(self):
+        """An encrypted password to verify keys with, if the header has no key check"""
+        if self.header and self.header.get('key_check'):
+            return None
+        # Only an entry can tell whether a legacy vault's key is right
+        self.open()
+        for _, data in self.passwords.items():
+            return data['password']
+        return None
+
+    def accept_key(self, key, params):
+        """Start using the master key unlock() returned"""
+        self.open()
+        with self.header_lock:
+            self.sync_header()
+            if self.header and params == self.header.get('pending_kdf'):
+                # The interrupted re-key did save the entries, finish it
+                header = dict(self.header)
+                header['kdf'] = header.pop('pending_kdf')
+                header['key_check'] = header.pop('pending_key_check')
+                self.write_header(header)
+            self.key = key
+            if not (self.header and self.header.get('wrapped_key')):
+                self.adopt_data_key(params)
+            if self.header.get('wrapped_index_key') and not self.sealed:
+                self.finish_interrupted_sealing()
+            self.use_cipher(data_cipher(key, self.header))
+        self.decrypted.clear()
+
+    def login(self, master_password):
+        """Unlock and open the vault, returns (params, derivation seconds)"""
+        key, params, elapsed = self.unlock(
+            master_password, self.verification_sample(), self.header)
+        self.accept_key(key, params)
+        return params, elapsed
+
+    def lock(self):
+        """Forget the key and every decrypted value until the next login"""
+        self.key = None
+        self.use_cipher(None)
+        self._history = None
+        self.decrypted.clear()
+
+    def new_master_key(self, master_password):
+        """KDF parameters and key for a new vault, costs tuned for this machine"""
+        params = calibrate(target=self.unlock_target)
+        with self.metrics.span("kdf"):
+            return params, derive_key(master_password, params)
+
+    def create(self, params, key, sealed=False):
+        """Start a vault under the key new_master_key() returned
+
+        sealed encrypts account names and usernames as well. Raises
+        VaultExistsError, changing nothing, when the directory already
+        holds a header or entries.
+        """
+        vault_id = new_vault_id()
+        header = new_header(params, vault_id, key_check(key, vault_id),
+                            wrap_key(key, new_data_key()))
+        if sealed:
+            header['wrapped_index_key'] = wrap_key(key, new_data_key())
+            header['sealed'] = True
+        self.open()
+        with self.header_lock:
+            self.sync_header()
+            self.store.refresh()
+            if self.header is not None or self.passwords:
+                raise VaultExistsError(
+                    "A vault already exists here, log in to change its "
+                    "master password")
+            self.write_header(header)
+        self.search_index = self.new_index()
+        self.key = key
+        self.use_cipher(data_cipher(key, self.header))
+        self.decrypted.clear()
+
+    def needs_retune(self, params, elapsed):
+        return needs_retune(params, elapsed, self.unlock_target)
+
+    def tuned_key(self, master_password):
+        """Re-calibrate key derivation for this machine, returns (params, key)"""
+        params = calibrate(self.kdf_params()['algorithm'], self.unlock_target)
+        with self.metrics.span("kdf"):
+            return params, derive_key(master_password, params)
+
+    def derive_new_master_key(self, current_password, new_password, sample,
+                              header):
+        """Verify the current password and derive the key for the new one"""
+        _, params, _ = self.unlock(current_password, sample, header)
+
+        # Same costs, but a new password always gets a new salt
+        new_params = with_new_salt(params)
+        with self.metrics.span("kdf"):
+            return new_params, derive_key(new_password, new_params)
+
+    def upgraded_header(self):
+        """Copy of the header with a vault id, from the current format on"""
+        header = dict(self.header or new_header(LEGACY_PARAMS, None, None, None))
+        header['version'] = max(header.get('version', 0), BASE_VERSION)
+        if not header.get('vault_id'):
+            header['vault_id'] = new_vault_id()
+        return header
+
+    def adopt_data_key(self, params):
+        """Move a vault whose entries use the master key to envelope encryption
+
+        The key the entries are encrypted with becomes the data key, so no
+        entry changes now. It was derived from the password though, so a
+        rotation to a random data key is queued straight away.
+        """
+        header = self.upgraded_header()
+        header['kdf'] = params
+        header['key_check'] = key_check(self.key, header['vault_id'])
+        header['wrapped_key'] = wrap_key(self.key, self.key)
+        header['next_wrapped_key'] = wrap_key(self.key, new_data_key())
+        with self.header_lock:
+            self.write_header(header)
+
+    def rewrap(self, params, master_key):
+        """Put the data keys under a new master key
+
+        Only the header changes, in one atomic write, so this costs the
+        same for any vault size and a crash leaves either key working.
+        """
+        with self.header_lock:
+            self.sync_header()
+            header = self.upgraded_header()
+            for field in ('wrapped_key', 'next_wrapped_key', 'wrapped_index_key',
+                          'wrapped_history_key'):
+                if field in header:
+                    header[field] = wrap_key(
+                        master_key, unwrap_key(self.key, header[field]))
+            header['kdf'] = params
+            header['key_check'] = key_check(master_key, header['vault_id'])
+            self.write_header(header)
+            self.key = master_key
+
+    def rotation(self):
+        """Reencryptor and entry snapshot for a move to a fresh data key
+
+        Queues the next data key first if none is pending. Run the engine
+        over the snapshot, then pass both and its result to
+        finish_rotation(). Progress is checkpointed, so a rotation that
+        was interrupted resumes where it stopped.
+        """
+        from utils.reencrypt import Reencryptor
+
+        with self.header_lock:
+            # Joins a rotation another process started
+            self.sync_header()
+            if 'next_wrapped_key' not in self.header:
+                header = dict(self.header)
+                header['next_wrapped_key'] = wrap_key(self.key, new_data_key())
+                self.write_header(header)
+                self.use_cipher(data_cipher(self.key, header))
+
+        new_key = unwrap_key(self.key, self.header['next_wrapped_key'])
+        engine = Reencryptor(
+            [unwrap_key(self.key, self.header['wrapped_key'])], new_key,
+            checkpoint_file=self.rotation_checkpoint,
+            # Names the new key without revealing it
+            meta={'job': key_check(new_key, self.header['vault_id'])})
+        return engine, dict(self.passwords)
+
+    def finish_rotation(self, engine, snapshot, tokens):
+        from cryptography.fernet import Fernet
+
+        # Entries edited meanwhile were already saved under the new key
+        self.store.put_many({
+            account: {'username': snapshot[account]['username'],
+                      'password': token}
+            for account, token in tokens.items()
+            if self.passwords.get(account) is snapshot[account]})
+        # Every entry must be on disk under the new key before the old
+        # key is dropped from the header
+        self.flush()
+        with self.header_lock:
+            self.sync_header()
+            # Another process may have finished the same rotation first
+            if 'next_wrapped_key' in self.header:
+                header = dict(self.header)
+                header['wrapped_key'] = header.pop('next_wrapped_key')
+                self.write_header(header)
+                self.use_cipher(Fernet(engine.new_key))
+        engine.discard_checkpoint()
+
+    def sealing(self):
+        """Sealer and entry snapshot for sealing an unsealed vault
+
+        Pass both to seal_entries(), then its result and header_generation
+        as it is now to finish_sealing().
+        The index key is saved first, harmless on its own, so a crash
+        after the entries were rewritten is finished on the next login.
+        """
+        from utils.blind_index import EntrySealer
+
+        with self.header_lock:
+            self.sync_header()
+            if 'wrapped_index_key' not in self.header:
+                header = dict(self.header)
+                header['wrapped_index_key'] = wrap_key(self.key, new_data_key())
+                self.write_header(header)
+            sealer = EntrySealer(self.cipher, unwrap_key(
+                self.key, self.header['wrapped_index_key']))
+            return sealer, dict(self.passwords)
+
+    @staticmethod
+    def seal_entries(sealer, entries, on_progress=None, cancelled=None):
+        """Sealed copy of {account: entry}, None when cancelled"""
+        from utils.blind_index import is_sealed
+
+        sealed = {}
+        for done, (account, data) in enumerate(entries.items(), 1):
+            if is_sealed(data):
+                sealed[account] = data
+            else:
+                password = sealer.cipher.decrypt(data['password'].encode()).decode()
+                key, entry = sealer.seal(account, data['username'], password)
+                sealed[key] = entry
+            if done % 1000 == 0:
+                if cancelled and cancelled():
+                    return None
+                if on_progress:
+                    on_progress(done, len(entries))
+        return sealed
+
+    def finish_sealing(self, sealed, header_generation):
+        """Save what seal_entries() returned for the snapshot sealing()
+        took at header_generation"""
+        self.check_header(header_generation)
+        # One rewrite, so the vault is either plain or sealed
+        self.passwords.clear()
+        self.passwords.update(sealed)
+        self.save()
+        self.flush()
+        self.finish_interrupted_sealing()
+        self.use_cipher(self.cipher)
+        self.decrypted.clear()
+
+    def finish_interrupted_sealing(self):
+        """Mark the vault sealed once its entries are"""
+        from utils.blind_index import is_sealed
+
+        entry = next(iter(self.passwords.values()), None)
+        if entry is not None and not is_sealed(entry):
+            return
+        with self.header_lock:
+            self.sync_header()
+            if self.sealed:
+                return
+            header = dict(self.header)
+            header['sealed'] = True
+            self.write_header(header)
+        self.search_index = self.new_index()
+
+    # Entries
+
+    def key_of(self, account):
+        """Dict key the entry for account is stored under"""
+        if self.sealer is None:
+            return account
+        return self.sealer.entry_id(account)
+
+    def label(self, key, data=None):
+        """(account, username) of the entry under key"""
+        if data is None:
+            data = self.passwords[key]
+        if self.sealer is None:
+            return key, data['username']
+        return self.reveal(key, data)[:2]
+
+    def reveal(self, key, data, remember=True):
+        """(account, username, password) of a sealed entry"""
+        revealed = self.decrypted.get(key)
+        if revealed is None:
+            with self.metrics.span("decrypt"):
+                revealed = self.sealer.open(data)
+            if remember:
+                self.decrypted.put(key, revealed)
+        return revealed
+
+    def put(self, account, username, password):
+        """Encrypt and save an entry, replacing any under the same account
+
+        Returns the changes, {key: entry or None}, this save and the
+        refresh before it made to the entries.
+        """
+        # Current keys, and the current version of the entry for the history
+        changes = self.refresh()
+        with self.metrics.span("encrypt"):
+            if self.sealer is None:
+                key, entry = account, {
+                    'username': username,
+                    'password': self.cipher.encrypt(password.encode()).decode()}
+            else:
+                key, entry = self.sealer.seal(account, username, password)
+        if key in self.passwords:
+            with self.metrics.span("history"):
+                self.keep_versions([key], replaced_by={key: (username, password)})
+        with self.metrics.span("put"):
+            self.store.put(key, entry)
+        self.search_index.add(key, entry['username'])
+        self.decrypted.invalidate(key)
+        # A merge with a save from elsewhere may keep a different entry
+        changes[key] = self.passwords.get(key, entry)
+        return changes
+
+    def delete(self, key):
+        """Delete an entry, returns the changes like put()"""
+        changes = self.refresh()
+        with self.metrics.span("history"):
+            self.keep_versions([key])
+        with self.metrics.span("delete"):
+            self.store.delete(key)
+        self.search_index.remove(key)
+        self.decrypted.invalidate(key)
+        changes[key] = None
+        return changes
+
+    def clear(self):
+        self.sync_header()
+        self.store.clear()
+        self.search_index.clear()
+        self.decrypted.clear()
+        self.history.clear()
+
+    def keep_versions(self, keys, replaced_by=None):
+        """Save the current versions of entries about to change in the history
+
+        replaced_by maps keys to the (username, password) they get, an
+        entry that stays the same keeps no version.
+        """
+        versions = {}
+        for key in keys:
+            data = self.passwords.get(key)
+            if data is None:
+                continue
+            account, username = self.label(key, data)
+            password = self.decrypt_password(key, data, remember=False)
+            if replaced_by and replaced_by.get(key) == (username, password):
+                continue
+            versions[account] = (username, password)
+        if versions:
+            self.history.record_many(versions)
+
+    def versions(self, account):
+        """[(replaced at, username, password)] of account, newest first"""
+        return self.history.versions(account)
+
+    def restore_version(self, account, replaced_at):
+        """Bring back the version of account replaced at that time, returns
+        the changes like put()"""
+        for version in self.versions(account):
+            if version[0] == replaced_at:
+                return self.put(account, *version[1:])
+        raise KeyError(account)
+
+    def decrypt_password(self, key, data=None, remember=True):
+        """Plaintext password of an entry, served from the cache when fresh"""
+        if self.sealer is not None:
+            if data is None:
+                data = self.passwords[key]
+            return self.reveal(key, data, remember)[2]
+        password = self.decrypted.get(key)
+        if password is None:
+            if data is None:
+                data = self.passwords[key]
+            with self.metrics.span("decrypt"):
+                password = self.cipher.decrypt(data['password'].encode()).decode()
+            if remember:
+                self.decrypted.put(key, password)
+        return password
+
+    def search(self, term, limit=100):
+        """Keys of the best limit entries for a query, most relevant first"""
+        with self.metrics.span("search"):
+            if self.sealer is None:
+                return self.search_index.rank(term, limit=limit)
+            return self.blind_search(term, limit)
+
+    def blind_search(self, term, limit=None):
+        """Keys of sealed entries matching term, found on the blind index
+
+        Only the candidates are decrypted, and only when the index alone
+        cannot tell: a query of up to three characters is one term, every
+        entry holding it matches. Matches are substrings for longer
+        queries and word prefixes for shorter ones, no fuzzy matching.
+        """
+        from utils.blind_index import matches, query_terms
+        from utils.fuzzy import exact_score, score_entry, top_k
+
+        plain_terms = query_terms(term)
+        keys = self.search_index.candidates(self.sealer.blind(plain_terms))
+        if len(plain_terms) <= 1:
+            return keys[:limit]
+        scored = []
+        for order, key in enumerate(keys):
+            account, username = self.label(key)
+            if matches(term, account, username):
+                score = score_entry(exact_score, term.lower(), account.lower(),
+                                    username.lower())
+                scored.append((score or 0, order, key))
+        return top_k(scored, limit if limit is not None else len(scored))
+
+    def scan(self, term):
+        """(account, username) of the entries containing term, without
+        building the search index of a plain vault"""
+        if self.sealer is None:
+            return [(account, data['username'])
+                    for account, data in self.store.search(term)]
+        return [self.label(key) for key in self.blind_search(term)]
+
+    def refresh(self):
+        """Take in what other processes saved, returns the changes
+
+        Raises KeyChangedError, and locks, when the master password was
+        changed elsewhere.
+        """
+        self.sync_header()
+        changes = self.store.refresh()
+        self.metrics.count("external_changes", len(changes))
+        for account, entry in changes.items():
+            if entry is None:
+                self.search_index.remove(account)
+            else:
+                self.search_index.add(account, entry['username'])
+            self.decrypted.invalidate(account)
+        return changes
+
+    # Import and export
+
+    def export(self, path, format='csv', term=None, passphrase=None,
+               entries=None, on_progress=None, cancelled=None):
+        """Write the entries matching term to path decrypted, or encrypted
+        under passphrase for the container format. Returns the row count
+
+        entries defaults to the whole vault, pass a copy of the items to
+        export from a worker thread.
+        """
+        from storage.atomic import atomic_write
+        from utils.export import EXPORT_FORMATS, ContainerWriter, export_entries
+
+        if entries is None:
+            entries = list(self.passwords.items())
+        if self.sealer is not None and term:
+            # Narrowed down on the blind index, confirmed once decrypted
+            from utils.blind_index import query_terms
+            wanted = set(self.search_index.candidates(
+                self.sealer.blind(query_terms(term))))
+            entries = [(key, data) for key, data in entries if key in wanted]
+        count = 0
+
+        def write(f):
+            nonlocal count
+            if format == 'container':
+                writer = ContainerWriter(f, passphrase)
+            else:
+                writer = EXPORT_FORMATS[format](f)
+            count = export_entries(entries, self.cipher, writer, term=term,
+                                   on_progress=on_progress, cancelled=cancelled,
+                                   sealer=self.sealer)
+
+        # Written to a temp file and renamed, a failed or cancelled export
+        # never leaves partial plaintext behind
+        with self.metrics.span("export"):
+            atomic_write(path, write, newline='')
+        self.metrics.count("exported", count)
+        return count
+
+    def import_plan(self, policy):
+        from utils.importer import ImportPlan
+        return ImportPlan(self.passwords, policy, key_of=self.key_of)
+
+    def read_import(self, path, plan, passphrase=None, on_progress=None,
+                    cancelled=None):
+        """Parse, validate and encrypt a file, returns {account: entry}
+
+        Nothing is saved yet, commit the result with put_entries().
+        """
+        from utils.importer import import_rows, read_file
+        with self.metrics.span("import"):
+            return import_rows(read_file(path, passphrase), self.cipher, plan,
+                               on_progress=on_progress, cancelled=cancelled,
+                               sealer=self.sealer)
+
+    def check_header(self, header_generation):
+        """Raise KeysChangedError if the header changed since header_generation
+
+        For work encrypted on a worker thread, under the keys of its start.
+        Returns the changes of the refresh it does.
+        """
+        changes = self.refresh()
+        if header_generation != self.header_generation:
+            raise KeysChangedError("The vault keys were changed in another "
+                                   "window meanwhile, please try again")
+        return changes
+
+    def put_entries(self, entries, header_generation=None):
+        """Save many encrypted entries at once
+
+        Pass the header_generation of when they were encrypted, unless
+        they were encrypted just now. Returns the changes like put().
+        """
+        if header_generation is None:
+            changes = self.refresh()
+        else:
+            changes = self.check_header(header_generation)
+        with self.metrics.span("history"):
+            # Imports that replace entries keep what they replaced
+            self.keep_versions([key for key in entries if key in self.passwords])
+        with self.metrics.span("put_many"):
+            self.store.put_many(entries)
+        for account, entry in entries.items():
+            self.search_index.add(account, entry['username'])
+            self.decrypted.invalidate(account)
+        changes.update(entries)
+        return changes
+
+    def import_file(self, path, policy, passphrase=None, on_progress=None):
+        """Import a CSV, JSON or container file in one save, returns the plan"""
+        plan = self.import_plan(policy)
+        self.sync_header()
+        generation = self.header_generation
+        self.put_entries(self.read_import(path, plan, passphrase,
+                                          on_progress=on_progress), generation)
+        return plan
+
+    # Backups
+
+    def backup(self, entries=None, header=None):
+        """Snapshot the vault, returns the manifest
+
+        Entries are replaced, never mutated, so a shallow copy of the dict
+        is a consistent snapshot to back up from a worker thread.
+        """
+        if entries is None:
+            entries, header = dict(self.passwords), self.header
+        with self.metrics.span("backup"):
+            return self.backups.snapshot(entries, header)
+
+    def write_archive(self, path, snapshot_id=None, compression='zlib',
+                      on_progress=None, cancelled=None):
+        """Write a snapshot, or the vault as it is, to a backup archive"""
+        from storage.archive import write_archive
+        from storage.atomic import atomic_write
+
+        if snapshot_id is None:
+            entries, header, total = (self.passwords.items(), self.header,
+                                      len(self.passwords))
+        else:
+            # The snapshot streams chunk by chunk into the archive
+            manifest = self.backups.manifest(snapshot_id)
+            entries = self.backups.iter_entries(manifest['id'])
+            header, total = manifest['header'], manifest['entries']
+        stats = {}
+
+        def write(f):
+            stats.update(write_archive(
+                f, entries, header, compression=compression, total=total,
+                on_progress=on_progress, cancelled=cancelled))
+
+        atomic_write(path, write, mode='wb')
+        return stats
+
+    @staticmethod
+    def read_archive(path, on_progress=None, cancelled=None):
+        """(entries, header) of an archive
+
+        Every block is checked before its entries are taken, a damaged
+        archive fails here and leaves the vault alone. The entries are read
+        whole rather than streamed into the store: only the SQLite store
+        could roll back a half restored vault, the others are rewritten
+        whole by restore() anyway. That holds the archive in memory next to
+        the vault until the restore, about half a kilobyte an entry.
+        """
+        from storage.archive import archive_header, read_archive
+        entries = dict(read_archive(path, on_progress=on_progress,
+                                    cancelled=cancelled))
+        return entries, archive_header(path)
+
+    def restore(self, entries, header):
+        """Replace the vault with backed up entries and their header
+
+        Returns True when the header changed with them, the vault is then
+        locked and needs the master password of the backup's time.
+        """
+        keys = ('kdf', 'wrapped_key', 'next_wrapped_key', 'wrapped_index_key',
+                'sealed')
+        same_keys = header == self.header or (header and self.header and all(
+            header.get(k) == self.header.get(k) for k in keys))
+        if same_keys and self.unlocked:
+            # What the restore overwrites stays in the history
+            with self.metrics.span("history"):
+                self.keep_versions([key for key, data in self.passwords.items()
+                                    if entries.get(key) != data])
+
+        # One rewrite, so the vault is either the old or the restored one
+        self.passwords.clear()
+        self.passwords.update(entries)
+        self.save()
+        self.flush()
+        self.decrypted.clear()
+
+        if same_keys:
+            self.search_index = self.new_index()
+            return False
+
+        # Entries of the backup need the data key of their time
+        with self.header_lock:
+            self.write_header(header)
+        self.search_index = self.new_index()
+        self.lock()
+        return True
@@ -0,0 +1,97 @@
+import threading
+import time
+
+
+class CoalescingWriter:
+    """Runs saves on a background thread, merging bursts into one write.
+
+    ``submit`` only records the latest payload. The writer thread waits
+    until no new payload has arrived for ``delay`` seconds (or until
+    ``max_delay`` seconds have passed since the first one) and then hands
+    the newest payload to ``write``. Older payloads are simply dropped.
+    """
+
+    def __init__(self, write, delay=0.5, max_delay=None):
+        self._write = write
+        self.delay = delay
+        self.max_delay = max_delay if max_delay is not None else delay * 10
+        self._cond = threading.Condition()
+        self._payload = None
+        self._has_payload = False
+        self._first_submit = None
+        self._last_submit = None
+        self._writing = False
+        self._flushing = False
+        self._closed = False
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, payload):
+        """Schedule payload to be written, replacing any pending one"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("writer is closed")
+            now = time.monotonic()
+            if not self._has_payload:
+                self._first_submit = now
+            self._payload = payload
+            self._has_payload = True
+            self._last_submit = now
+            self._cond.notify_all()
+
+    def flush(self):
+        """Write any pending payload now and wait until it is on disk"""
+        with self._cond:
+            self._flushing = True
+            self._cond.notify_all()
+            while self._has_payload or self._writing:
+                self._cond.wait()
+            self._flushing = False
+            error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            with self._cond:
+                self._closed = True
+                self._cond.notify_all()
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._has_payload and not self._closed:
+                    self._cond.wait()
+                if not self._has_payload:
+                    return
+
+                # Debounce, but never hold a payload back forever
+                while not (self._flushing or self._closed):
+                    deadline = min(self._last_submit + self.delay,
+                                   self._first_submit + self.max_delay)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                payload = self._payload
+                self._payload = None
+                self._has_payload = False
+                self._writing = True
+
+            try:
+                self._write(payload)
+            except Exception as e:
+                error = e
+            else:
+                error = None
+
+            with self._cond:
+                self._writing = False
+                if error is not None:
+                    self._error = error
+                self._cond.notify_all()
@@ -0,0 +1,64 @@
+"""Header versions keep older programs away from vaults they would damage"""
+import pytest
+
+import storage.header
+from storage.header import HeaderError
+from storage.vault import VaultStore
+
+MASTER_PASSWORD = "master password"
+
+
+def make_vault(directory, sealed):
+    vault = VaultStore(directory=str(directory), unlock_target=0.01)
+    vault.create(*vault.new_master_key(MASTER_PASSWORD), sealed=sealed)
+    vault.put("github", "alice", "secret")
+    vault.close()
+    return vault
+
+
+def test_plain_vault_stays_readable_by_version_3(tmp_path, monkeypatch):
+    vault = make_vault(tmp_path, sealed=False)
+    assert vault.header['version'] == 3
+
+    monkeypatch.setattr(storage.header, 'HEADER_VERSION', 3)
+    VaultStore(directory=str(tmp_path)).login(MASTER_PASSWORD)
+
+
+def test_version_3_refuses_a_sealed_vault(tmp_path, monkeypatch):
+    vault = make_vault(tmp_path, sealed=True)
+    assert vault.header['version'] == 4
+
+    monkeypatch.setattr(storage.header, 'HEADER_VERSION', 3)
+    with pytest.raises(HeaderError):
+        VaultStore(directory=str(tmp_path))
+
+
+def test_sealing_an_existing_vault_bumps_the_version(tmp_path, monkeypatch):
+    make_vault(tmp_path, sealed=False)
+    vault = VaultStore(directory=str(tmp_path))
+    vault.login(MASTER_PASSWORD)
+    # The index key alone already needs a program that knows sealing
+    sealer, snapshot = vault.sealing()
+    assert vault.header['version'] == 4
+    vault.finish_sealing(vault.seal_entries(sealer, snapshot),
+                         vault.header_generation)
+    vault.close()
+
+    monkeypatch.setattr(storage.header, 'HEADER_VERSION', 3)
+    with pytest.raises(HeaderError):
+        VaultStore(directory=str(tmp_path))
+
+
+def test_version_3_refuses_a_vault_with_history(tmp_path, monkeypatch):
+    make_vault(tmp_path, sealed=False)
+    vault = VaultStore(directory=str(tmp_path))
+    vault.login(MASTER_PASSWORD)
+    # The first overwrite creates the history key, a version 3 rewrap
+    # would drop it and every version with it
+    vault.put("github", "alice", "changed")
+    vault.close()
+    assert vault.header['version'] == 4
+
+    monkeypatch.setattr(storage.header, 'HEADER_VERSION', 3)
+    with pytest.raises(HeaderError):
+        VaultStore(directory=str(tmp_path))
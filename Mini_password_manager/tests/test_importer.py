@@ -0,0 +1,56 @@
+"""Small imports run in this process, larger ones on the process pool"""
+import pytest
+from cryptography.fernet import Fernet
+
+import utils.pool
+from utils.importer import ImportPlan, import_rows
+
+
+def rows(count):
+    return [(line, f"account{line}", "alice", f"secret{line}")
+            for line in range(1, count + 1)]
+
+
+@pytest.fixture
+def spawned(monkeypatch):
+    """Workers the pool was asked for, the pool itself runs in this process"""
+    requested = []
+
+    def fake_map_bounded(func, batches, *args, workers=None, check_cancelled=None):
+        requested.append(workers)
+        for batch in batches:
+            yield func(*args, batch)
+
+    monkeypatch.setattr("utils.importer.map_bounded", fake_map_bounded)
+    return requested
+
+
+def test_small_import_stays_in_process(monkeypatch):
+    def no_pool(workers):
+        raise AssertionError("a one batch import started a process pool")
+
+    monkeypatch.setattr(utils.pool, "spawn_pool", no_pool)
+    cipher = Fernet(Fernet.generate_key())
+
+    entries = import_rows(rows(50), cipher, ImportPlan({}), workers=4,
+                          batch_size=100)
+
+    assert len(entries) == 50
+    assert cipher.decrypt(entries["account7"]['password'].encode()) == b"secret7"
+
+
+def test_import_of_several_batches_uses_the_pool(spawned):
+    cipher = Fernet(Fernet.generate_key())
+
+    entries = import_rows(rows(250), cipher, ImportPlan({}), workers=4,
+                          batch_size=100)
+
+    assert spawned == [4]
+    assert list(entries) == [f"account{line}" for line in range(1, 251)]
+
+
+def test_single_batch_asks_for_one_worker(spawned):
+    import_rows(rows(100), Fernet(Fernet.generate_key()), ImportPlan({}),
+                workers=4, batch_size=100)
+
+    assert spawned == [1]
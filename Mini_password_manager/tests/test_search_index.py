@@ -0,0 +1,89 @@
+"""Ranking only scores a few matches but must agree with scoring them all"""
+import random
+
+import pytest
+
+from storage.vault import VaultStore
+from utils.fuzzy import exact_score, score_entry, top_k
+from utils.search_index import SearchIndex
+
+WORDS = ["git", "github", "legit", "mail", "gmail", "bank", "git-hub", "x"]
+SEPARATORS = ["", "-", ".", "@", "_", "a"]
+
+
+def random_passwords(count, seed):
+    rng = random.Random(seed)
+    passwords = {}
+    while len(passwords) < count:
+        account = rng.choice(SEPARATORS).join(
+            rng.choice(WORDS) for _ in range(rng.randint(1, 3)))
+        # Lengths vary a lot, so the best matches come from several tiers
+        account += str(rng.randint(0, 99)) + "z" * rng.randint(0, 40)
+        username = rng.choice(SEPARATORS).join(
+            rng.choice(WORDS) for _ in range(rng.randint(1, 3)))
+        username += "z" * rng.randint(0, 40)
+        passwords[account] = {'username': username, 'password': "x"}
+    return passwords
+
+
+def scored_all(passwords, term, limit):
+    scored = []
+    for order, (account, data) in enumerate(passwords.items()):
+        score = score_entry(exact_score, term, account.lower(),
+                            data['username'].lower())
+        if score is not None:
+            scored.append((score, order, account))
+    return top_k(scored, limit)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("limit", [10, 50])
+@pytest.mark.parametrize("term", ["g", "gi", "git", "hub", "mail", "a"])
+def test_rank_matches_scoring_every_entry(seed, limit, term):
+    passwords = random_passwords(600, seed)
+    expected = scored_all(passwords, term, limit)
+    assert len(expected) == limit
+
+    assert SearchIndex(passwords).rank(term, limit=limit) == expected
+
+
+def test_rank_tiers_by_first_occurrence():
+    # exact_score() only looks at the first "git", inside "legit"
+    passwords = {f"legit-git{i}": {'username': "u", 'password': "x"}
+                 for i in range(40)}
+    passwords.update({f"bgit{i:02}": {'username': "u", 'password': "x"}
+                      for i in range(40)})
+    assert SearchIndex(passwords).rank("git", limit=5) == \
+        scored_all(passwords, "git", 5)
+
+
+def test_adopted_index_catches_up_with_changes(tmp_path):
+    vault = VaultStore(directory=str(tmp_path), unlock_target=0.01)
+    vault.create(*vault.new_master_key("master password"))
+    for account in ("github", "gitlab", "bank"):
+        vault.put(account, "alice", "secret")
+    vault.search_index = vault.new_index()
+    assert not vault.search_index.ready
+
+    entries = dict(vault.passwords)
+    index = vault.build_index(entries)
+    vault.put("gitea", "bob", "secret")
+    vault.delete("gitlab")
+
+    assert vault.adopt_index(index, entries)
+    assert vault.search_index is index
+    assert vault.search("git") == ["gitea", "github"]
+    vault.close()
+
+
+def test_index_built_by_a_search_is_kept(tmp_path):
+    vault = VaultStore(directory=str(tmp_path), unlock_target=0.01)
+    vault.create(*vault.new_master_key("master password"))
+    vault.put("github", "alice", "secret")
+    entries = dict(vault.passwords)
+    index = vault.build_index(entries)
+
+    vault.search("git")
+    assert not vault.adopt_index(index, entries)
+    assert vault.search_index is not index
+    vault.close()
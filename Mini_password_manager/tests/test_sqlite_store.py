@@ -0,0 +1,63 @@
+"""Two connections to one SQLite vault, as two processes would have"""
+import pytest
+
+from storage.sqlite_store import SqliteStore
+
+
+def entry(username, password):
+    return {'username': username, 'password': password}
+
+
+@pytest.fixture
+def stores(tmp_path):
+    path = str(tmp_path / "vault.db")
+    ours, theirs = SqliteStore(path), SqliteStore(path)
+    ours.load()
+    ours.put("github", entry("alice", "first"))
+    theirs.load()
+    yield ours, theirs
+    ours.close()
+    theirs.close()
+
+
+def test_search_finds_rows_committed_elsewhere(stores):
+    ours, theirs = stores
+    theirs.put("gitlab", entry("bob", "new"))
+
+    assert ours.search("git") == [("github", entry("alice", "first")),
+                                  ("gitlab", entry("bob", "new"))]
+
+
+def test_delete_of_an_entry_edited_elsewhere_keeps_the_edit(stores):
+    ours, theirs = stores
+    theirs.put("github", entry("alice", "second"))
+
+    ours.delete("github")
+
+    assert ours.passwords == {"github": entry("alice", "second")}
+    assert ours.refresh() == {"github": entry("alice", "second")}
+    theirs.refresh()
+    assert theirs.passwords == {"github": entry("alice", "second")}
+
+
+def test_delete_of_an_entry_deleted_elsewhere(stores):
+    ours, theirs = stores
+    theirs.delete("github")
+
+    ours.delete("github")
+
+    assert ours.passwords == {}
+    assert theirs.refresh() == {}
+
+
+def test_put_many_merges_fields_changed_elsewhere(stores):
+    ours, theirs = stores
+    theirs.put("github", entry("alice2", "first"))
+
+    ours.put_many({"github": entry("alice", "second"),
+                   "gitlab": entry("bob", "new")})
+
+    theirs.refresh()
+    assert theirs.passwords == {"github": entry("alice2", "second"),
+                                "gitlab": entry("bob", "new")}
+    assert ours.refresh() == {"github": entry("alice2", "second")}
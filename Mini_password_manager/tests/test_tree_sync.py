@@ -0,0 +1,143 @@
+"""One changed entry costs one row, however long the list"""
+from collections import Counter
+
+import pytest
+
+from gui.tree_sync import TreeReconciler
+
+
+class FakeTree:
+    """The Treeview calls TreeReconciler makes, counted, without a display"""
+
+    def __init__(self):
+        self.children = []
+        self.values = {}
+        self.calls = Counter()
+        self.created = 0
+
+    def insert(self, parent, index, values):
+        self.calls['insert'] += 1
+        item = f"I{self.created}"
+        self.created += 1
+        self.values[item] = values
+        self.children.insert(len(self.children) if index == 'end' else index,
+                             item)
+        return item
+
+    def delete(self, *items):
+        self.calls['delete'] += 1
+        for item in items:
+            del self.values[item]
+            if item in self.children:
+                self.children.remove(item)
+
+    def detach(self, *items):
+        self.calls['detach'] += 1
+        for item in items:
+            self.children.remove(item)
+
+    def move(self, item, parent, index):
+        self.calls['move'] += 1
+        if item in self.children:
+            self.children.remove(item)
+        self.children.insert(index, item)
+
+    def item(self, item, values):
+        self.calls['item'] += 1
+        self.values[item] = values
+
+    def get_children(self):
+        self.calls['get_children'] += 1
+        return tuple(self.children)
+
+    def selection(self):
+        return ()
+
+    def yview_moveto(self, fraction):
+        pass
+
+    def rows(self):
+        return [self.values[item] for item in self.children]
+
+
+@pytest.fixture
+def passwords():
+    return {f"account{i}": "secret" for i in range(10000)}
+
+
+@pytest.fixture
+def view(passwords):
+    computed = Counter()
+
+    def row_values(key):
+        computed[key] += 1
+        return (key, passwords[key])
+
+    view = TreeReconciler(FakeTree(), row_values,
+                          exists=lambda key: key in passwords)
+    view.set_rows(list(passwords))
+    view.tree.calls.clear()
+    view.computed = computed
+    computed.clear()
+    return view
+
+
+def test_one_change_touches_one_row(view, passwords):
+    passwords["account5000"] = "changed"
+    view.apply_changes({"account5000": "entry"})
+
+    assert view.computed == {"account5000": 1}
+    assert view.tree.calls == {'item': 1}
+    assert view.tree.rows()[5000] == ("account5000", "changed")
+
+
+def test_added_and_deleted_rows(view, passwords):
+    del passwords["account3"]
+    passwords["new"] = "secret"
+    view.apply_changes({"account3": None, "new": "entry"})
+
+    assert view.computed == {"new": 1}
+    assert view.tree.calls == {'delete': 1, 'insert': 1}
+    assert view.tree.rows() == [(key, "secret") for key in passwords]
+
+
+def test_showing_the_same_rows_computes_nothing(view, passwords):
+    view.set_rows(list(passwords))
+
+    assert not view.computed
+    assert view.tree.calls == {}
+
+
+def test_search_then_every_row(view, passwords):
+    view.set_rows(["account7", "account2"])
+    assert view.tree.rows() == [("account7", "secret"), ("account2", "secret")]
+
+    # A hidden row that changed is computed when shown again, only then
+    passwords["account9"] = "changed"
+    view.apply_changes({"account9": "entry"})
+    assert not view.computed
+    view.set_rows(list(passwords))
+
+    assert view.computed == {"account9": 1}
+    assert view.tree.rows() == [(key, passwords[key]) for key in passwords]
+    assert 'get_children' not in view.tree.calls
+
+
+def test_invalidate_computes_every_row_again(view, passwords):
+    view.invalidate()
+    view.set_rows(list(passwords))
+
+    assert len(view.computed) == len(passwords)
+    assert view.tree.calls == {}
+
+
+def test_rows_are_sorted_again_only_for_a_new_order(view, passwords):
+    keys = list(passwords)
+    view.set_rows(keys[:3])
+    view.tree.calls.clear()
+
+    view.set_rows([keys[2], keys[0], keys[1]])
+
+    assert view.tree.rows() == [(keys[2], "secret"), (keys[0], "secret"),
+                                (keys[1], "secret")]
+    assert view.tree.calls == {'move': 3}
@@ -0,0 +1,54 @@
+"""Creating a vault never replaces one that is already there"""
+import os
+
+import pytest
+
+from storage.registry import HEADER_FILE
+from storage.vault import VaultExistsError, VaultStore
+
+MASTER_PASSWORD = "master password"
+
+
+@pytest.fixture(params=['journal', 'sqlite', 'binary', 'json'])
+def directory(request, tmp_path):
+    vault = VaultStore(request.param, directory=str(tmp_path), save_delay=0,
+                       unlock_target=0.01)
+    vault.create(*vault.new_master_key(MASTER_PASSWORD))
+    vault.put("github", "alice", "secret")
+    vault.close()
+    return request.param, str(tmp_path)
+
+
+def read_header(directory):
+    with open(os.path.join(directory, HEADER_FILE), 'rb') as f:
+        return f.read()
+
+
+def test_create_refuses_a_populated_vault(directory):
+    storage, path = directory
+    header = read_header(path)
+
+    vault = VaultStore(storage, directory=path, unlock_target=0.01)
+    with pytest.raises(VaultExistsError):
+        vault.create(*vault.new_master_key("another password"))
+    vault.close()
+
+    assert read_header(path) == header
+    vault = VaultStore(storage, directory=path)
+    vault.login(MASTER_PASSWORD)
+    assert list(vault.passwords) == ["github"]
+    assert vault.decrypt_password("github") == "secret"
+    vault.close()
+
+
+def test_create_refuses_entries_without_a_header(directory):
+    # A vault from before the header still has entries worth keeping
+    storage, path = directory
+    os.remove(os.path.join(path, HEADER_FILE))
+
+    vault = VaultStore(storage, directory=path, unlock_target=0.01)
+    with pytest.raises(VaultExistsError):
+        vault.create(*vault.new_master_key("another password"))
+    vault.close()
+
+    assert not os.path.exists(os.path.join(path, HEADER_FILE))
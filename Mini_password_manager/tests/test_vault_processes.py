@@ -0,0 +1,120 @@
+"""Two processes sharing one vault while one of them changes its keys"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from storage.vault import KeysChangedError, VaultStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MASTER_PASSWORD = "master password"
+
+# Process A: log in, then change the vault keys while B stays open
+OTHER_PROCESS = """
+import sys
+from storage.vault import KeysChangedError, VaultStore
+
+directory, storage, action = sys.argv[1:]
+vault = VaultStore(storage, directory=directory)
+vault.login({password!r})
+if action == 'rotate':
+    engine, snapshot = vault.rotation()
+    tokens = engine.run((account, data['password'])
+                        for account, data in snapshot.items())
+    vault.finish_rotation(engine, snapshot, tokens)
+else:
+    vault.rewrap(*vault.derive_new_master_key(
+        {password!r}, "another password", None, vault.header))
+vault.close()
+""".format(password=MASTER_PASSWORD)
+
+
+def run_other_process(directory, storage, action):
+    subprocess.run([sys.executable, "-c", OTHER_PROCESS, directory, storage, action],
+                   cwd=ROOT, check=True)
+
+
+@pytest.fixture(params=['journal', 'sqlite', 'binary', 'json'])
+def vault(request, tmp_path):
+    vault = VaultStore(request.param, directory=str(tmp_path), save_delay=0,
+                       unlock_target=0.01)
+    vault.create(*vault.new_master_key(MASTER_PASSWORD))
+    vault.put("github", "alice", "first")
+    vault.flush()
+    yield vault
+    vault.close()
+
+
+def reopen(vault, password=MASTER_PASSWORD):
+    other = VaultStore(vault.storage_mode, directory=vault.directory)
+    other.login(password)
+    return other
+
+
+def test_changes_after_another_process_rotated_the_data_key(vault):
+    run_other_process(vault.directory, vault.storage_mode, 'rotate')
+
+    vault.put("github", "alice", "second")
+    vault.put("gitlab", "bob", "new")
+    vault.flush()
+
+    fresh = reopen(vault)
+    try:
+        assert fresh.decrypt_password("github") == "second"
+        assert fresh.decrypt_password("gitlab") == "new"
+        assert [version[1:] for version in fresh.versions("github")] == [
+            ("alice", "first")]
+    finally:
+        fresh.close()
+
+
+def test_refresh_picks_up_the_rotated_header(vault):
+    old_key = vault.header['wrapped_key']
+    run_other_process(vault.directory, vault.storage_mode, 'rotate')
+
+    vault.refresh()
+    assert vault.header['wrapped_key'] != old_key
+    assert vault.decrypt_password("github") == "first"
+
+
+def test_header_writes_keep_changes_of_another_process(vault):
+    run_other_process(vault.directory, vault.storage_mode, 'rotate')
+    rotated_key = VaultStore(vault.storage_mode,
+                             directory=vault.directory).header['wrapped_key']
+
+    # Creates the history key, a stale header would drop the rotation
+    vault.versions("github")
+    fresh = reopen(vault)
+    try:
+        assert 'wrapped_history_key' in fresh.header
+        assert fresh.header['wrapped_key'] == rotated_key
+        assert fresh.decrypt_password("github") == "first"
+    finally:
+        fresh.close()
+
+
+def test_master_password_changed_elsewhere_locks(vault):
+    run_other_process(vault.directory, vault.storage_mode, 'rewrap')
+
+    with pytest.raises(KeysChangedError):
+        vault.put("gitlab", "bob", "new")
+    assert not vault.unlocked
+    fresh = reopen(vault, "another password")
+    try:
+        assert "gitlab" not in fresh.passwords
+        assert fresh.decrypt_password("github") == "first"
+    finally:
+        fresh.close()
+
+
+def test_import_encrypted_before_a_rotation_is_refused(vault, tmp_path):
+    source = tmp_path / "import.csv"
+    source.write_text("Account,Username,Password\ngitlab,bob,new\n")
+    generation = vault.header_generation
+    entries = vault.read_import(str(source), vault.import_plan('skip'))
+    run_other_process(vault.directory, vault.storage_mode, 'rotate')
+
+    with pytest.raises(KeysChangedError):
+        vault.put_entries(entries, generation)
+    assert "gitlab" not in vault.passwords
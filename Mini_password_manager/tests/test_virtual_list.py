@@ -0,0 +1,99 @@
+"""Arrow keys move the selection without searching the whole key list"""
+import pytest
+
+from gui.virtual_list import VirtualTreeview
+
+
+class FakeTree:
+    """The few Treeview calls VirtualTreeview makes, without a display"""
+
+    def __init__(self):
+        self.items = []
+        self.selected = ()
+
+    def bind(self, sequence, callback):
+        pass
+
+    def insert(self, parent, index):
+        item = f"I{len(self.items)}"
+        self.items.append(item)
+        return item
+
+    def delete(self, item):
+        self.items.remove(item)
+
+    def item(self, item, values):
+        pass
+
+    def selection(self):
+        return self.selected
+
+    def selection_set(self, items):
+        self.selected = tuple(items)
+
+    def yview_moveto(self, fraction):
+        pass
+
+
+class FakeScrollbar:
+    def configure(self, command):
+        pass
+
+    def set(self, first, last):
+        pass
+
+
+class CountingKeys(list):
+    """A key list that counts the linear searches made in it"""
+
+    searches = 0
+
+    def index(self, *args):
+        CountingKeys.searches += 1
+        return super().index(*args)
+
+
+@pytest.fixture
+def view(monkeypatch):
+    monkeypatch.setattr(VirtualTreeview, 'visible_rows', lambda self: 10)
+    CountingKeys.searches = 0
+    return VirtualTreeview(FakeTree(), FakeScrollbar(), lambda key: (key,))
+
+
+def click(view, item):
+    view.tree.selected = (item,)
+    view._on_select(None)
+
+
+def test_arrow_keys_do_not_search_the_keys(view):
+    view.set_rows(CountingKeys(f"account{i}" for i in range(10000)))
+    click(view, view.tree.items[3])
+
+    for _ in range(500):
+        view._move_selection(1)
+
+    assert view.selected_key == "account503"
+    assert view.offset == 494
+    assert CountingKeys.searches == 0
+
+
+def test_selection_is_looked_up_once_after_the_keys_change(view):
+    view.set_rows([f"account{i}" for i in range(100)])
+    click(view, view.tree.items[5])
+
+    view.set_rows(CountingKeys(["new"] + [f"account{i}" for i in range(100)]))
+    view._move_selection(1)
+    view._move_selection(1)
+
+    assert view.selected_key == "account7"
+    assert CountingKeys.searches == 1
+
+
+def test_selection_gone_from_the_keys_ignores_arrow_keys(view):
+    view.set_rows([f"account{i}" for i in range(100)])
+    click(view, view.tree.items[5])
+
+    view.set_rows(["other"])
+
+    assert view._move_selection(1) is None
+    assert view.selected_key == "account5"
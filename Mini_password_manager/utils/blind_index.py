@@ -0,0 +1,184 @@
+"""Full-entry encryption with keyed blind indexes for search.
+
+A sealed vault stores no account or username in the clear. The vault
+dict is keyed by an HMAC of the account, and each entry keeps the two
+fields every backend stores:
+
+- ``password`` is one Fernet token over account, username and password
+- ``username`` holds the blind index, HMACs of the normalized trigrams
+  of account and username plus the one and two character prefixes of
+  their words, truncated and sorted
+
+The HMAC key is a random key of its own, wrapped by the master key in the
+header, so rotating the data key leaves indexes alone. A query is turned
+into the same HMACs and matched against the indexes without decrypting
+anything, only the candidates are decrypted to confirm and display them.
+The indexes do reveal which entries share trigrams; that is the price of
+searching without the key to the entries.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import re
+import unicodedata
+
+from utils.search_index import trigrams
+
+# Marks the username field of a sealed entry
+SEALED_PREFIX = "bi1:"
+# Bytes of HMAC kept per token: collisions only cost an extra decryption
+TOKEN_BYTES = 6
+WORD = re.compile(r"\w+")
+
+
+def normalize(text):
+    return unicodedata.normalize('NFKC', text).lower()
+
+
+def is_sealed(entry):
+    return entry['username'].startswith(SEALED_PREFIX)
+
+
+def terms(account, username):
+    """Plain index terms of an entry"""
+    found = set()
+    for text in (normalize(account), normalize(username)):
+        found |= trigrams(text)
+        for word in WORD.findall(text):
+            # Queries too short for a trigram match word prefixes
+            found.add("\0" + word[:1])
+            found.add("\0" + word[:2])
+    return found
+
+
+def query_terms(term):
+    """Terms an entry must have to possibly match term, empty for all"""
+    term = normalize(term)
+    if len(term) >= 3:
+        return trigrams(term)
+    return {"\0" + term} if term else set()
+
+
+def matches(term, account, username):
+    """Whether a decrypted entry really matches what query_terms() found"""
+    term = normalize(term)
+    account, username = normalize(account), normalize(username)
+    if len(term) >= 3:
+        return term in account or term in username
+    return any(word.startswith(term)
+               for word in WORD.findall(account) + WORD.findall(username))
+
+
+class EntrySealer:
+    """Seals and opens entries and hashes index terms.
+
+    Picklable, so import and export workers in other processes can seal
+    and open entries themselves.
+    """
+
+    def __init__(self, cipher, index_key):
+        self.cipher = cipher
+        self.index_key = base64.urlsafe_b64decode(index_key)
+
+    def _mac(self, data):
+        return hmac.new(self.index_key, data.encode(), hashlib.sha256).digest()
+
+    def entry_id(self, account):
+        """Dict key of account, the same for the same account every time"""
+        return base64.urlsafe_b64encode(self._mac("id\0" + account)[:12]).decode()
+
+    def blind(self, plain_terms):
+        return {base64.urlsafe_b64encode(self._mac(term)[:TOKEN_BYTES]).decode()
+                for term in plain_terms}
+
+    def index(self, account, username):
+        """The blind index stored in a sealed entry's username field"""
+        return SEALED_PREFIX + " ".join(sorted(self.blind(terms(account, username))))
+
+    def seal(self, account, username, password):
+        """(dict key, sealed entry)"""
+        token = self.cipher.encrypt(json.dumps([account, username, password]).encode())
+        return self.entry_id(account), {'username': self.index(account, username),
+                                        'password': token.decode()}
+
+    def open(self, entry):
+        """(account, username, password) of a sealed entry"""
+        return tuple(json.loads(self.cipher.decrypt(entry['password'].encode())))
+
+
+class BlindIndex:
+    """Inverted index from blind tokens to the entries holding them.
+
+    Same interface as SearchIndex for keeping it up to date, ``add`` gets
+    the username field, which for a sealed entry is its blind index. Built
+    from the stored tokens alone, it needs no key. Given a passwords dict
+    it is built on first use.
+    """
+
+    def __init__(self, passwords=None):
+        self._ids = {}  # key -> entry id, ids grow with insertion order
+        self._keys = {}  # entry id -> key
+        self._tokens = {}  # entry id -> its tokens
+        self._postings = {}
+        self._next_id = 0
+        self._pending = passwords
+
+    def build(self, passwords):
+        self.clear()
+        for key, data in passwords.items():
+            self.add(key, data['username'])
+
+    def add(self, key, index):
+        if self._pending is not None:
+            return
+        tokens = set(index[len(SEALED_PREFIX):].split())
+        entry_id = self._ids.get(key)
+        if entry_id is None:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._ids[key] = entry_id
+            self._keys[entry_id] = key
+            old = set()
+        else:
+            old = self._tokens[entry_id]
+        self._unpost(entry_id, old - tokens)
+        for token in tokens - old:
+            self._postings.setdefault(token, set()).add(entry_id)
+        self._tokens[entry_id] = tokens
+
+    def remove(self, key):
+        if self._pending is not None:
+            return
+        entry_id = self._ids.pop(key, None)
+        if entry_id is None:
+            return
+        del self._keys[entry_id]
+        self._unpost(entry_id, self._tokens.pop(entry_id))
+
+    def clear(self):
+        self._pending = None
+        self._ids.clear()
+        self._keys.clear()
+        self._tokens.clear()
+        self._postings.clear()
+
+    def candidates(self, tokens):
+        """Keys of entries holding every token, in insertion order"""
+        if self._pending is not None:
+            self.build(self._pending)
+        if not tokens:
+            return list(self._ids)
+        postings = sorted((self._postings.get(token, ()) for token in tokens),
+                          key=len)
+        if not postings[0]:
+            return []
+        found = set(postings[0]).intersection(*postings[1:])
+        return [self._keys[entry_id] for entry_id in sorted(found)]
+
+    def _unpost(self, entry_id, tokens):
+        for token in tokens:
+            posting = self._postings[token]
+            posting.discard(entry_id)
+            if not posting:
+                del self._postings[token]
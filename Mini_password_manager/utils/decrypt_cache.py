@@ -0,0 +1,75 @@
+import time
+from collections import OrderedDict
+
+
+class DecryptCache:
+    """Size-bounded LRU of decrypted passwords that expire after ttl seconds.
+
+    Plaintext only lives here for a short while, callers must invalidate
+    an account whenever its ciphertext changes and clear the whole cache
+    when the key changes or the vault locks.
+    """
+
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+        item = self._entries.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        value, expires = item
+        if expires <= time.monotonic():
+            del self._entries[key]
+            self.evictions += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def purge_expired(self):
+        """Drop every expired value, returns how many were dropped"""
+        now = time.monotonic()
+        expired = [key for key, (_, expires) in self._entries.items()
+                   if expires <= now]
+        for key in expired:
+            del self._entries[key]
+        self.evictions += len(expired)
+        return len(expired)
+
+    def clear(self):
+        # Python strings cannot be zeroed, dropping every reference is the
+        # best we can do to let the plaintext be freed
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
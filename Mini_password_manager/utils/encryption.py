@@ -1,23 +1,16 @@
 from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-import base64
-import os
+
+from utils.kdf import calibrate, derive_key
 
 class Encryptor:
-    def __init__(self):
-        self.salt = os.urandom(16)
+    def __init__(self, params=None):
+        # Random salt and costs tuned for this machine, keep self.params
+        # (e.g. in the vault header) to derive the same key again later
+        self.params = params or calibrate()
     
     def generate_key(self, master_password):
         """Generate encryption key from master password"""
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=self.salt,
-            iterations=100000,
-        )
-        key = base64.urlsafe_b64encode(kdf.derive(master_password.encode()))
-        return key
+        return derive_key(master_password, self.params)
     
     def encrypt_data(self, data, key):
         """Encrypt string data"""
@@ -30,4 +23,4 @@ class Encryptor:
             f = Fernet(key)
             return f.decrypt(encrypted_data.encode()).decode()
         except:
-            return "**Decryption Failed**" 
\ No newline at end of file
+            return "**Decryption Failed**"
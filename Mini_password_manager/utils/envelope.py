@@ -0,0 +1,32 @@
+# cryptography is imported on first use, the login screen does not need it
+
+
+def new_data_key():
+    from cryptography.fernet import Fernet
+    return Fernet.generate_key()
+
+
+def wrap_key(master_key, data_key):
+    """Encrypt data_key under the key derived from the master password"""
+    from cryptography.fernet import Fernet
+    return Fernet(master_key).encrypt(data_key).decode()
+
+
+def unwrap_key(master_key, wrapped):
+    from cryptography.fernet import Fernet
+    return Fernet(master_key).decrypt(wrapped.encode())
+
+
+def data_cipher(master_key, header):
+    """Cipher for vault entries described by header
+
+    While a data key rotation is in progress it encrypts with the new key
+    and decrypts entries under either key.
+    """
+    from cryptography.fernet import Fernet, MultiFernet
+    current = Fernet(unwrap_key(master_key, header['wrapped_key']))
+    if 'next_wrapped_key' not in header:
+        return current
+    upcoming = Fernet(unwrap_key(master_key, header['next_wrapped_key']))
+    return MultiFernet([upcoming, current])
+
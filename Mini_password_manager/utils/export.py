@@ -0,0 +1,190 @@
+import csv
+import json
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from utils.kdf import (calibrate, derive_key, key_check, new_vault_id,
+                       verify_key)
+from utils.pool import map_bounded
+
+CONTAINER_MAGIC = "PWEXPORT 1"
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class ContainerError(Exception):
+    pass
+
+
+class CsvWriter:
+    name = "CSV"
+    extension = ".csv"
+
+    def __init__(self, f):
+        self.writer = csv.writer(f)
+        self.writer.writerow(['Account', 'Username', 'Password'])
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        pass
+
+
+class JsonLinesWriter:
+    name = "JSON Lines"
+    extension = ".jsonl"
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, rows):
+        self.f.write("".join(
+            json.dumps({'account': account, 'username': username,
+                        'password': password}) + "\n"
+            for account, username, password in rows))
+
+    def close(self):
+        pass
+
+
+class ContainerWriter:
+    """Export encrypted under a passphrase of its own, not the master key.
+
+    A text file: a magic line, a JSON line with the KDF parameters and a
+    key check, then one Fernet token per block of rows. The last token
+    holds the row count, so a truncated file is detected on import.
+    """
+
+    name = "Encrypted container"
+    extension = ".pwx"
+
+    def __init__(self, f, passphrase, params=None):
+        self.f = f
+        params = params or calibrate()
+        key = derive_key(passphrase, params)
+        export_id = new_vault_id()
+        self.fernet = Fernet(key)
+        self.count = 0
+        f.write(CONTAINER_MAGIC + "\n")
+        f.write(json.dumps({'kdf': params, 'export_id': export_id,
+                            'key_check': key_check(key, export_id)}) + "\n")
+
+    def write(self, rows):
+        if rows:
+            self.count += len(rows)
+            self.f.write(self.fernet.encrypt(json.dumps(rows).encode()).decode()
+                         + "\n")
+
+    def close(self):
+        trailer = json.dumps({'count': self.count}).encode()
+        self.f.write(self.fernet.encrypt(trailer).decode() + "\n")
+
+
+EXPORT_FORMATS = {
+    'csv': CsvWriter,
+    'jsonl': JsonLinesWriter,
+    'container': ContainerWriter,
+}
+
+
+def read_container(f, passphrase):
+    """Yield (account, username, password) rows from an encrypted container"""
+    if f.readline().rstrip("\n") != CONTAINER_MAGIC:
+        raise ContainerError("Not an encrypted password export")
+    header = json.loads(f.readline())
+    key = derive_key(passphrase, header['kdf'])
+    if not verify_key(key, header['export_id'], header['key_check']):
+        raise ContainerError("Wrong passphrase for this export")
+    fernet = Fernet(key)
+
+    count = 0
+    for line in f:
+        try:
+            block = json.loads(fernet.decrypt(line.strip().encode()))
+        except InvalidToken:
+            raise ContainerError("The export is damaged") from None
+        if isinstance(block, dict):
+            if block['count'] != count:
+                raise ContainerError("The export is incomplete")
+            return
+        count += len(block)
+        for account, username, password in block:
+            yield account, username, password
+    raise ContainerError("The export is incomplete")
+
+
+def matches(term, account, username):
+    """Case-insensitive substring filter on account and username"""
+    return not term or term in account.lower() or term in username.lower()
+
+
+def _decrypt_batch(cipher, batch):
+    # Worker process, gets a picklable cipher and (account, username, token)
+    return [(account, username, cipher.decrypt(token.encode()).decode())
+            for account, username, token in batch]
+
+
+def _open_batch(sealer, batch):
+    # Worker process, sealed entries carry account and username in the token
+    return [sealer.open({'password': token}) for _, _, token in batch]
+
+
+def export_entries(entries, cipher, writer, term=None, workers=None,
+                   batch_size=1000, on_progress=None, cancelled=None,
+                   sealer=None):
+    """Decrypt (account, entry) pairs and stream them into writer in order
+
+    Decryption runs on a process pool. At most two batches per worker are
+    in flight, so plaintext held in memory stays bounded whatever the vault
+    size. on_progress(scanned, total) runs after each batch, cancelled() is
+    polled between batches. Returns the number of rows written.
+
+    Entries of a sealed vault are opened with sealer, and only filtered
+    by term once decrypted.
+    """
+    term = term.lower() if term else None
+    decrypt, key = (_decrypt_batch, cipher) if sealer is None else (_open_batch, sealer)
+    total = len(entries)
+    written = 0
+    scanned = 0
+
+    def batches():
+        nonlocal scanned
+        batch = []
+        for account, data in entries:
+            scanned += 1
+            username = data['username']
+            # Filtering never needs a decryption, except for sealed entries
+            if sealer is not None or matches(term, account, username):
+                batch.append((account, username, data['password']))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def emit(rows):
+        nonlocal written
+        if sealer is not None and term:
+            rows = [row for row in rows if matches(term, row[0], row[1])]
+        writer.write(rows)
+        written += len(rows)
+        if on_progress:
+            on_progress(scanned, total)
+
+    def check_cancelled():
+        if cancelled and cancelled():
+            raise ExportCancelled()
+
+    # Spawning processes costs more than a small export takes
+    if total <= batch_size:
+        workers = 1
+    for rows in map_bounded(decrypt, batches(), key, workers=workers,
+                            check_cancelled=check_cancelled):
+        emit(rows)
+
+    writer.close()
+    return written
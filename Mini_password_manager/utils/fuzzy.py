@@ -0,0 +1,120 @@
+import heapq
+import re
+
+# Match kinds, every substring match outranks every subsequence match,
+# which in turn outranks every match that needs a typo correction
+EXACT = 3000
+SUBSEQUENCE = 2000
+TYPO = 1000
+
+BOUNDARY = set(" .-_@/:")
+
+
+def max_typos(term):
+    return 1 if len(term) < 8 else 2
+
+
+def subsequence_pattern(term):
+    """Regex finding term's characters in order within one NUL-separated field"""
+    return re.compile("[^\0]*?".join(re.escape(c) for c in term))
+
+
+def bounded_edit_distance(term, text, limit):
+    """Fewest edits turning term into some substring of text, or None if > limit
+
+    Myers' bit-parallel algorithm: a DP column over term is held as bit
+    vectors of its vertical +1/-1 deltas, so each character of text costs
+    a few integer operations instead of a pass over term.
+    """
+    if not term:
+        return 0
+    masks = {}
+    for i, char in enumerate(term):
+        masks[char] = masks.get(char, 0) | 1 << i
+    full = (1 << len(term)) - 1
+    last = 1 << len(term) - 1
+    positive, negative = full, 0
+    distance = best = len(term)
+    for char in text:
+        match = masks.get(char, 0)
+        vertical = match | negative
+        horizontal = (((match & positive) + positive) ^ positive) | match
+        up = negative | ~(horizontal | positive)
+        down = positive & horizontal
+        if up & last:
+            distance += 1
+        elif down & last:
+            distance -= 1
+        if distance < best:
+            best = distance
+        # A match may start anywhere in text, so row 0 stays free: no
+        # carry into the lowest bit
+        up <<= 1
+        down <<= 1
+        positive = (down | ~(vertical | up)) & full
+        negative = up & vertical & full
+    return best if best <= limit else None
+
+
+def _boundary_bonus(text, index):
+    if index == 0:
+        return 100
+    if text[index - 1] in BOUNDARY:
+        return 50
+    return 0
+
+
+def exact_score(term, text):
+    """Score term as a substring of one lowercase field, None for no match"""
+    index = text.find(term)
+    if index == -1:
+        return None
+    return EXACT + _boundary_bonus(text, index) - len(text)
+
+
+def subsequence_score(term, text):
+    """Score term's characters appearing in order, rewarding runs"""
+    score = SUBSEQUENCE
+    position = -1
+    previous = -2
+    for char in term:
+        position = text.find(char, position + 1)
+        if position == -1:
+            return None
+        if position == previous + 1:
+            score += 15
+        elif previous >= 0:
+            score -= position - previous - 1
+        if position == 0 or text[position - 1] in BOUNDARY:
+            score += 10
+        previous = position
+    return score - len(text)
+
+
+def typo_score(term, text):
+    """Score term as a substring of text after correcting a few typos"""
+    distance = bounded_edit_distance(term, text, max_typos(term))
+    if distance is None:
+        return None
+    return TYPO - 200 * distance - len(text)
+
+
+def score_entry(scorer, term, account, username):
+    """Best score over account and username, account matches rank higher"""
+    account_score = scorer(term, account)
+    username_score = scorer(term, username)
+    if account_score is not None:
+        account_score += 20
+    scores = [score for score in (account_score, username_score)
+              if score is not None]
+    return max(scores) if scores else None
+
+
+def top_k(scored, limit):
+    """Best limit (score, order, key) triples, highest score first
+
+    Ties keep the order the entries were added in.
+    """
+    best = heapq.nlargest(limit, ((score, -order, key)
+                                  for score, order, key in scored))
+    return [key for _, _, key in best]
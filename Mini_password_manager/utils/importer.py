@@ -0,0 +1,277 @@
+import csv
+import hashlib
+import itertools
+import json
+import os
+
+from utils.export import read_container
+from utils.pool import map_bounded
+
+# Header names used by common password manager exports, best first
+ACCOUNT_COLUMNS = ('account', 'name', 'title', 'url', 'login_uri', 'website')
+USERNAME_COLUMNS = ('username', 'login_username', 'login name', 'login',
+                    'user', 'email')
+PASSWORD_COLUMNS = ('password', 'login_password')
+
+# What to do when an imported account already exists
+SKIP = "skip"
+REPLACE = "replace"
+KEEP_BOTH = "keep_both"
+
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportCancelled(Exception):
+    pass
+
+
+class ImportFormatError(Exception):
+    pass
+
+
+def _pick_column(fieldnames, candidates):
+    normalized = {name.strip().lower(): name for name in fieldnames if name}
+    for candidate in candidates:
+        if candidate in normalized:
+            return normalized[candidate]
+    return None
+
+
+def read_csv(f):
+    """Yield (line, account, username, password) from a CSV export
+
+    Understands this app's export and the column names used by Chrome,
+    Firefox, Bitwarden, LastPass, KeePass and 1Password.
+    """
+    reader = csv.DictReader(f)
+    fieldnames = reader.fieldnames or []
+    account_column = _pick_column(fieldnames, ACCOUNT_COLUMNS)
+    username_column = _pick_column(fieldnames, USERNAME_COLUMNS)
+    password_column = _pick_column(fieldnames, PASSWORD_COLUMNS)
+    if account_column is None or password_column is None:
+        raise ImportFormatError(
+            "The CSV needs an account (or name, title, url) and a password column")
+
+    for row in reader:
+        account = row.get(account_column) or ''
+        if not account.strip() and account_column != 'url':
+            # Browsers leave the name empty, the site is the next best thing
+            url_column = _pick_column(fieldnames, ('url', 'login_uri'))
+            account = (row.get(url_column) or '') if url_column else ''
+        username = (row.get(username_column) or '') if username_column else ''
+        yield reader.line_num, account, username, row.get(password_column) or ''
+
+
+def read_json(f):
+    """Yield (line, account, username, password) from a JSON export
+
+    JSON Lines and top-level arrays are streamed. A pretty-printed object
+    is loaded whole: Bitwarden's {"items": [...]} or the vault's own
+    {account: {username, password}} layout.
+    """
+    first = f.read(1)
+    while first and first.isspace():
+        first = f.read(1)
+    if first == '[':
+        records = _stream_array(f)
+    elif first == '{':
+        line = first + f.readline()
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # Pretty-printed, so a single document
+            records = _object_records(json.loads(line + f.read()))
+        else:
+            records = itertools.chain(_object_records(record), _json_lines(f))
+    elif not first:
+        return
+    else:
+        raise ImportFormatError("Not a JSON password export")
+
+    for number, record in enumerate(records, 1):
+        if not isinstance(record, dict):
+            yield number, '', '', ''
+            continue
+        login = record.get('login') or {}
+        account = _first(record, ACCOUNT_COLUMNS)
+        username = _first(record, USERNAME_COLUMNS) or login.get('username') or ''
+        password = _first(record, PASSWORD_COLUMNS) or login.get('password') or ''
+        yield number, account or '', username, password
+
+
+def _first(record, names):
+    for name in names:
+        value = record.get(name)
+        if isinstance(value, str) and value:
+            return value
+    return None
+
+
+def _json_lines(f):
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _object_records(data):
+    if isinstance(data.get('items'), list):
+        return data['items']
+    if all(isinstance(value, dict) for value in data.values()):
+        # {account: {username, password}}, the layout of the vault itself
+        return [dict(value, account=account) for account, value in data.items()]
+    return [data]
+
+
+def _stream_array(f, chunk_size=64 * 1024):
+    # Decode one element at a time so the file never sits in memory whole
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            record, end = decoder.raw_decode(buffer)
+        except ValueError:
+            if eof:
+                raise ImportFormatError("The JSON export is truncated")
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        # A record cut at the chunk boundary can still parse (e.g. a number)
+        if end == len(buffer) and not eof:
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield record
+        buffer = buffer[end:]
+
+
+def read_file(path, passphrase=None):
+    """Pick the reader for path from its extension, yields parsed rows"""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if extension == '.pwx':
+            for number, row in enumerate(read_container(f, passphrase), 1):
+                yield (number,) + row
+        elif extension in ('.json', '.jsonl'):
+            yield from read_json(f)
+        else:
+            yield from read_csv(f)
+
+
+class ImportPlan:
+    """Validates and deduplicates parsed rows as they stream past.
+
+    Rows need an account and a password. A row repeating an earlier one
+    exactly is dropped. Otherwise an account that is already taken, in the
+    vault or earlier in the file, is skipped, replaced or kept under a
+    new name ("github (2)") depending on policy.
+    """
+
+    def __init__(self, existing_accounts, policy=SKIP, key_of=None):
+        # Vault keys, key_of maps an account to its key where they differ
+        self.existing = set(existing_accounts)
+        self.key_of = key_of or (lambda account: account)
+        self.policy = policy
+        self.seen = {}  # account -> digest of (username, password) imported
+        self.stats = {'read': 0, 'imported': 0, 'invalid': 0,
+                      'duplicates': 0, 'skipped': 0, 'replaced': 0,
+                      'renamed': 0}
+        self.errors = []
+
+    def accept(self, line, account, username, password):
+        """Account name to import the row under, or None to drop it"""
+        self.stats['read'] += 1
+        account = account.strip()
+        if not account or not password:
+            self.stats['invalid'] += 1
+            if len(self.errors) < MAX_REPORTED_ERRORS:
+                missing = "account" if not account else "password"
+                self.errors.append(f"Row {line}: missing {missing}")
+            return None
+
+        digest = hashlib.sha256(
+            json.dumps([username, password]).encode()).digest()
+        if self.seen.get(account) == digest:
+            self.stats['duplicates'] += 1
+            return None
+        if self.key_of(account) in self.existing or account in self.seen:
+            if self.policy == SKIP:
+                self.stats['skipped'] += 1
+                return None
+            if self.policy == REPLACE:
+                self.stats['replaced'] += 1
+            else:
+                account = self._free_name(account)
+                self.stats['renamed'] += 1
+        self.seen[account] = digest
+        self.stats['imported'] += 1
+        return account
+
+    def _free_name(self, account):
+        number = 2
+        while (self.key_of(f"{account} ({number})") in self.existing
+               or f"{account} ({number})" in self.seen):
+            number += 1
+        return f"{account} ({number})"
+
+
+def _encrypt_batch(cipher, batch):
+    # Worker process, gets a picklable cipher and (account, username, password)
+    return [(account, {'username': username,
+                       'password': cipher.encrypt(password.encode()).decode()})
+            for account, username, password in batch]
+
+
+def _seal_batch(sealer, batch):
+    # Worker process, like _encrypt_batch for vaults that seal whole entries
+    return [sealer.seal(account, username, password)
+            for account, username, password in batch]
+
+
+def import_rows(rows, cipher, plan, workers=None, batch_size=1000,
+                on_progress=None, cancelled=None, sealer=None):
+    """Encrypt accepted rows on a process pool, returns {account: entry}
+
+    With a sealer the whole entry is sealed and keyed by its entry id.
+    Nothing is saved here, so the caller can commit the whole import with
+    one write. Only a few batches of plaintext are in memory at a time.
+    """
+    def batches():
+        batch = []
+        for line, account, username, password in rows:
+            account = plan.accept(line, account, username, password)
+            if account is not None:
+                batch.append((account, username, password))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def check_cancelled():
+        if cancelled and cancelled():
+            raise ImportCancelled()
+
+    entries = {}
+    if sealer is None:
+        encrypt, key = _encrypt_batch, cipher
+    else:
+        encrypt, key = _seal_batch, sealer
+    # Spawning processes costs more than a small import takes, and a
+    # single batch has nothing to run in parallel with
+    pending = batches()
+    first = list(itertools.islice(pending, 2))
+    if len(first) < 2:
+        workers = 1
+    for encrypted in map_bounded(encrypt, itertools.chain(first, pending), key,
+                                 workers=workers, check_cancelled=check_cancelled):
+        entries.update(encrypted)
+        if on_progress:
+            on_progress(plan.stats['read'], None,
+                        f"{len(entries)} of {plan.stats['read']} rows ready")
+    return entries
@@ -0,0 +1,180 @@
+import base64
+import hashlib
+import hmac
+import math
+import os
+import time
+
+PBKDF2 = "pbkdf2-sha256"
+SCRYPT = "scrypt"
+ARGON2 = "argon2id"
+
+# Unlock latency the calibration aims for, in seconds
+DEFAULT_TARGET = 0.5
+
+# Calibration may make derivation slower than these, never faster
+MIN_PBKDF2_ITERATIONS = 100000
+MIN_SCRYPT_N = 2 ** 14
+MAX_SCRYPT_N = 2 ** 18  # 256 MiB with r=8
+ARGON2_MEMORY_KIB = 64 * 1024
+ARGON2_LANES = 4
+
+# What vaults created before the header existed were encrypted with
+LEGACY_PARAMS = {
+    'algorithm': PBKDF2,
+    'salt': base64.b64encode(b'salt_').decode(),
+    'iterations': 100000,
+}
+
+# MACed together with the vault id to check a key without any user data
+KEY_CHECK_CONSTANT = b"mini-password-manager key check v1"
+
+
+def available_algorithms():
+    algorithms = [PBKDF2, SCRYPT]
+    if _argon2id() is not None:
+        algorithms.append(ARGON2)
+    return algorithms
+
+
+def _argon2id():
+    # cryptography is imported on first use, it is most of startup time
+    try:
+        from cryptography.hazmat.primitives.kdf.argon2 import Argon2id
+    except ImportError:  # cryptography < 44
+        return None
+    return Argon2id
+
+
+def new_salt():
+    return base64.b64encode(os.urandom(16)).decode()
+
+
+def with_new_salt(params):
+    """Same algorithm and costs, fresh random salt"""
+    return dict(params, salt=new_salt())
+
+
+def derive_key(password, params):
+    """Fernet key for password under the KDF described by params"""
+    kdf = _make_kdf(params)
+    return base64.urlsafe_b64encode(kdf.derive(password.encode()))
+
+
+def new_vault_id():
+    return base64.b64encode(os.urandom(16)).decode()
+
+
+def key_check(key, vault_id):
+    """MAC over a constant and the vault id, keyed with the derived key
+
+    Stored in the header it proves a key is right without decrypting any
+    entry, and reveals nothing about the key itself.
+    """
+    mac = hmac.new(base64.urlsafe_b64decode(key),
+                   KEY_CHECK_CONSTANT + base64.b64decode(vault_id),
+                   hashlib.sha256)
+    return base64.b64encode(mac.digest()).decode()
+
+
+def verify_key(key, vault_id, check):
+    """Constant-time comparison of key's check value with the stored one"""
+    return hmac.compare_digest(key_check(key, vault_id).encode(),
+                               check.encode())
+
+
+def timed_derive_key(password, params):
+    """derive_key plus how long it took, in seconds"""
+    start = time.perf_counter()
+    key = derive_key(password, params)
+    return key, time.perf_counter() - start
+
+
+def calibrate(algorithm=PBKDF2, target=DEFAULT_TARGET):
+    """Benchmark this machine and pick costs so one derivation takes ~target
+
+    Returns new KDF params with a random salt.
+    """
+    if algorithm == PBKDF2:
+        probe = {'algorithm': PBKDF2, 'iterations': 20000}
+        elapsed = _probe(probe)
+        iterations = int(probe['iterations'] * target / elapsed)
+        params = {'algorithm': PBKDF2,
+                  'iterations': max(MIN_PBKDF2_ITERATIONS,
+                                    iterations // 1000 * 1000)}
+    elif algorithm == SCRYPT:
+        # Cost is linear in n, which must be a power of two
+        probe = {'algorithm': SCRYPT, 'n': MIN_SCRYPT_N, 'r': 8, 'p': 1}
+        elapsed = _probe(probe)
+        n = 2 ** int(math.log2(MIN_SCRYPT_N * target / elapsed))
+        params = dict(probe, n=min(MAX_SCRYPT_N, max(MIN_SCRYPT_N, n)))
+    elif algorithm == ARGON2:
+        if _argon2id() is None:
+            raise ValueError("Argon2id needs cryptography 44 or newer")
+        # Memory stays fixed, time cost scales with the machine
+        probe = {'algorithm': ARGON2, 'iterations': 1,
+                 'memory_cost': ARGON2_MEMORY_KIB, 'lanes': ARGON2_LANES}
+        elapsed = _probe(probe)
+        params = dict(probe, iterations=max(2, round(target / elapsed)))
+    else:
+        raise ValueError(f"Unknown KDF algorithm: {algorithm}")
+
+    params['salt'] = new_salt()
+    params['target'] = target
+    return params
+
+
+def needs_retune(params, elapsed, target=DEFAULT_TARGET, tolerance=2.0):
+    """Whether params should be re-calibrated after a derivation took elapsed
+
+    True for the legacy fixed salt, and when unlocking is more than
+    tolerance times faster or slower than the target on this machine.
+    """
+    if params.get('salt') == LEGACY_PARAMS['salt']:
+        return True
+    if elapsed > target * tolerance:
+        return True
+    # Already at the minimum cost, calibrating again would change nothing
+    if elapsed < target / tolerance:
+        return not _at_minimum(params)
+    return False
+
+
+def _at_minimum(params):
+    if params['algorithm'] == PBKDF2:
+        return params['iterations'] <= MIN_PBKDF2_ITERATIONS
+    if params['algorithm'] == SCRYPT:
+        return params['n'] <= MIN_SCRYPT_N
+    return params['iterations'] <= 2
+
+
+def _probe(params, rounds=3):
+    # Best of a few runs, the first one pays for warm-up
+    params = dict(params, salt=new_salt())
+    best = None
+    for _ in range(rounds):
+        _, elapsed = timed_derive_key("calibration", params)
+        best = elapsed if best is None else min(best, elapsed)
+    return max(best, 1e-6)
+
+
+def _make_kdf(params):
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+    salt = base64.b64decode(params['salt'])
+    algorithm = params['algorithm']
+    if algorithm == PBKDF2:
+        return PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt,
+                          iterations=params['iterations'])
+    if algorithm == SCRYPT:
+        return Scrypt(salt=salt, length=32, n=params['n'], r=params['r'],
+                      p=params['p'])
+    if algorithm == ARGON2:
+        Argon2id = _argon2id()
+        if Argon2id is None:
+            raise ValueError("Argon2id needs cryptography 44 or newer")
+        return Argon2id(salt=salt, length=32, iterations=params['iterations'],
+                        lanes=params['lanes'], memory_cost=params['memory_cost'])
+    raise ValueError(f"Unknown KDF algorithm: {algorithm}")
@@ -0,0 +1,128 @@
+import threading
+import time
+
+from storage.atomic import atomic_write_json
+
+# Bucket i of a histogram counts durations below 2 ** i microseconds, the
+# last one everything slower (2 ** 31 us is about 36 minutes)
+BUCKETS = 32
+
+
+class _NullSpan:
+    """What span() hands out while recording is off, it does nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Histogram:
+    """Count, total, max and log2-bucketed latencies of one kind of span"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[min(int(seconds * 1e6).bit_length(), BUCKETS - 1)] += 1
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding that fraction of the spans"""
+        wanted = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= wanted:
+                return min(2 ** i / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        return {'count': self.count, 'total': self.total,
+                'mean': self.total / self.count if self.count else 0.0,
+                'p50': self.percentile(0.5), 'p95': self.percentile(0.95),
+                'max': self.max,
+                # Trailing empty buckets carry no information
+                'buckets': self.buckets[:max(
+                    (i + 1 for i, count in enumerate(self.buckets) if count),
+                    default=0)]}
+
+
+class Metrics:
+    """Timing spans, counters and latency histograms for one session.
+
+    Off by default. While off, ``span`` returns a shared object whose
+    enter and exit do nothing and ``count`` returns straight away, so
+    instrumented hot paths cost one attribute check. Spans may end on
+    worker threads, recording takes a lock.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.started = time.time()
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def span(self, name):
+        """Context manager timing the block it wraps under name"""
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(seconds)
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.histograms.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        """Everything recorded so far as plain data, slowest total first"""
+        with self._lock:
+            spans = sorted(((name, histogram.summary())
+                            for name, histogram in self.histograms.items()),
+                           key=lambda item: item[1]['total'], reverse=True)
+            return {'started': self.started,
+                    'seconds': time.time() - self.started,
+                    'spans': dict(spans),
+                    'counters': dict(self.counters)}
+
+    def dump(self, path):
+        atomic_write_json(path, self.snapshot())
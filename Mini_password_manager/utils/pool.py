@@ -0,0 +1,51 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+def usable_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def spawn_pool(workers):
+    # Fork is unsafe in a process running Tk and other threads
+    return ProcessPoolExecutor(max_workers=workers,
+                               mp_context=multiprocessing.get_context("spawn"))
+
+
+def map_bounded(func, batches, *args, workers=None, check_cancelled=None):
+    """Yield func(*args, batch) for each batch, in order, from a process pool
+
+    At most two batches per worker are in flight, so memory stays bounded
+    however many batches the iterable produces. With one worker it all
+    runs in this process. check_cancelled() is called between batches and
+    may raise to stop.
+    """
+    workers = workers or usable_cpus()
+    if workers == 1:
+        for batch in batches:
+            if check_cancelled:
+                check_cancelled()
+            yield func(*args, batch)
+        return
+
+    with spawn_pool(workers) as pool:
+        pending = deque()
+        try:
+            for batch in batches:
+                if check_cancelled:
+                    check_cancelled()
+                pending.append(pool.submit(func, *args, batch))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                if check_cancelled:
+                    check_cancelled()
+                yield pending.popleft().result()
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import as_completed
+
+from cryptography.fernet import Fernet, MultiFernet
+
+from storage.atomic import fsync_directory
+from utils.pool import spawn_pool, usable_cpus
+
+
+class ReencryptionCancelled(Exception):
+    pass
+
+
+def _digest(token):
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+
+def _reencrypt_chunk(old_keys, new_key, chunk):
+    # Runs in a worker process, so it only gets picklable keys and pairs
+    cipher = MultiFernet([Fernet(new_key)] + [Fernet(key) for key in old_keys])
+    return [(item_id, _digest(token), cipher.rotate(token.encode()).decode())
+            for item_id, token in chunk]
+
+
+class Reencryptor:
+    """Re-encrypts many Fernet tokens under a new key on a process pool.
+
+    ``run`` splits the (id, token) pairs into chunks and spreads them over
+    worker processes. Every finished chunk is appended to the checkpoint
+    file and fsync'd, so a run that is interrupted resumes with only the
+    chunks that were not done yet. Nothing is written to the vault here:
+    ``run`` returns id -> new token and the caller commits them in one
+    atomic step, then calls ``discard_checkpoint``.
+
+    Checkpointed results only count for tokens that are still the same,
+    an entry edited since is simply done again.
+    """
+
+    def __init__(self, old_keys, new_key, checkpoint_file=None, meta=None,
+                 workers=None, chunk_size=2000):
+        self.old_keys = list(old_keys)
+        self.new_key = new_key
+        self.checkpoint_file = checkpoint_file
+        self.meta = meta or {}
+        self.workers = workers or usable_cpus()
+        self.chunk_size = chunk_size
+        self.entries = 0
+        self.resumed = 0
+        self.seconds = 0.0
+        self._valid_size = 0  # checkpoint bytes up to the last whole chunk
+
+    @staticmethod
+    def pending_meta(checkpoint_file):
+        """meta of an unfinished run, or None if there is nothing to resume"""
+        if not os.path.exists(checkpoint_file):
+            return None
+        with open(checkpoint_file) as f:
+            first = f.readline()
+        try:
+            return json.loads(first)['meta']
+        except (ValueError, KeyError):
+            return None
+
+    def run(self, items, on_progress=None, cancelled=None):
+        """Re-encrypt every (id, token) pair, returns {id: new token}
+
+        on_progress(done, total) is called from this thread after each
+        chunk. cancelled() is polled between chunks; when it returns True
+        the pool is stopped and ReencryptionCancelled raised, keeping the
+        checkpoint for the next run.
+        """
+        start = time.perf_counter()
+        items = list(items)
+        checkpointed = self._read_checkpoint()
+        results = {}
+        todo = []
+        for item_id, token in items:
+            done = checkpointed.get(item_id)
+            if done is not None and done[0] == _digest(token):
+                results[item_id] = done[1]
+            else:
+                todo.append((item_id, token))
+        self.resumed = len(results)
+        chunks = [todo[i:i + self.chunk_size]
+                  for i in range(0, len(todo), self.chunk_size)]
+
+        checkpoint = self._open_checkpoint(bool(checkpointed))
+        try:
+            for done_chunk in self._map(chunks, cancelled):
+                results.update((item_id, token)
+                               for item_id, _, token in done_chunk)
+                if checkpoint is not None:
+                    checkpoint.write(json.dumps(done_chunk) + "\n")
+                    checkpoint.flush()
+                    os.fsync(checkpoint.fileno())
+                if on_progress:
+                    on_progress(len(results), len(items))
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+
+        self.entries = len(todo)
+        self.seconds = time.perf_counter() - start
+        return results
+
+    def discard_checkpoint(self):
+        """Forget the checkpoint once the results are safely committed"""
+        if self.checkpoint_file and os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+            fsync_directory(os.path.dirname(os.path.abspath(self.checkpoint_file)))
+
+    def stats(self):
+        return {
+            'entries': self.entries,
+            'resumed': self.resumed,
+            'seconds': self.seconds,
+            'entries_per_sec': self.entries / self.seconds if self.seconds else 0.0,
+            'workers': self.workers,
+        }
+
+    def _map(self, chunks, cancelled):
+        # Spawning processes costs more than small jobs take
+        if self.workers == 1 or len(chunks) < 2:
+            for chunk in chunks:
+                if cancelled and cancelled():
+                    raise ReencryptionCancelled()
+                yield _reencrypt_chunk(self.old_keys, self.new_key, chunk)
+            return
+
+        with spawn_pool(min(self.workers, len(chunks))) as pool:
+            futures = [pool.submit(_reencrypt_chunk, self.old_keys,
+                                   self.new_key, chunk) for chunk in chunks]
+            try:
+                for future in as_completed(futures):
+                    if cancelled and cancelled():
+                        raise ReencryptionCancelled()
+                    yield future.result()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def _read_checkpoint(self):
+        results = {}
+        if not self.checkpoint_file or not os.path.exists(self.checkpoint_file):
+            return results
+        with open(self.checkpoint_file, 'rb') as f:
+            lines = f.readlines()
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            return results
+        # A checkpoint for another key would resume with the wrong tokens
+        if header.get('meta') != self.meta:
+            return results
+        size = len(lines[0])
+        for line in lines[1:]:
+            try:
+                chunk = json.loads(line)
+            except ValueError:
+                break  # torn last chunk, it is simply redone
+            if not line.endswith(b"\n"):
+                break
+            results.update((item_id, (digest, token))
+                           for item_id, digest, token in chunk)
+            size += len(line)
+        self._valid_size = size
+        return results
+
+    def _open_checkpoint(self, resuming):
+        if not self.checkpoint_file:
+            return None
+        if resuming:
+            f = open(self.checkpoint_file, 'a')
+            f.truncate(self._valid_size)
+            return f
+        # Only the owner may read it, it can hold tokens and the caller's meta
+        fd = os.open(self.checkpoint_file,
+                     os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        f = os.fdopen(fd, 'w')
+        f.write(json.dumps({'meta': self.meta}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+        return f
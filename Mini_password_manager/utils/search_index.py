@@ -0,0 +1,251 @@
+import heapq
+from collections import Counter, defaultdict
+
+from utils.fuzzy import (BOUNDARY, EXACT, exact_score, max_typos, score_entry,
+                         subsequence_pattern, subsequence_score, top_k,
+                         typo_score)
+
+SEPARATOR = "\0"
+# Field bonuses of exact_score() and score_entry()
+PREFIX_BONUS = 100
+BOUNDARY_BONUS = 50
+ACCOUNT_BONUS = 20
+
+
+def trigrams(text):
+    """Distinct three-character substrings, never spanning a field boundary"""
+    grams = set()
+    for part in text.split(SEPARATOR):
+        for i in range(len(part) - 2):
+            grams.add(part[i:i + 3])
+    return grams
+
+
+class SearchIndex:
+    """Trigram inverted index over account and username.
+
+    A substring query of three or more characters intersects the posting
+    lists of its trigrams, smallest first, and only verifies the few
+    candidates that survive. Shorter queries would match most of the vault
+    anyway, so they scan the precomputed lowercase keys instead. Results
+    come back in the order entries were first added, like the vault dict.
+
+    Given a passwords dict, the index is built from it on first use so a
+    large vault does not pay for it at startup. Until then ``add`` and
+    ``remove`` are no-ops, the dict already holds the change.
+
+    Ranking scores only as many substring matches as it takes to be sure
+    of the top k, and looks for fuzzy matches among the entries sharing
+    the most trigrams with the query.
+    """
+
+    def __init__(self, passwords=None):
+        self._ids = {}  # account -> entry id, ids grow with insertion order
+        self._keys = {}  # entry id -> account
+        self._texts = {}  # entry id -> "account\0username", lowercased
+        self._postings = defaultdict(set)
+        self._next_id = 0
+        self._pending = passwords
+
+    @property
+    def ready(self):
+        """Whether the index is built, searching will not build it first"""
+        return self._pending is None
+
+    def build(self, passwords):
+        self.clear()
+        for account, data in passwords.items():
+            self.add(account, data['username'])
+
+    def add(self, account, username):
+        """Index a new entry, or re-index an edited one in place"""
+        if self._pending is not None:
+            return
+        text = account.lower() + SEPARATOR + username.lower()
+        entry_id = self._ids.get(account)
+        if entry_id is None:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._ids[account] = entry_id
+            self._keys[entry_id] = account
+            old_grams = set()
+        elif self._texts[entry_id] == text:
+            return
+        else:
+            old_grams = trigrams(self._texts[entry_id])
+
+        new_grams = trigrams(text)
+        self._unpost(entry_id, old_grams - new_grams)
+        for gram in new_grams - old_grams:
+            self._postings[gram].add(entry_id)
+        self._texts[entry_id] = text
+
+    def remove(self, account):
+        if self._pending is not None:
+            return
+        entry_id = self._ids.pop(account, None)
+        if entry_id is None:
+            return
+        del self._keys[entry_id]
+        self._unpost(entry_id, trigrams(self._texts.pop(entry_id)))
+
+    def clear(self):
+        self._pending = None
+        self._ids.clear()
+        self._keys.clear()
+        self._texts.clear()
+        self._postings.clear()
+
+    def search(self, term):
+        """Accounts whose account or username contains term, case-insensitive"""
+        self._build_pending()
+        term = term.lower()
+        if not term:
+            return list(self._ids)
+        return [self._keys[entry_id] for entry_id in self._substring_ids(term)]
+
+    def rank(self, term, limit=100):
+        """Best limit accounts for a fuzzy query, most relevant first
+
+        Substring matches rank above subsequence matches ("gthub"), which
+        rank above matches that need a typo corrected ("githbu"). An empty
+        query returns every account in vault order.
+        """
+        self._build_pending()
+        term = term.lower()
+        if not term:
+            return list(self._ids)
+
+        # Each kind of match outranks the next, so a stage only runs when
+        # the ones before it could not fill the top k on their own
+        scored = self._top_exact(term, self._candidates(term), limit)
+        grams = trigrams(term)
+        if len(scored) >= limit or not grams:
+            return top_k(scored, limit)
+        # Fewer than limit, so these are all the substring matches
+        matches = {entry_id for _, entry_id, _ in scored}
+
+        # Fuzzy matches are only looked for among the entries sharing the
+        # most trigrams with the query. Shorter queries have none, their
+        # substring matches have to do.
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+        candidates = [entry_id for entry_id, _
+                      in shared.most_common(limit * 100 + len(matches))
+                      if entry_id not in matches]
+
+        pattern = subsequence_pattern(term)
+        found = set()
+        for entry_id in candidates:
+            if pattern.search(self._texts[entry_id]):
+                found.add(entry_id)
+                if len(found) == limit * 10:
+                    break
+        scored += self._score(subsequence_score, term, found)
+
+        if len(scored) < limit:
+            # q-gram lemma: a match within k typos keeps most trigrams.
+            # Edit distance is costly, only check the most promising few
+            needed = max(1, len(grams) - 3 * max_typos(term))
+            typo_candidates = [entry_id for entry_id in candidates[:limit * 10]
+                               if shared[entry_id] >= needed
+                               and entry_id not in found]
+            scored += self._score(typo_score, term, typo_candidates)
+
+        return top_k(scored, limit)
+
+    def _top_exact(self, term, entry_ids, limit):
+        """Scored best limit substring matches among entry_ids
+
+        Like exact_score(), an entry's tier in a field is where the term is
+        first found there: at the start, after a word boundary or inside.
+        Within a tier the score only depends on the field length, so each
+        tier's best are taken by (length, id), best tier first, until no
+        entry of the remaining tiers can beat the top k.
+        """
+        if len(entry_ids) <= limit * 4:
+            return self._score(exact_score, term, entry_ids)
+
+        texts = self._texts
+        # Best tier first: account start, username start, account word,
+        # username word, inside account, inside username
+        tiers = ([], [], [], [], [], [])
+        for entry_id in entry_ids:
+            text = texts[entry_id]
+            index = text.find(term)
+            if index == -1:
+                continue
+            separator = text.find(SEPARATOR)
+            if index < separator:
+                tier = 0 if index == 0 else 2 if text[index - 1] in BOUNDARY else 4
+                tiers[tier].append((separator, entry_id))
+                index = text.find(term, separator + 1)
+                if index == -1:
+                    continue
+            tier = 1 if index == separator + 1 else 3 if text[index - 1] in BOUNDARY else 5
+            tiers[tier].append((len(text) - separator - 1, entry_id))
+
+        shortest = len(term)
+        bounds = (EXACT + PREFIX_BONUS + ACCOUNT_BONUS - shortest,
+                  EXACT + PREFIX_BONUS - shortest,
+                  EXACT + BOUNDARY_BONUS + ACCOUNT_BONUS - shortest - 1,
+                  EXACT + BOUNDARY_BONUS - shortest - 1,
+                  EXACT + ACCOUNT_BONUS - shortest - 1,
+                  EXACT - shortest - 1)
+        best = {}
+        for tier, bound in zip(tiers, bounds):
+            if len(best) >= limit:
+                kth = heapq.nlargest(limit, best.values())[-1][0]
+                # Ties go to the earlier entry, only stop on a strict win
+                if kth > bound:
+                    break
+            for _, entry_id in heapq.nsmallest(limit, tier):
+                if entry_id not in best:
+                    account, _, username = texts[entry_id].partition(SEPARATOR)
+                    score = score_entry(exact_score, term, account, username)
+                    best[entry_id] = (score, -entry_id)
+        return [(score, entry_id, self._keys[entry_id])
+                for entry_id, (score, _) in best.items()]
+
+    def _score(self, scorer, term, entry_ids):
+        scored = []
+        for entry_id in entry_ids:
+            account, _, username = self._texts[entry_id].partition(SEPARATOR)
+            score = score_entry(scorer, term, account, username)
+            if score is not None:
+                scored.append((score, entry_id, self._keys[entry_id]))
+        return scored
+
+    def __len__(self):
+        self._build_pending()
+        return len(self._ids)
+
+    def _substring_ids(self, term):
+        """Ids of entries containing the lowercase term, in insertion order"""
+        texts = self._texts
+        return sorted(entry_id for entry_id in self._candidates(term)
+                      if term in texts[entry_id])
+
+    def _candidates(self, term):
+        """Set of ids of entries that may contain the lowercase term"""
+        if len(term) < 3:
+            return {entry_id for entry_id, text in self._texts.items()
+                    if term in text}
+
+        postings = sorted((self._postings.get(gram, ())
+                           for gram in trigrams(term)), key=len)
+        if not postings[0]:
+            return set()
+        return set(postings[0]).intersection(*postings[1:])
+
+    def _build_pending(self):
+        if self._pending is not None:
+            self.build(self._pending)
+
+    def _unpost(self, entry_id, grams):
+        for gram in grams:
+            posting = self._postings[gram]
+            posting.discard(entry_id)
+            if not posting:
+                del self._postings[gram]
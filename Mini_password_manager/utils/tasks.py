@@ -0,0 +1,156 @@
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class Task:
+    """Handle for one unit of background work.
+
+    The work function receives the task as its first argument and may call
+    ``report`` for progress and ``check_cancelled`` between steps.
+    """
+
+    def __init__(self, runner, work, args, resources, on_done, on_error,
+                 on_progress, on_finish):
+        self.runner = runner
+        self.work = work
+        self.args = args
+        self.resources = resources
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.on_finish = on_finish
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def check_cancelled(self):
+        if self._cancelled.is_set():
+            raise TaskCancelled()
+
+    def report(self, done, total=None, message=None):
+        """Progress update, safe to call from the worker thread"""
+        if self.on_progress:
+            self.runner.call_soon(self.on_progress, done, total, message)
+
+
+class TaskRunner:
+    """Runs slow work on a thread pool and hands results back to the Tk thread.
+
+    Workers never touch Tk. Their results, errors and progress reports go
+    through a queue that the Tk thread drains with ``root.after``, so every
+    callback runs on the event loop. Tasks that name a common resource run
+    one after another in submission order, callbacks included, so for
+    example a save can never land in the middle of a re-key.
+    """
+
+    def __init__(self, root, max_workers=2, poll_interval=30):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="vault-task")
+        self._events = queue.SimpleQueue()
+        self._busy = set()
+        self._waiting = []
+        self._running = set()
+        self._poll_id = self.root.after(self.poll_interval, self._poll)
+
+    def submit(self, work, *args, resources=(), on_done=None, on_error=None,
+               on_progress=None, on_finish=None):
+        """Queue work(task, *args); callbacks run on the Tk thread
+
+        on_done gets the result, on_error the exception, on_progress gets
+        (done, total, message) and on_finish always runs last, also after
+        a cancellation.
+        """
+        task = Task(self, work, args, frozenset(resources), on_done, on_error,
+                    on_progress, on_finish)
+        self._waiting.append(task)
+        self._start_ready()
+        return task
+
+    def busy(self, resource):
+        """Whether a running or queued task holds resource"""
+        return any(resource in task.resources
+                   for task in (*self._running, *self._waiting))
+
+    def call_soon(self, callback, *args):
+        """Run callback(*args) on the Tk thread, callable from any thread"""
+        self._events.put((callback, args))
+
+    def shutdown(self):
+        """Cancel everything and wait for running work to stop"""
+        for task in (*self._running, *self._waiting):
+            task.cancel()
+        self._waiting.clear()
+        self.root.after_cancel(self._poll_id)
+        self.executor.shutdown(wait=True)
+
+    def _start_ready(self):
+        # A task may not overtake an earlier one that shares a resource
+        blocked = set(self._busy)
+        for task in list(self._waiting):
+            if task.resources & blocked:
+                blocked |= task.resources
+                continue
+            self._waiting.remove(task)
+            self._busy |= task.resources
+            blocked |= task.resources
+            self._running.add(task)
+            self.executor.submit(self._run, task)
+
+    def _run(self, task):
+        # Worker thread
+        try:
+            task.check_cancelled()
+            result = task.work(task, *task.args)
+        except TaskCancelled:
+            self.call_soon(self._finish, task, None, None)
+        except Exception as e:
+            self.call_soon(self._finish, task, None, e)
+        else:
+            self.call_soon(self._finish, task, result, None)
+
+    def _finish(self, task, result, error):
+        # Resources stay held until the callbacks are done
+        try:
+            if task.cancelled:
+                pass
+            elif error is not None:
+                if task.on_error:
+                    task.on_error(error)
+                else:
+                    self.root.report_callback_exception(
+                        type(error), error, error.__traceback__)
+            elif task.on_done:
+                task.on_done(result)
+        finally:
+            try:
+                if task.on_finish:
+                    task.on_finish()
+            finally:
+                self._running.discard(task)
+                self._busy -= task.resources
+                self._start_ready()
+
+    def _poll(self):
+        while True:
+            try:
+                callback, args = self._events.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback(*args)
+            except Exception:
+                self.root.report_callback_exception(*sys.exc_info())
+        self._poll_id = self.root.after(self.poll_interval, self._poll)